@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.production.models import Product, Production, ProductionDetail
+from apps.production.tests import make_catalog
+
+
+class ApiTests(TestCase):
+
+    def setUp(self):
+        make_catalog(products=5, items_per_product=2)
+        production = Production.objects.create()
+        for product in Product.objects.all():
+            ProductionDetail.objects.create(production=production, product=product, produced_units=2)
+        self.client.force_login(User.objects.create_user('scanner', password='secret-pass'))
+
+    def test_requires_authentication(self):
+        self.client.logout()
+        response = self.client.get(reverse('api-items'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get(reverse('api-items'), {'fields': 'slug,price'})
+        self.assertEqual(response.json()['results'][0], {'slug': 'item-0', 'price': '1.00'})
+        response = self.client.get(reverse('api-items'), {'fields': 'slug,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_products_with_components_in_constant_queries(self):
+        # user, products, components; the session is cached
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('api-products'), {'fields': 'slug,components'})
+        results = response.json()['results']
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(results[0]['components']), 2)
+
+    def test_cursor_pagination(self):
+        slugs = []
+        params = {'fields': 'slug', 'limit': 2}
+        while True:
+            body = self.client.get(reverse('api-products'), params).json()
+            slugs.extend(result['slug'] for result in body['results'])
+            if not body['next']:
+                break
+            params['cursor'] = body['next']
+        self.assertEqual(sorted(slugs), [f'product-{n}' for n in range(5)])
+
+    def test_etag_answers_not_modified(self):
+        response = self.client.get(reverse('api-productions'))
+        self.assertEqual(len(response.json()['results'][0]['details']), 5)
+        etag = response['ETag']
+        # Validated from the version counters alone; the session and the user are cached
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api-productions'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        detail = ProductionDetail.objects.first()
+        detail.produced_units = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            detail.save()
+        response = self.client.get(reverse('api-productions'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('api-productions'), {'limit': 1}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get(reverse('api-production-details'), {'production': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid production'})
+
+    def test_detail_and_filters(self):
+        response = self.client.get(reverse('api-product', args=['product-3']))
+        self.assertEqual(response.json()['slug'], 'product-3')
+        response = self.client.get(reverse('api-product', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('api-production-details'), {'product': 'product-1'})
+        self.assertEqual([row['product'] for row in response.json()['results']], ['product-1'])
@@ -0,0 +1,14 @@
+"""API App URLs"""
+from django.urls import path
+from . import views
+
+
+urlpatterns = [
+    path('items', views.resource_list, {'resource': 'items'}, name='api-items'),
+    path('items/<slug:slug>', views.resource_detail, {'resource': 'items'}, name='api-item'),
+    path('products', views.resource_list, {'resource': 'products'}, name='api-products'),
+    path('products/<slug:slug>', views.resource_detail, {'resource': 'products'}, name='api-product'),
+    path('productions', views.resource_list, {'resource': 'productions'}, name='api-productions'),
+    path('production-details', views.resource_list, {'resource': 'production-details'},
+         name='api-production-details'),
+]
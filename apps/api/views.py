@@ -0,0 +1,274 @@
+"""API app views
+
+Read-only JSON endpoints serialized straight from `values()` rows, without
+building model instances. Every list supports:
+
+- `fields`: comma separated subset of the resource fields (sparse fieldsets).
+- `cursor` and `limit`: keyset pagination, newest first.
+- `If-None-Match` and `If-Modified-Since`: a 304 response when the models
+  the resource reads are unchanged.
+
+The validators are built from the version counters of those models (see
+`apps.production.fragments`) before anything is queried, so a 304 costs a
+cache read. Single items and products are read through the catalog cache.
+"""
+import functools
+import json
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.db.models.fields.files import FieldFile
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+
+from apps.production import catalog_cache
+from apps.production.fragments import etag, get_versions
+from apps.production.models import Component, Item, Product, Production, ProductionDetail
+from apps.production.pagination import keyset_paginate
+from core.routers import use_replica
+
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class Resource:
+    """
+    Describes how a model is exposed by the API.
+
+    Attributes:
+    - queryset: QuerySet, the rows of the resource.
+    - fields: dict, maps API field names to the ORM lookups read with `values()`.
+    - models: tuple, the names of the models read, whose version counters validate responses.
+    - nested: dict, maps API field names to functions loading related rows for a page.
+    - filters: dict, maps query parameters to ORM lookups.
+    - catalog: str, the catalog cache kind single rows are read through, if any.
+    - cached_nested: dict, maps API field names to functions reading related rows from a cached instance.
+    """
+
+    def __init__(self, queryset, fields, models, nested=None, filters=None, catalog=None,
+                 cached_nested=None):
+        self.queryset = queryset
+        self.fields = fields
+        self.models = models
+        self.nested = nested or {}
+        self.filters = filters or {}
+        self.catalog = catalog
+        self.cached_nested = cached_nested or {}
+
+    @property
+    def field_names(self):
+        return list(self.fields) + list(self.nested)
+
+
+def load_components(product_ids):
+    """Load the components of a page of products with one query."""
+    components = defaultdict(list)
+    rows = (Component.objects
+            .filter(product__in=product_ids)
+            .values_list('product_id', 'item__slug', 'amount'))
+    for product_id, item, amount in rows:
+        components[product_id].append({'item': item, 'amount': amount})
+    return components
+
+
+def load_details(production_ids):
+    """Load the details of a page of productions with one query."""
+    details = defaultdict(list)
+    rows = (ProductionDetail.objects
+            .filter(production__in=production_ids)
+            .values_list('production_id', 'product__slug', 'produced_units', 'production_cost'))
+    for production_id, product, produced_units, production_cost in rows:
+        details[production_id].append({
+            'product': product,
+            'produced_units': produced_units,
+            'production_cost': production_cost,
+        })
+    return details
+
+
+def cached_components(product):
+    """Read the components of a product from its prefetched rows."""
+    return [{'item': component.item.slug, 'amount': component.amount}
+            for component in product.component_set.all()]
+
+
+def instance_value(instance, lookup):
+    """Read a field lookup from a cached instance, following a relation through the catalog cache."""
+    if '__' in lookup:
+        relation, field = lookup.split('__')
+        related = catalog_cache.get_cached(relation, pk=getattr(instance, f'{relation}_id'))
+        return getattr(related, field) if related is not None else None
+    value = getattr(instance, lookup)
+    return value.name if isinstance(value, FieldFile) else value
+
+
+RESOURCES = {
+    'items': Resource(
+        Item.objects.all(),
+        fields={
+            'uid': 'uid', 'name': 'name', 'slug': 'slug', 'description': 'description',
+            'price': 'price', 'amount': 'amount', 'measurement_unit': 'measurement_unit',
+            'category': 'category__slug', 'thumbnail': 'thumbnail', 'added': 'added',
+        },
+        models=('item', 'category'),
+        filters={'category': 'category__slug'},
+        catalog='item',
+    ),
+    'products': Resource(
+        Product.objects.all(),
+        fields={
+            'uid': 'uid', 'name': 'name', 'slug': 'slug', 'description': 'description',
+            'price': 'price', 'units': 'units', 'product_cost': 'product_cost',
+            'category': 'category__slug', 'thumbnail': 'thumbnail', 'added': 'added',
+        },
+        models=('product', 'component', 'item', 'category'),
+        nested={'components': load_components},
+        filters={'category': 'category__slug'},
+        catalog='product',
+        cached_nested={'components': cached_components},
+    ),
+    'productions': Resource(
+        Production.objects.all(),
+        fields={'uid': 'uid', 'production_cost': 'production_cost', 'added': 'added'},
+        models=('production', 'productiondetail', 'product'),
+        nested={'details': load_details},
+    ),
+    'production-details': Resource(
+        # Details are paginated by the date of their production
+        ProductionDetail.objects.annotate(added=F('production__added')),
+        fields={
+            'uid': 'uid', 'production': 'production_id', 'product': 'product__slug',
+            'produced_units': 'produced_units', 'production_cost': 'production_cost',
+            'added': 'added',
+        },
+        models=('productiondetail', 'production', 'product'),
+        filters={'production': 'production_id', 'product': 'product__slug'},
+    ),
+}
+
+
+def error(status, message):
+    """Return a JSON error response."""
+    return JsonResponse({'error': message}, status=status)
+
+
+def api_view(view):
+    """Require an authenticated user and GET requests, answering with JSON errors."""
+
+    @functools.wraps(view)
+    @require_GET
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return error(401, 'Authentication required')
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def validators(resource, *variants):
+    """Build the ETag and Last-Modified of a response from the versions of the models it reads.
+
+    Args:
+        resource (str): The name of the resource.
+        *variants: Anything else the response depends on, e.g. the query string.
+
+    Returns:
+        tuple: The ETag and the last modification timestamp.
+    """
+
+    versions = get_versions(RESOURCES[resource].models)
+    return (etag(resource, *variants, *(version for version, _ in versions.values())),
+            max(changed for _, changed in versions.values()))
+
+
+def with_validators(response, tag, last_modified):
+    """Set the validators of a response."""
+    response['ETag'] = tag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Vary'] = 'Cookie'
+    return response
+
+
+def not_modified(request, tag, last_modified):
+    """Return a 304 response if the client already has this version, else None."""
+    response = get_conditional_response(request, etag=tag, last_modified=int(last_modified))
+    return response and with_validators(response, tag, last_modified)
+
+
+def json_response(data, tag, last_modified):
+    """Serialize data with its validators."""
+    content = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    return with_validators(HttpResponse(content, content_type='application/json'), tag, last_modified)
+
+
+@api_view
+@use_replica()
+def resource_list(request, resource):
+    """List a resource, newest first."""
+
+    spec = RESOURCES[resource]
+    requested = request.GET.get('fields')
+    fields = requested.split(',') if requested else spec.field_names
+    unknown = sorted(set(fields) - set(spec.field_names))
+    if unknown:
+        return error(400, f'Unknown fields: {", ".join(unknown)}')
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        return error(400, 'limit must be an integer')
+    if limit <= 0:
+        return error(400, 'limit must be positive')
+
+    queryset = spec.queryset
+    for parameter, lookup in spec.filters.items():
+        if parameter in request.GET:
+            try:
+                queryset = queryset.filter(**{lookup: request.GET[parameter]})
+            except (ValidationError, ValueError):
+                return error(400, f'Invalid {parameter}')
+
+    tag, last_modified = validators(resource, sorted(request.GET.lists()))
+    response = not_modified(request, tag, last_modified)
+    if response is not None:
+        return response
+
+    # uid and added are always read, they position the cursor and nested rows
+    columns = {name: spec.fields[name] for name in fields if name in spec.fields}
+    lookups = set(columns.values()) | {'uid', 'added'}
+    page = keyset_paginate(queryset.values(*lookups), request.GET.get('cursor'), limit)
+
+    nested = {name: loader([row['uid'] for row in page])
+              for name, loader in spec.nested.items() if name in fields}
+    results = []
+    for row in page:
+        result = {name: row[lookup] for name, lookup in columns.items()}
+        for name, related in nested.items():
+            result[name] = related.get(row['uid'], [])
+        results.append(result)
+
+    return json_response({'results': results, 'next': page.next_cursor}, tag, last_modified)
+
+
+@api_view
+@use_replica()
+def resource_detail(request, resource, slug):
+    """Return a single item or product by slug."""
+
+    spec = RESOURCES[resource]
+    tag, last_modified = validators(resource, slug)
+    response = not_modified(request, tag, last_modified)
+    if response is not None:
+        return response
+
+    instance = catalog_cache.get_cached(spec.catalog, slug=slug)
+    if instance is None:
+        return error(404, 'Not found')
+    result = {name: instance_value(instance, lookup) for name, lookup in spec.fields.items()}
+    for name, reader in spec.cached_nested.items():
+        result[name] = reader(instance)
+    return json_response(result, tag, last_modified)
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('category', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='thumbnail_sizes',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
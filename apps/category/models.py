@@ -5,6 +5,8 @@ from django.db import models
 from django.utils import timezone
 from django.contrib import admin
 
+from core.thumbnails import thumbnail_url
+
 
 def category_directory_path(instance, filename):
     """Generate the file path for a Category's thumbnail.
@@ -27,6 +29,7 @@ class Category(models.Model):
     - name: CharField, the name of the category.
     - slug: SlugField, a unique slug for the category.
     - thumbnail: ImageField, an image representing the category.
+    - thumbnail_sizes: JSONField, the derivative sizes generated from the thumbnail, see `core.thumbnails`.
     - added: DateTimeField, timestamp of when the category was added.
     """
 
@@ -37,17 +40,38 @@ class Category(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True)
     thumbnail = models.ImageField(upload_to=category_directory_path)
+    thumbnail_sizes = models.JSONField(default=list, blank=True, editable=False)
     added = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         """String representation of the Category."""
         return self.name
 
-    def get_thumbnail(self):
-        """Returns the URL of the category's thumbnail or an empty string if no thumbnail is available."""
-        if self.thumbnail:
-            return self.thumbnail.url
-        return ''
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded thumbnail so saves can tell whether it changed."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_thumbnail = instance.__dict__.get('thumbnail')
+        return instance
+
+    def thumbnail_changed(self):
+        """
+        Checks if the thumbnail differs from the one loaded from the database.
+
+        Returns:
+            bool: True for new categories or categories whose thumbnail was replaced, False otherwise.
+        """
+        return not hasattr(self, '_loaded_thumbnail') or self._loaded_thumbnail != self.thumbnail.name
+
+    def get_thumbnail(self, size=None):
+        """
+        Returns the URL of the category's thumbnail or an empty string if no thumbnail is available.
+
+        Args:
+            size (str): A derivative size from THUMBNAIL_SIZES ('small', 'medium', 'large'),
+                or None for the original upload.
+        """
+        return thumbnail_url(self.thumbnail, size, self.thumbnail_sizes)
 
     @admin.display(
         boolean=True,
@@ -0,0 +1,27 @@
+"""
+Jobs app admin
+"""
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import *
+
+
+class JobAdmin(admin.ModelAdmin):
+
+    list_display = ('id', 'task', 'status', 'priority', 'attempts', 'max_attempts',
+                    'run_at', 'duration', 'worker', 'added', 'finished')
+    list_filter = ('status', 'task')
+    readonly_fields = ('worker', 'attempts', 'last_error', 'duration', 'added', 'started', 'finished')
+    ordering = ('-id',)
+    actions = ['retry_jobs']
+
+    @admin.action(description='Queue the selected jobs again now')
+    def retry_jobs(self, request, queryset):
+        retried = (queryset
+                   .exclude(status=Job.RUNNING)
+                   .update(status=Job.QUEUED, attempts=0, run_at=timezone.now(), finished=None))
+        self.message_user(request, f'{retried} jobs queued again.')
+
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,57 @@
+"""Run the background job workers"""
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.jobs.worker import Worker, job_stats
+
+
+def serve(options):
+    """Run a worker in the current process until SIGTERM or SIGINT."""
+    worker = Worker(threads=options['threads'], tasks=options['tasks'],
+                    poll_interval=options['poll_interval'], burst=options['burst'])
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: worker.stop())
+    worker.run()
+    return worker
+
+
+class Command(BaseCommand):
+    help = ('Claim and run queued jobs with a pool of processes, each running several '
+            'threads. SIGTERM or SIGINT lets running jobs finish before exiting.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes; use several for CPU bound tasks.')
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Jobs run concurrently by each process.')
+        parser.add_argument('--tasks', nargs='+', default=[],
+                            help='Only run jobs of these tasks, e.g. to dedicate workers.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds an idle thread waits before polling the queue again.')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no job is due instead of waiting for more.')
+
+    def handle(self, *args, **options):
+        if options['processes'] == 1:
+            worker = serve(options)
+            self.stdout.write(self.style.SUCCESS(f'Processed {worker.processed or "no jobs"}'))
+        else:
+            # Forked children must open their own database connections
+            connections.close_all()
+            pool = [multiprocessing.Process(target=serve, args=(options,), name=f'jobs-process-{n}')
+                    for n in range(options['processes'])]
+            for process in pool:
+                process.start()
+            # Children receive the terminal's SIGINT themselves; forward SIGTERM
+            signal.signal(signal.SIGTERM, lambda *args: [process.terminate() for process in pool])
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            for process in pool:
+                process.join()
+
+        for task, stats in job_stats().items():
+            self.stdout.write(
+                f'{task}: {stats["per_minute"]} jobs/min over the last 5 minutes, '
+                f'{stats["done"]} done, {stats["failed"]} failed, {stats["queued"]} queued')
@@ -0,0 +1,63 @@
+"""Jobs app models"""
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    Represents a task queued for the background workers.
+
+    Attributes:
+    - task: CharField, the registered name of the task to run.
+    - args: JSONField, the positional arguments of the task.
+    - kwargs: JSONField, the keyword arguments of the task.
+    - status: CharField, 'queued', 'running', 'done' or 'failed'.
+    - priority: SmallIntegerField, jobs with a higher priority are claimed first.
+    - attempts: PositiveSmallIntegerField, the number of times the job was claimed.
+    - max_attempts: PositiveSmallIntegerField, the attempts before the job is marked failed.
+    - run_at: DateTimeField, the job is not claimed before this time.
+    - worker: CharField, the worker thread that claimed the job last.
+    - last_error: TextField, the traceback of the last failed attempt.
+    - duration: FloatField, the seconds the last attempt ran for.
+    - added: DateTimeField, timestamp of when the job was queued.
+    - started: DateTimeField, timestamp of when the last attempt started.
+    - finished: DateTimeField, timestamp of when the job succeeded or failed for good.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    class Meta:
+        indexes = [
+            # Workers claim from the queued jobs only, so the index stays small
+            models.Index(fields=['-priority', 'run_at', 'id'], name='job_claim_idx',
+                         condition=models.Q(status='queued')),
+            models.Index(fields=['task', 'status', 'finished'], name='job_task_status_idx'),
+        ]
+
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    duration = models.FloatField(blank=True, null=True)
+    added = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        """String representation of the Job."""
+        return f'{self.task}#{self.pk}'
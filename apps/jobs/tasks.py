@@ -0,0 +1,96 @@
+"""Jobs app task registry
+
+A task is a function registered under a name with the `task` decorator, in
+the `tasks` module of an app. Calling `enqueue` inserts a `Job` row in the
+current transaction, so the job only becomes visible to the workers if the
+transaction commits, and its arguments must be JSON serializable.
+"""
+import datetime
+
+from django.utils import timezone
+
+from .models import Job
+
+
+TASKS = {}
+
+
+class Task:
+    """
+    A function that can be run by the background workers.
+
+    Attributes:
+    - name: str, the name jobs refer to the task by.
+    - function: callable, the code run for each job.
+    - max_attempts: int, the attempts before a job is marked failed.
+    - retry_delay: float, the seconds before the first retry, doubled for each later one.
+    - priority: int, jobs with a higher priority are claimed first.
+    - unique: bool, whether a job is skipped when the same one is already queued.
+    """
+
+    def __init__(self, function, name, max_attempts=3, retry_delay=10, priority=0, unique=False):
+        self.function = function
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.priority = priority
+        self.unique = unique
+
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        """Queue a job running the task with these arguments."""
+        return enqueue(self.name, args, kwargs)
+
+
+def task(name, **options):
+    """Register a function as a task.
+
+    Args:
+        name (str): The name jobs refer to the task by, e.g. 'production.recompute_costs'.
+        **options: The other `Task` attributes.
+
+    Returns:
+        function: A decorator returning the `Task`.
+    """
+
+    def register(function):
+        TASKS[name] = Task(function, name, **options)
+        return TASKS[name]
+
+    return register
+
+
+def enqueue(name, args=(), kwargs=None, delay=0, priority=None):
+    """Queue a job.
+
+    Args:
+        name (str): The name of a registered task.
+        args (iterable): The positional arguments of the task.
+        kwargs (dict): The keyword arguments of the task.
+        delay (float): The seconds to wait before the job can be claimed.
+        priority (int): Overrides the priority of the task.
+
+    Returns:
+        Job: The queued job, or the job already queued for a unique task.
+
+    Raises:
+        LookupError: If no task is registered under that name.
+    """
+
+    task = TASKS.get(name)
+    if task is None:
+        raise LookupError(f'Unknown task: {name}')
+    args, kwargs = list(args), kwargs or {}
+
+    if task.unique:
+        queued = Job.objects.filter(task=name, args=args, kwargs=kwargs, status=Job.QUEUED).first()
+        if queued is not None:
+            return queued
+
+    return Job.objects.create(
+        task=name, args=args, kwargs=kwargs,
+        priority=task.priority if priority is None else priority,
+        max_attempts=task.max_attempts,
+        run_at=timezone.now() + datetime.timedelta(seconds=delay))
@@ -0,0 +1,132 @@
+import datetime
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Job
+from .tasks import TASKS, enqueue, task
+from .worker import claim_job, job_stats, requeue_abandoned, run_job
+
+
+calls = []
+
+
+@task('tests.record', unique=True)
+def record(value):
+    calls.append(value)
+
+
+@task('tests.flaky', max_attempts=2, retry_delay=60)
+def flaky():
+    raise RuntimeError('supplier feed unavailable')
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_unique_tasks_are_queued_once(self):
+        first = record.enqueue(1)
+        self.assertEqual(record.enqueue(1), first)
+        self.assertNotEqual(record.enqueue(2), first)
+        with self.assertRaises(LookupError):
+            enqueue('tests.nothing')
+
+    def test_jobs_are_claimed_by_priority_when_due(self):
+        later = enqueue('tests.record', [1], delay=60)
+        low = enqueue('tests.record', [2])
+        high = enqueue('tests.record', [3], priority=5)
+
+        job = claim_job('worker')
+        self.assertEqual(job, high)
+        self.assertEqual((job.status, job.attempts, job.worker), (Job.RUNNING, 1, 'worker'))
+        self.assertEqual(claim_job('worker'), low)
+        self.assertIsNone(claim_job('worker'))
+        self.assertIsNone(claim_job('worker', tasks=['tests.flaky']))
+        self.assertEqual(Job.objects.get(pk=later.pk).status, Job.QUEUED)
+
+    def test_successful_job(self):
+        enqueue('tests.record', ['done'])
+        self.assertEqual(run_job(claim_job('worker')), Job.DONE)
+        self.assertEqual(calls, ['done'])
+        job = Job.objects.get()
+        self.assertIsNotNone(job.finished)
+        self.assertIsNotNone(job.duration)
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        job = flaky.enqueue()
+        with self.assertLogs('apps.jobs.worker', 'WARNING'):
+            self.assertEqual(run_job(claim_job('worker')), Job.QUEUED)
+        job.refresh_from_db()
+        self.assertIn('supplier feed unavailable', job.last_error)
+        self.assertGreaterEqual(job.run_at, timezone.now() + datetime.timedelta(seconds=59))
+        self.assertIsNone(claim_job('worker'))
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('apps.jobs.worker', 'ERROR'):
+            self.assertEqual(run_job(claim_job('worker')), Job.FAILED)
+        self.assertEqual(Job.objects.get().attempts, 2)
+
+    def test_outcome_is_recorded_after_reconnecting(self):
+        record.enqueue('done')
+        update = QuerySet.update
+        failures = [DatabaseError('server closed the connection unexpectedly')]
+
+        def flaky_update(queryset, **fields):
+            if failures:
+                raise failures.pop()
+            return update(queryset, **fields)
+
+        job = claim_job('worker')
+        with mock.patch.object(QuerySet, 'update', flaky_update), \
+                mock.patch('apps.jobs.worker.connection') as connection, \
+                mock.patch('apps.jobs.worker.time.sleep'), \
+                self.assertLogs('apps.jobs.worker', 'ERROR'):
+            self.assertEqual(run_job(job), Job.DONE)
+        connection.close.assert_called_once_with()
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_abandoned_jobs_are_queued_again(self):
+        job = record.enqueue(1)
+        claim_job('dead worker')
+        Job.objects.update(started=timezone.now() - datetime.timedelta(hours=2))
+        self.assertEqual(requeue_abandoned(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+
+    def test_throughput_metrics(self):
+        enqueue('tests.record', [1])
+        enqueue('tests.record', [2])
+        run_job(claim_job('worker'))
+        stats = job_stats()['tests.record']
+        self.assertEqual((stats['done'], stats['queued'], stats['running']), (1, 1, 0))
+        self.assertEqual(stats['per_minute'], 0.2)
+
+        with self.settings(METRICS_TOKEN='scrape-me'):
+            metrics = self.client.get(
+                reverse('job-metrics'), HTTP_AUTHORIZATION='Bearer scrape-me').content.decode()
+            response = self.client.get(reverse('job-metrics'))
+        self.assertIn('# TYPE erp_jobs_queued gauge', metrics)
+        self.assertIn('erp_jobs_done_recent{task="tests.record"} 1', metrics)
+        self.assertEqual(response.status_code, 404)
+
+
+class RunWorkersTests(TransactionTestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_burst_workers_run_every_due_job(self):
+        for value in range(5):
+            enqueue('tests.record', [value])
+        with mock.patch('signal.signal'):
+            call_command('run_workers', threads=1, burst=True, stdout=mock.MagicMock())
+        self.assertEqual(sorted(calls), list(range(5)))
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 5)
+        self.assertIn('production.recompute_costs', TASKS)
@@ -0,0 +1,37 @@
+"""Jobs app views"""
+from django.http import HttpResponse
+
+from core.profiling import escape_label, metrics_view
+
+from .worker import job_stats
+
+
+# Prometheus gauges: name, help, key of the job_stats row
+GAUGES = (
+    ('jobs_queued', 'Jobs waiting to be claimed, retries included.', 'queued'),
+    ('jobs_retries_pending', 'Failed jobs waiting for another attempt.', 'retries'),
+    ('jobs_running', 'Jobs being run by a worker.', 'running'),
+    ('jobs_done_recent', 'Jobs completed over the last 5 minutes.', 'done'),
+    ('jobs_failed_recent', 'Jobs failed for good over the last 5 minutes.', 'failed'),
+    ('jobs_per_minute', 'Jobs completed per minute over the last 5 minutes.', 'per_minute'),
+    ('job_duration_seconds_avg', 'Mean run time of the jobs completed over the last 5 minutes.',
+     'avg_seconds'),
+    ('job_duration_seconds_max', 'Longest run time of the jobs completed over the last 5 minutes.',
+     'max_seconds'),
+)
+
+
+@metrics_view
+def metrics(request):
+    """Serve the queue length and throughput of each task in the Prometheus text format.
+
+    They are read from the database, so any web process reports every worker.
+    """
+
+    stats = job_stats()
+    lines = []
+    for name, description, key in GAUGES:
+        lines += [f'# HELP erp_{name} {description}', f'# TYPE erp_{name} gauge']
+        for task, row in stats.items():
+            lines.append(f'erp_{name}{{task="{escape_label(task)}"}} {row[key] or 0}')
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,287 @@
+"""Jobs app workers
+
+Workers poll the `Job` table; no broker is needed. A job is claimed by
+switching it from 'queued' to 'running' with a conditional UPDATE, so two
+workers never run the same job. On PostgreSQL the candidate is first selected
+with `SELECT ... FOR UPDATE SKIP LOCKED`, letting concurrent workers claim
+different jobs without waiting on each other; SQLite serializes writers
+anyway.
+
+A failed job is queued again after a delay doubling with each attempt, until
+it reaches the `max_attempts` of its task. Jobs left 'running' by a worker
+that died are queued again once JOBS_LOCK_TIMEOUT has passed, so a task must
+finish well within it and be safe to run twice.
+"""
+import datetime
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import Avg, Count, F, Max, Q
+from django.utils import timezone
+
+from .models import Job
+from .tasks import TASKS
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which a running job is presumed abandoned by a dead worker
+JOBS_LOCK_TIMEOUT = getattr(settings, 'JOBS_LOCK_TIMEOUT', 60 * 60)
+
+# Longest delay, in seconds, between two attempts of a job
+JOBS_MAX_RETRY_DELAY = getattr(settings, 'JOBS_MAX_RETRY_DELAY', 60 * 60)
+
+# Days finished jobs are kept for the throughput statistics
+JOBS_RETENTION_DAYS = getattr(settings, 'JOBS_RETENTION_DAYS', 7)
+
+# Jobs considered per claim where SKIP LOCKED is unavailable
+CLAIM_CANDIDATES = 10
+
+# Seconds between two requeues of abandoned jobs and purges of old ones
+HOUSEKEEPING_INTERVAL = 60
+
+# Attempts at recording the outcome of a job, a second apart and doubling
+RECORD_ATTEMPTS = 4
+
+
+def claim_job(worker, tasks=None):
+    """Claim the next job due, highest priority first.
+
+    Args:
+        worker (str): The name recorded on the claimed job.
+        tasks (iterable): Only claim jobs of these tasks, any task by default.
+
+    Returns:
+        Job: The claimed job, now 'running', or None if no job is due.
+    """
+
+    now = timezone.now()
+    queued = (Job.objects
+              .filter(status=Job.QUEUED, run_at__lte=now)
+              .order_by('-priority', 'run_at', 'id'))
+    if tasks:
+        queued = queued.filter(task__in=list(tasks))
+    claim = {'status': Job.RUNNING, 'worker': worker, 'started': now, 'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pk = queued.select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            Job.objects.filter(pk=pk).update(**claim)
+        return Job.objects.get(pk=pk)
+
+    # Without row locks, each conditional UPDATE commits on its own: reading
+    # and then writing in one SQLite transaction fails instead of waiting
+    # when another worker writes in between
+    for pk in queued.values_list('pk', flat=True)[:CLAIM_CANDIDATES]:
+        if Job.objects.filter(pk=pk, status=Job.QUEUED).update(**claim):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def retry_delay(task, attempts):
+    """Return the seconds to wait before the next attempt of a job, with 10% jitter."""
+    delay = min(task.retry_delay * 2 ** (attempts - 1), JOBS_MAX_RETRY_DELAY)
+    return delay * random.uniform(1, 1.1)
+
+
+def record_outcome(job, **fields):
+    """Update a finished job, reconnecting if the database went away meanwhile.
+
+    Returns:
+        bool: Whether the outcome was recorded; if not, the job stays 'running'
+        until `requeue_abandoned` queues it again.
+    """
+
+    for attempt in range(RECORD_ATTEMPTS):
+        try:
+            Job.objects.filter(pk=job.pk).update(**fields)
+            return True
+        except DatabaseError:
+            logger.exception('Could not record the outcome of job %s', job)
+            connection.close()
+            if attempt + 1 < RECORD_ATTEMPTS:
+                time.sleep(2 ** attempt)
+    return False
+
+
+def run_job(job):
+    """Run a claimed job and record its outcome.
+
+    Args:
+        job (Job): A job returned by `claim_job`.
+
+    Returns:
+        str: The new status of the job.
+    """
+
+    task = TASKS.get(job.task)
+    began = time.perf_counter()
+    try:
+        if task is None:
+            raise LookupError(f'Unknown task: {job.task}')
+        task.function(*job.args, **job.kwargs)
+    except Exception:
+        duration = time.perf_counter() - began
+        error = traceback.format_exc()
+        if task is not None and job.attempts < job.max_attempts:
+            status = Job.QUEUED
+            run_at = timezone.now() + datetime.timedelta(seconds=retry_delay(task, job.attempts))
+            logger.warning('Job %s failed, attempt %d of %d', job, job.attempts, job.max_attempts)
+            record_outcome(job, status=status, run_at=run_at, last_error=error, duration=duration)
+        else:
+            status = Job.FAILED
+            logger.error('Job %s failed for good:\n%s', job, error)
+            record_outcome(
+                job, status=status, last_error=error, duration=duration, finished=timezone.now())
+        return status
+
+    record_outcome(
+        job, status=Job.DONE, duration=time.perf_counter() - began, finished=timezone.now())
+    return Job.DONE
+
+
+def requeue_abandoned(timeout=None):
+    """Queue again the jobs left running longer than the lock timeout.
+
+    Args:
+        timeout (float): Seconds after which a running job is abandoned; JOBS_LOCK_TIMEOUT by default.
+
+    Returns:
+        int: The number of jobs queued again or, out of attempts, marked failed.
+    """
+
+    cutoff = timezone.now() - datetime.timedelta(seconds=timeout or JOBS_LOCK_TIMEOUT)
+    abandoned = Job.objects.filter(status=Job.RUNNING, started__lt=cutoff)
+    error = 'Abandoned by its worker'
+    return (abandoned.filter(attempts__lt=F('max_attempts'))
+            .update(status=Job.QUEUED, run_at=timezone.now(), last_error=error)
+            + abandoned.update(status=Job.FAILED, finished=timezone.now(), last_error=error))
+
+
+def purge_jobs(days=None):
+    """Delete the jobs finished more than `days` ago, JOBS_RETENTION_DAYS by default.
+
+    Returns:
+        int: The number of jobs deleted.
+    """
+
+    cutoff = timezone.now() - datetime.timedelta(days=days or JOBS_RETENTION_DAYS)
+    return Job.objects.filter(finished__lt=cutoff).delete()[0]
+
+
+def job_stats(window=300):
+    """Summarize the queue and the recent throughput of each task.
+
+    Read from the database, so they cover every worker process.
+
+    Args:
+        window (float): The seconds of history throughput is computed over.
+
+    Returns:
+        dict: Per task, the number of jobs `queued` and `running`, and over the
+        window the jobs `done` and `failed`, `retries` pending, `per_minute`
+        completions and the `avg_seconds` and `max_seconds` of successful runs.
+    """
+
+    since = timezone.now() - datetime.timedelta(seconds=window)
+    finished = Q(finished__gte=since)
+    rows = (Job.objects
+            .filter(Q(status__in=[Job.QUEUED, Job.RUNNING]) | finished)
+            .values('task')
+            .annotate(
+                queued=Count('id', filter=Q(status=Job.QUEUED)),
+                retries=Count('id', filter=Q(status=Job.QUEUED, attempts__gt=0)),
+                running=Count('id', filter=Q(status=Job.RUNNING)),
+                done=Count('id', filter=finished & Q(status=Job.DONE)),
+                failed=Count('id', filter=finished & Q(status=Job.FAILED)),
+                avg_seconds=Avg('duration', filter=finished & Q(status=Job.DONE)),
+                max_seconds=Max('duration', filter=finished & Q(status=Job.DONE)))
+            .order_by('task'))
+    stats = {}
+    for row in rows:
+        task = row.pop('task')
+        row['per_minute'] = round(row['done'] * 60 / window, 2)
+        stats[task] = row
+    return stats
+
+
+class Worker:
+    """
+    A pool of threads claiming and running jobs in this process.
+
+    Attributes:
+    - threads: int, the number of jobs run concurrently.
+    - tasks: list, the tasks claimed, any task when empty.
+    - poll_interval: float, the seconds an idle thread waits before polling again.
+    - burst: bool, whether threads exit once no job is due instead of polling.
+    - name: str, identifies the process in the `worker` field of its jobs.
+    - processed: dict, the number of jobs run per resulting status.
+    """
+
+    def __init__(self, threads=1, tasks=None, poll_interval=1.0, burst=False, name=None):
+        self.threads = threads
+        self.tasks = list(tasks or [])
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.processed = {}
+        self.stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._next_housekeeping = 0
+
+    def run(self):
+        """Run jobs until `stop` is called or, in burst mode, until none is due."""
+        pool = [threading.Thread(target=self.loop, args=(n,), name=f'jobs-{n}')
+                for n in range(self.threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+
+    def stop(self):
+        """Let the threads finish their current job and exit."""
+        self.stopping.set()
+
+    def loop(self, number):
+        worker = f'{self.name}:{number}'
+        try:
+            while not self.stopping.is_set():
+                # Apply CONN_MAX_AGE and health checks as request_started does
+                close_old_connections()
+                try:
+                    self.housekeep()
+                    job = claim_job(worker, self.tasks)
+                except DatabaseError:
+                    # Keep polling through a database restart or a lock timeout
+                    logger.exception('Could not claim a job')
+                    connection.close()
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                if job is None:
+                    if self.burst:
+                        return
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                status = run_job(job)
+                with self._lock:
+                    self.processed[status] = self.processed.get(status, 0) + 1
+        finally:
+            connection.close()
+
+    def housekeep(self):
+        """Requeue abandoned jobs and purge old ones, at most every HOUSEKEEPING_INTERVAL."""
+        with self._lock:
+            if time.monotonic() < self._next_housekeeping:
+                return
+            self._next_housekeeping = time.monotonic() + HOUSEKEEPING_INTERVAL
+        requeue_abandoned()
+        purge_jobs()
@@ -2,38 +2,83 @@
 Producion app admin
 """
 from django.contrib import admin
+from django.db.models import OuterRef, Subquery
 
+from .aggregates import GroupConcat
 from .models import *
+from .pagination import EstimatedCountPaginator
+from .scheduling import release_production
+from .search import matching_documents
 
 
-class ItemAdmin(admin.ModelAdmin):
+class FullTextSearchMixin:
+    """Answer the changelist search box from the full-text index instead of ILIKE scans."""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(search_document__in=matching_documents(search_term)), False
+
+
+class ItemAdmin(FullTextSearchMixin, admin.ModelAdmin):
 
     list_display = ('name', 'slug', 'description', 'thumbnail', 'price', 'amount',
                     'measurement_unit', 'category', 'uid', 'added', 'was_added_recently')
     list_filter = ('category',)
+    list_select_related = ('category',)
     search_fields = ('name', 'category__name')
     date_hierarchy = 'added'
+    ordering = ('-added', '-uid')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
 class ComponentInline(admin.TabularInline):
     
     model = Component
     extra = 12
 
-class ProductAdmin(admin.ModelAdmin):
-    
-    def display_composition(self, obj):
-        return ', '.join([item.name for item in obj.composition.all()])
+class SubAssemblyInline(admin.TabularInline):
+
+    model = SubAssembly
+    fk_name = 'product'
+    autocomplete_fields = ('component',)
+    extra = 3
 
-    display_composition.short_description = 'Composition'
+class ProductAdmin(FullTextSearchMixin, admin.ModelAdmin):
 
-    inlines = [ComponentInline]
+    def get_queryset(self, request):
+        # Join the component names in the database instead of a query per row
+        names = (Component.objects
+                 .filter(product=OuterRef('pk'))
+                 .order_by()
+                 .values('product')
+                 .annotate(names=GroupConcat('item__name'))
+                 .values('names'))
+        return super().get_queryset(request).annotate(composition_names=Subquery(names))
+
+    @admin.display(description='Composition')
+    def display_composition(self, obj):
+        return obj.composition_names or ''
+
+    inlines = [ComponentInline, SubAssemblyInline]
     list_display = ('name', 'slug', 'description', 'thumbnail', 'price', 'units',
-                    'display_composition', 'category', 'uid', 'added', 'was_added_recently')
+                    'daily_capacity', 'display_composition', 'category', 'uid', 'added', 'was_added_recently')
     list_filter = ('category',)
+    list_select_related = ('category',)
     search_fields = ('name', 'category__name')
     date_hierarchy = 'added'
+    ordering = ('-added', '-uid')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
 
+class ComponentAdmin(admin.ModelAdmin):
+
+    list_select_related = ('product', 'item')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 class ProductsInline(admin.TabularInline):
     
     model = ProductionDetail
@@ -42,17 +87,67 @@ class ProductsInline(admin.TabularInline):
 
 class ProductionAdmin(admin.ModelAdmin):
     
+    def get_queryset(self, request):
+        # Join the product names in the database instead of a query per row
+        names = (ProductionDetail.objects
+                 .filter(production=OuterRef('pk'))
+                 .order_by()
+                 .values('production')
+                 .annotate(names=GroupConcat('product__name'))
+                 .values('names'))
+        return super().get_queryset(request).annotate(product_names=Subquery(names))
+
+    @admin.display(description='Products')
     def display_products(self, obj):
-        return ', '.join([product.name for product in obj.products.all()])
+        return obj.product_names or ''
     
+    @admin.action(description='Release selected draft productions')
+    def release_drafts(self, request, queryset):
+        released = [production for production in queryset.filter(draft=True)
+                    if release_production(production)]
+        self.message_user(request, f'{len(released)} draft productions released.')
+
     inlines = [ProductsInline]
-    display_products.short_description = 'Products'
-    list_display = ('uid', 'display_products', 'added', 'was_added_recently')
+    actions = ['release_drafts']
+    list_display = ('uid', 'display_products', 'draft', 'added', 'was_added_recently')
+    list_filter = ('draft',)
+    date_hierarchy = 'added'
+    ordering = ('-added', '-uid')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class ProductionDetailAdmin(admin.ModelAdmin):
+
+    list_select_related = ('production', 'product')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class StockMovementAdmin(admin.ModelAdmin):
+
+    # The ledger is append-only and kept in step with Item.amount by apps.production.ledger
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    list_display = ('item', 'kind', 'quantity', 'production', 'added')
+    list_filter = ('kind',)
+    list_select_related = ('item',)
     date_hierarchy = 'added'
+    ordering = ('-added',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(Item, ItemAdmin)
 admin.site.register(Product, ProductAdmin)
-admin.site.register(Component)
+admin.site.register(Component, ComponentAdmin)
 admin.site.register(Production, ProductionAdmin)
-admin.site.register(ProductionDetail)
+admin.site.register(ProductionDetail, ProductionDetailAdmin)
+admin.site.register(StockMovement, StockMovementAdmin)
@@ -0,0 +1,27 @@
+"""Production app database aggregates"""
+from django.db.models import Aggregate, CharField
+
+
+class GroupConcat(Aggregate):
+    """
+    Joins the values of a group into a single comma separated string.
+
+    Compiles to GROUP_CONCAT on SQLite and MySQL and to STRING_AGG on PostgreSQL.
+    """
+
+    function = 'GROUP_CONCAT'
+    template = "%(function)s(%(expressions)s, ', ')"
+    output_field = CharField()
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template="%(function)s(%(expressions)s SEPARATOR ', ')",
+            **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            function='STRING_AGG',
+            template="%(function)s(%(expressions)s::text, ', ')",
+            **extra_context)
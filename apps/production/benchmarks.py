@@ -0,0 +1,245 @@
+"""Production app benchmark suite
+
+Each benchmark times one hot path against the current database, usually
+filled with `manage.py seed_erp`. A benchmark is a function taking the
+benchmark context and returning the callable to measure, so setup work (users,
+clients, lookups) is not timed. `run_benchmarks` records, per benchmark, the
+latency over several repeats and, from one extra instrumented run, the number
+of queries (on every connection, including the worker threads of async views),
+the SQL time and the peak Python memory.
+"""
+import datetime
+import math
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.profiling import profiled
+
+from .costing import recompute_costs
+from .exporting import export_stream
+from .fragments import increment_versions
+from .impact import price_impact
+from .kpis import compute_kpis
+from .ledger import stock_as_of
+from .models import Item, Product
+from .reporting import production_report
+from .scheduling import schedule_production
+from .search import search
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark under a name."""
+
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+
+    return register
+
+
+class BenchmarkContext:
+    """
+    Shared setup of a benchmark run.
+
+    Attributes:
+    - client: Client, logged in as a superuser so admin pages can be requested.
+    """
+
+    def __init__(self):
+        user, created = User.objects.get_or_create(
+            username='benchmark', defaults={'is_staff': True, 'is_superuser': True})
+        if created:
+            user.set_unusable_password()
+            user.save()
+        self.client = Client()
+        self.client.force_login(user)
+
+    def page(self, url, **params):
+        """Build a callable requesting a page and checking it succeeded."""
+
+        def request():
+            response = self.client.get(url, params)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} answered {response.status_code}')
+            # Streaming responses are only produced while being read
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+
+        return request
+
+
+@benchmark('dashboard')
+def dashboard(context):
+    return context.page(reverse('dashboard'))
+
+
+@benchmark('dashboard_uncached')
+def dashboard_uncached(context):
+    request = context.page(reverse('dashboard'))
+
+    def run():
+        # Nothing is written, so there is no commit to wait for
+        increment_versions(['item', 'product', 'component', 'production'])
+        request()
+    return run
+
+
+@benchmark('login')
+def login(context):
+    # One password verification per login, with the configured hasher
+    user, _ = User.objects.get_or_create(username='benchmark-login')
+    user.set_password('benchmark-password')
+    user.save()
+    url = reverse('user-login')
+
+    def run():
+        response = Client().post(url, {'username': user.username, 'password': 'benchmark-password'})
+        if response.status_code != 302:
+            raise RuntimeError(f'{url} answered {response.status_code}')
+    return run
+
+
+@benchmark('admin_items')
+def admin_items(context):
+    return context.page(reverse('admin:production_item_changelist'))
+
+
+@benchmark('admin_products')
+def admin_products(context):
+    return context.page(reverse('admin:production_product_changelist'))
+
+
+@benchmark('admin_productions')
+def admin_productions(context):
+    return context.page(reverse('admin:production_production_changelist'))
+
+
+@benchmark('cost_rollup')
+def cost_rollup(context):
+    def run():
+        Product.objects.update(cost_stale=True)
+        recompute_costs()
+    return run
+
+
+@benchmark('export_productions')
+def export_productions(context):
+    def run():
+        for _ in export_stream('productions', 'csv'):
+            pass
+    return run
+
+
+@benchmark('export_inventory')
+def export_inventory(context):
+    def run():
+        for _ in export_stream('inventory', 'jsonl', gzip=True):
+            pass
+    return run
+
+
+@benchmark('price_impact')
+def supplier_feed_impact(context):
+    # A supplier feed raising a thousand prices by 10%
+    prices = {pk: (price or 0) * Decimal('1.1')
+              for pk, price in Item.objects.values_list('pk', 'price')[:1000]}
+    return lambda: price_impact(prices)
+
+
+@benchmark('schedule')
+def schedule(context):
+    # Ten units of every product over a month, sharing the plant
+    demand = {pk: 10 for pk in Product.objects.values_list('pk', flat=True)}
+    return lambda: schedule_production(demand, days=30, line_capacity=max(len(demand), 1) * 2)
+
+
+@benchmark('stock_as_of')
+def stock_a_week_ago(context):
+    when = timezone.now() - datetime.timedelta(days=7)
+    return lambda: stock_as_of(when)
+
+
+@benchmark('kpis')
+def dashboard_kpis(context):
+    return compute_kpis
+
+
+@benchmark('production_report')
+def report(context):
+    return lambda: production_report('month', 'category')
+
+
+@benchmark('search')
+def catalog_search(context):
+    return lambda: search('fine fl', limit=10)
+
+
+def measure(function, repeats):
+    """Time a callable and record its queries and peak memory.
+
+    Args:
+        function: The callable to measure.
+        repeats (int): The number of timed runs, after one warm-up run.
+
+    Returns:
+        dict: Latencies and SQL time in milliseconds, query counts and peak memory in KiB.
+    """
+
+    function()
+    latencies = []
+    for _ in range(repeats):
+        began = time.perf_counter()
+        function()
+        latencies.append((time.perf_counter() - began) * 1000)
+    latencies.sort()
+
+    # Tracing slows the code down, so queries and memory come from a separate run
+    tracemalloc.start()
+    try:
+        with profiled() as profile:
+            function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'repeats': repeats,
+        'min_ms': round(latencies[0], 3),
+        'median_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(latencies[math.ceil(len(latencies) * 0.95) - 1], 3),
+        'max_ms': round(latencies[-1], 3),
+        'queries': len(profile.queries),
+        'duplicate_queries': profile.duplicate_count(),
+        'sql_ms': round(profile.sql_time * 1000, 3),
+        'peak_memory_kib': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(names=None, repeats=10):
+    """Run the selected benchmarks.
+
+    Args:
+        names (iterable): The benchmarks to run, all of them by default.
+        repeats (int): The number of timed runs of each benchmark.
+
+    Returns:
+        dict: The measurements of each benchmark, by name.
+    """
+
+    # The test client requests pages as 'testserver'
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        context = BenchmarkContext()
+        return {name: measure(BENCHMARKS[name](context), repeats)
+                for name in (names or BENCHMARKS)}
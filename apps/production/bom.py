@@ -0,0 +1,224 @@
+"""Production app multi-level bills of materials
+
+Products can contain other products (`SubAssembly`). `BomClosure` stores,
+for every product, each product reachable through its sub-assemblies (itself
+included) with the total quantity over all paths, so that:
+
+- the items needed by a product are the components of its descendants,
+  scaled by the closure quantity, in one join (`explode_products`);
+- the products using an item or a product are its closure ancestors
+  (`where_used`, `products_using`);
+- a link creates a cycle when the component is already an ancestor of the
+  product (`creates_cycle`).
+
+Adding a link from P to C adds, for each ancestor A of P and descendant D of
+C, the paths A -> P -> C -> D: `quantity(A, P) * amount * quantity(C, D)`.
+Removing a link subtracts the same paths, and rows left without paths are
+deleted. Only the rows around the changed link are touched.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Sum
+from django.core.exceptions import ValidationError
+
+from .models import BomClosure, Component, Product, SubAssembly
+
+
+QUANTITY_PLACES = Decimal('0.000001')
+
+
+def ensure_bom_roots(product_ids=None):
+    """Create the closure rows linking products to themselves.
+
+    Products created with `save()` get theirs from a signal; call this after
+    bulk creating products.
+
+    Args:
+        product_ids (iterable): The products to check, every product by default.
+
+    Returns:
+        int: The number of rows created.
+    """
+
+    products = Product.objects.filter(~Exists(BomClosure.objects.filter(
+        ancestor=OuterRef('pk'), descendant=OuterRef('pk'))))
+    if product_ids is not None:
+        products = products.filter(pk__in=list(product_ids))
+    roots = [BomClosure(ancestor_id=pk, descendant_id=pk, quantity=1, paths=1)
+             for pk in products.values_list('pk', flat=True)]
+    BomClosure.objects.bulk_create(roots, ignore_conflicts=True)
+    return len(roots)
+
+
+def creates_cycle(product_id, component_id):
+    """Return whether using `component_id` in `product_id` would create a cycle."""
+    return (product_id == component_id
+            or BomClosure.objects.filter(ancestor=component_id, descendant=product_id).exists())
+
+
+def _change_link(product_id, component_id, amount, sign):
+    ancestors = list(BomClosure.objects
+                     .filter(descendant=product_id)
+                     .values_list('ancestor_id', 'quantity', 'paths'))
+    descendants = list(BomClosure.objects
+                       .filter(ancestor=component_id)
+                       .values_list('descendant_id', 'quantity', 'paths'))
+
+    deltas = {}
+    for ancestor_id, ancestor_quantity, ancestor_paths in ancestors:
+        for descendant_id, descendant_quantity, descendant_paths in descendants:
+            deltas[ancestor_id, descendant_id] = (
+                ancestor_quantity * amount * descendant_quantity,
+                ancestor_paths * descendant_paths)
+
+    existing = {(row.ancestor_id, row.descendant_id): row
+                for row in BomClosure.objects.filter(
+                    ancestor__in=[row[0] for row in ancestors],
+                    descendant__in=[row[0] for row in descendants])}
+    to_create, to_update, to_delete = [], [], []
+    for key, (quantity, paths) in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            to_create.append(BomClosure(ancestor_id=key[0], descendant_id=key[1],
+                                        quantity=quantity.quantize(QUANTITY_PLACES), paths=paths))
+            continue
+        row.paths += sign * paths
+        row.quantity = (row.quantity + sign * quantity).quantize(QUANTITY_PLACES)
+        (to_update if row.paths else to_delete).append(row)
+
+    BomClosure.objects.bulk_create(to_create)
+    BomClosure.objects.bulk_update(to_update, ['quantity', 'paths'])
+    BomClosure.objects.filter(pk__in=[row.pk for row in to_delete]).delete()
+
+
+def link(product_id, component_id, amount):
+    """Add the paths through a new sub-assembly link to the closure.
+
+    Args:
+        product_id: The assembled product.
+        component_id: The product used in it.
+        amount (Decimal): The units of the component per unit of the product.
+
+    Raises:
+        ValidationError: If the link would make a product part of itself.
+    """
+
+    with transaction.atomic():
+        if creates_cycle(product_id, component_id):
+            raise ValidationError('A product cannot contain itself, directly or not.')
+        ensure_bom_roots([product_id, component_id])
+        _change_link(product_id, component_id, Decimal(amount), 1)
+
+
+def unlink(product_id, component_id, amount):
+    """Remove the paths through a deleted sub-assembly link from the closure.
+
+    Args:
+        product_id: The assembled product.
+        component_id: The product used in it.
+        amount (Decimal): The amount the link was created with.
+    """
+
+    with transaction.atomic():
+        _change_link(product_id, component_id, Decimal(amount), -1)
+
+
+def ancestor_ids(product_ids):
+    """Return the products containing any of the given products, themselves included."""
+    return set(BomClosure.objects
+               .filter(descendant__in=list(product_ids))
+               .values_list('ancestor_id', flat=True)) | set(product_ids)
+
+
+def explode_products(product_ids):
+    """Compute the items needed per unit of several products, through every level.
+
+    Args:
+        product_ids (iterable): The primary keys of the products.
+
+    Returns:
+        dict: For each product, a dict mapping item primary keys to the amount per unit.
+    """
+
+    boms = {product_id: {} for product_id in product_ids}
+    rows = (Component.objects
+            .filter(product__bom_ancestors__ancestor__in=list(boms), amount__isnull=False)
+            .values_list('product__bom_ancestors__ancestor', 'item')
+            .annotate(total=Sum(F('amount') * F('product__bom_ancestors__quantity')))
+            .order_by())
+    for product_id, item_id, total in rows:
+        boms[product_id][item_id] = Decimal(total).quantize(QUANTITY_PLACES)
+    return boms
+
+
+def where_used(item_id):
+    """Return the products that need an item, directly or through sub-assemblies."""
+    return Product.objects.filter(
+        pk__in=BomClosure.objects
+        .filter(descendant__component__item=item_id)
+        .values('ancestor'))
+
+
+def products_using(product_id):
+    """Return the products containing a product as a sub-assembly, at any level."""
+    return Product.objects.filter(
+        pk__in=BomClosure.objects
+        .filter(descendant=product_id)
+        .exclude(ancestor=product_id)
+        .values('ancestor'))
+
+
+def rebuild_closure(product_ids=None):
+    """Recompute closure rows from the sub-assembly links.
+
+    Args:
+        product_ids (iterable): The ancestors whose rows are recomputed, every
+            product by default.
+
+    Returns:
+        int: The number of closure rows written.
+    """
+
+    children = defaultdict(list)
+    if product_ids is None:
+        roots = list(Product.objects.values_list('pk', flat=True))
+        links = SubAssembly.objects.values_list('product_id', 'component_id', 'amount')
+        for product_id, component_id, amount in links:
+            children[product_id].append((component_id, amount))
+    else:
+        roots = list(Product.objects.filter(pk__in=list(product_ids)).values_list('pk', flat=True))
+        # Load the links below the roots one level at a time
+        frontier, seen = set(roots), set()
+        while frontier:
+            seen |= frontier
+            links = (SubAssembly.objects
+                     .filter(product__in=list(frontier))
+                     .values_list('product_id', 'component_id', 'amount'))
+            frontier = set()
+            for product_id, component_id, amount in links:
+                children[product_id].append((component_id, amount))
+                if component_id not in seen:
+                    frontier.add(component_id)
+
+    rows = []
+    for root in roots:
+        totals = defaultdict(lambda: [Decimal(0), 0])
+        stack = [(root, Decimal(1))]
+        while stack:
+            product_id, quantity = stack.pop()
+            totals[product_id][0] += quantity
+            totals[product_id][1] += 1
+            stack.extend((child, quantity * amount) for child, amount in children[product_id])
+        rows.extend(BomClosure(ancestor_id=root, descendant_id=descendant,
+                               quantity=quantity.quantize(QUANTITY_PLACES), paths=paths)
+                    for descendant, (quantity, paths) in totals.items())
+
+    with transaction.atomic():
+        stale = BomClosure.objects.all()
+        if product_ids is not None:
+            stale = stale.filter(ancestor__in=roots)
+        stale.delete()
+        BomClosure.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -0,0 +1,173 @@
+"""Production app catalog cache
+
+Read-through cache of Category, Item and Product rows, looked up by primary
+key or slug. Objects are stored under their primary key, and slugs point to
+the primary key, so renaming a slug never serves a stale row. Products are
+cached with their components and items prefetched. The signals in
+`signals.py` drop the entries when a row or a product's composition changes,
+once the change is committed: dropped any earlier, a concurrent reader could
+cache the old row again for CATALOG_CACHE_TIMEOUT.
+
+The API detail endpoints and the views resolving slugs read the rows
+through this cache; the admin reads the database, so editors never see a
+stale row.
+"""
+from collections import Counter
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Prefetch
+
+from apps.category.models import Category
+
+from .models import Component, Item, Product
+
+
+CATALOG_MODELS = {
+    'category': Category,
+    'item': Item,
+    'product': Product,
+}
+
+hits = Counter()
+misses = Counter()
+
+
+def catalog_cache():
+    """Return the cache backend holding catalog rows."""
+    return caches['catalog']
+
+
+def object_key(kind, pk):
+    """Return the cache key of a catalog row."""
+    return f'catalog:{kind}:pk:{pk}'
+
+
+def slug_key(kind, slug):
+    """Return the cache key pointing from a slug to a primary key."""
+    return f'catalog:{kind}:slug:{slug}'
+
+
+def catalog_queryset(kind):
+    """Return the queryset used to load rows of a kind on a cache miss."""
+    if kind == 'product':
+        return Product.objects.prefetch_related(
+            Prefetch('component_set', queryset=Component.objects.select_related('item')))
+    return CATALOG_MODELS[kind].objects.all()
+
+
+def get_cached(kind, pk=None, slug=None):
+    """Return a catalog row from the cache, loading it from the database on a miss.
+
+    Args:
+        kind (str): 'category', 'item' or 'product'.
+        pk: The primary key of the row.
+        slug (str): The slug of the row, used when no primary key is given.
+
+    Returns:
+        The model instance, or None if it does not exist.
+    """
+
+    cache = catalog_cache()
+    if pk is None:
+        pk = cache.get(slug_key(kind, slug))
+    if pk is not None:
+        instance = cache.get(object_key(kind, pk))
+        if instance is not None and (slug is None or instance.slug == slug):
+            hits[kind] += 1
+            return instance
+
+    misses[kind] += 1
+    lookup = {'pk': pk} if slug is None else {'slug': slug}
+    instance = catalog_queryset(kind).filter(**lookup).first()
+    if instance is not None:
+        cache.set_many({
+            object_key(kind, instance.pk): instance,
+            slug_key(kind, instance.slug): instance.pk,
+        })
+    return instance
+
+
+def get_cached_many(kind, slugs):
+    """Return several catalog rows by slug, loading the missing ones with one query.
+
+    Args:
+        kind (str): 'category', 'item' or 'product'.
+        slugs (iterable): The slugs of the rows.
+
+    Returns:
+        dict: Maps each slug found to its model instance.
+    """
+
+    cache = catalog_cache()
+    slugs = list(dict.fromkeys(slugs))
+    pointers = cache.get_many([slug_key(kind, slug) for slug in slugs])
+    pks = {slug: pointers[slug_key(kind, slug)] for slug in slugs if slug_key(kind, slug) in pointers}
+    cached = cache.get_many([object_key(kind, pk) for pk in pks.values()])
+    found = {}
+    for slug, pk in pks.items():
+        instance = cached.get(object_key(kind, pk))
+        if instance is not None and instance.slug == slug:
+            found[slug] = instance
+    hits[kind] += len(found)
+
+    missing = [slug for slug in slugs if slug not in found]
+    if missing:
+        misses[kind] += len(missing)
+        loaded = list(catalog_queryset(kind).filter(slug__in=missing))
+        entries = {}
+        for instance in loaded:
+            found[instance.slug] = instance
+            entries[object_key(kind, instance.pk)] = instance
+            entries[slug_key(kind, instance.slug)] = instance.pk
+        cache.set_many(entries)
+    return found
+
+
+def get_category(pk=None, slug=None):
+    """Return a Category through the catalog cache."""
+    return get_cached('category', pk=pk, slug=slug)
+
+
+def get_item(pk=None, slug=None):
+    """Return an Item through the catalog cache."""
+    return get_cached('item', pk=pk, slug=slug)
+
+
+def get_product(pk=None, slug=None):
+    """Return a Product, with its components and items, through the catalog cache."""
+    return get_cached('product', pk=pk, slug=slug)
+
+
+def invalidate(kind, pks):
+    """Drop cached rows of a kind when the current transaction commits.
+
+    Slug pointers are left in place: they are checked against the cached
+    object, so a dangling pointer is just a miss.
+
+    Args:
+        kind (str): 'category', 'item' or 'product'.
+        pks (iterable): The primary keys of the rows.
+    """
+
+    keys = [object_key(kind, pk) for pk in pks]
+    if keys:
+        transaction.on_commit(lambda: catalog_cache().delete_many(keys))
+
+
+def cache_stats():
+    """Return the hit and miss counters of this process.
+
+    Returns:
+        dict: For each kind, its `hits`, `misses` and `hit_ratio`.
+    """
+
+    stats = {}
+    for kind in CATALOG_MODELS:
+        total = hits[kind] + misses[kind]
+        stats[kind] = {
+            'hits': hits[kind],
+            'misses': misses[kind],
+            'hit_ratio': hits[kind] / total if total else None,
+        }
+    return stats
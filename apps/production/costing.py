@@ -0,0 +1,141 @@
+"""Production app cost rollup engine
+
+Unit costs of products and total costs of productions are computed with
+set-based UPDATE statements and stored in denormalized fields. Only products
+flagged with `cost_stale` (see `signals.py`) are recomputed. Costs include the
+components of sub-assemblies at every level, read through the BOM closure.
+
+Flagging products queues a `production.recompute_costs` job, delayed by
+COST_RECOMPUTE_DELAY seconds so that a burst of changes is priced at once.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from apps.jobs.tasks import enqueue
+
+from . import catalog_cache
+from .bom import ensure_bom_roots
+from .fragments import bump_versions
+from .models import BomClosure, Component, Product, Production, ProductionDetail
+
+
+COST_FIELD = DecimalField(max_digits=16, decimal_places=2)
+
+COST_RECOMPUTE_DELAY = getattr(settings, 'COST_RECOMPUTE_DELAY', 5)
+
+
+def unit_cost_subquery():
+    """Build a subquery with the unit cost of the product referenced by `OuterRef('pk')`.
+
+    Returns:
+        Coalesce: The sum of `Component.amount * Item.price` over the product and its
+            sub-assemblies, scaled by their quantity, or 0 if the product has no components.
+    """
+
+    line_cost = ExpressionWrapper(
+        F('amount') * F('item__price') * F('product__bom_ancestors__quantity'),
+        output_field=COST_FIELD)
+    totals = (Component.objects
+              .filter(product__bom_ancestors__ancestor=OuterRef('pk'))
+              .order_by()
+              .values('product__bom_ancestors__ancestor')
+              .annotate(total=Sum(line_cost))
+              .values('total'))
+    return Coalesce(Subquery(totals, output_field=COST_FIELD), 0, output_field=COST_FIELD)
+
+
+def mark_products_stale(item_ids=None, product_ids=None):
+    """Flag products whose cost must be recomputed.
+
+    Args:
+        item_ids (iterable): Items whose price changed; every product using them,
+            directly or through sub-assemblies, is flagged.
+        product_ids (iterable): Products whose composition changed; they and the
+            products containing them are flagged.
+
+    Returns:
+        int: The number of products flagged.
+    """
+
+    flagged = 0
+    if item_ids:
+        users = BomClosure.objects.filter(descendant__component__item__in=list(item_ids))
+        flagged += (Product.objects
+                    .filter(pk__in=users.values('ancestor'), cost_stale=False)
+                    .update(cost_stale=True))
+    if product_ids:
+        product_ids = list(product_ids)
+        containers = BomClosure.objects.filter(descendant__in=product_ids)
+        flagged += (Product.objects
+                    .filter(Q(pk__in=product_ids) | Q(pk__in=containers.values('ancestor')),
+                            cost_stale=False)
+                    .update(cost_stale=True))
+    if flagged:
+        enqueue('production.recompute_costs', delay=COST_RECOMPUTE_DELAY)
+    return flagged
+
+
+def update_production_costs(production_ids):
+    """Recompute the detail and total costs of the given productions.
+
+    Args:
+        production_ids (iterable): The primary keys of the productions to update.
+    """
+
+    production_ids = list(production_ids)
+    product_cost = Subquery(
+        Product.objects.filter(pk=OuterRef('product_id')).values('product_cost'),
+        output_field=COST_FIELD)
+    ProductionDetail.objects.filter(production__in=production_ids).update(
+        production_cost=ExpressionWrapper(F('produced_units') * product_cost, output_field=COST_FIELD))
+
+    totals = (ProductionDetail.objects
+              .filter(production=OuterRef('pk'))
+              .order_by()
+              .values('production')
+              .annotate(total=Sum('production_cost'))
+              .values('total'))
+    Production.objects.filter(pk__in=production_ids).update(
+        production_cost=Subquery(totals, output_field=COST_FIELD))
+    if production_ids:
+        bump_versions('production', 'productiondetail')
+
+
+def recompute_costs(chunk_size=2000):
+    """Recompute the costs of every stale product and of the productions using them.
+
+    Each chunk of products is priced with one UPDATE, followed by one UPDATE for
+    the affected production details and one for the affected productions, all in
+    a single transaction.
+
+    Args:
+        chunk_size (int): The number of products handled per transaction.
+
+    Returns:
+        int: The number of products priced.
+    """
+
+    priced = 0
+    while True:
+        with transaction.atomic():
+            product_ids = list(Product.objects
+                               .select_for_update()
+                               .filter(cost_stale=True)
+                               .values_list('pk', flat=True)[:chunk_size])
+            if not product_ids:
+                return priced
+
+            # Bulk created products may still lack the closure row of their own components
+            ensure_bom_roots(product_ids)
+            Product.objects.filter(pk__in=product_ids).update(
+                product_cost=unit_cost_subquery(), cost_stale=False)
+            catalog_cache.invalidate('product', product_ids)
+            bump_versions('product')
+            production_ids = (ProductionDetail.objects
+                              .filter(product__in=product_ids)
+                              .values_list('production', flat=True).distinct())
+            update_production_costs(production_ids)
+
+        priced += len(product_ids)
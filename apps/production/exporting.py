@@ -0,0 +1,187 @@
+"""Production app streaming exports
+
+Exports read tuples with `values_list(...).iterator()` and render them chunk by
+chunk, so no model instances are built and memory stays flat regardless of
+the number of rows.
+"""
+import csv
+import datetime
+import io
+import json
+import zlib
+
+from django.db import router
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Item, ProductionDetail
+
+
+# Columns of each dataset, as lookups usable by `values_list`
+EXPORT_COLUMNS = {
+    'productions': (
+        'production__uid', 'production__added', 'production__production_cost',
+        'product__slug', 'produced_units', 'production_cost',
+    ),
+    'inventory': (
+        'uid', 'slug', 'name', 'category__slug', 'price', 'amount',
+        'measurement_unit', 'added',
+    ),
+}
+
+# Field each dataset is filtered and ordered by
+EXPORT_DATE_FIELDS = {
+    'productions': 'production__added',
+    'inventory': 'added',
+}
+
+EXPORT_MODELS = {
+    'productions': ProductionDetail,
+    'inventory': Item,
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def parse_bound(value):
+    """Parse a date or datetime used to filter an export.
+
+    Args:
+        value (str): An ISO 8601 date or datetime; dates mean midnight.
+
+    Returns:
+        datetime: The aware datetime, or None if no value was given.
+
+    Raises:
+        ValueError: If the value is not a valid date or datetime.
+    """
+
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        moment = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def export_rows(dataset, since=None, until=None, chunk_size=2000):
+    """Stream the rows of a dataset as tuples.
+
+    Args:
+        dataset (str): 'productions' or 'inventory'.
+        since (datetime): Only export rows added at or after this moment.
+        until (datetime): Only export rows added before this moment.
+        chunk_size (int): The number of rows fetched from the database at a time.
+
+    Returns:
+        iterator: The rows, ordered by date.
+    """
+
+    date_field = EXPORT_DATE_FIELDS[dataset]
+    model = EXPORT_MODELS[dataset]
+    # Pick the database now, the rows are only read once the response streams
+    queryset = model.objects.using(router.db_for_read(model))
+    if since is not None:
+        queryset = queryset.filter(**{f'{date_field}__gte': since})
+    if until is not None:
+        queryset = queryset.filter(**{f'{date_field}__lt': until})
+    return (queryset
+            .order_by(date_field)
+            .values_list(*EXPORT_COLUMNS[dataset])
+            .iterator(chunk_size=chunk_size))
+
+
+def to_text(value):
+    """Convert a database value to a plain text or JSON compatible value."""
+    if value is None or isinstance(value, (int, str)):
+        return value
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def render_lines(columns, rows, file_format='csv', lines_per_chunk=500):
+    """Render rows as CSV or JSONL text.
+
+    Args:
+        columns (tuple): The column names.
+        rows (iterable): The rows as tuples.
+        file_format (str): 'csv' or 'jsonl'.
+        lines_per_chunk (int): The number of lines joined in each yielded chunk.
+
+    Yields:
+        str: Chunks of rendered lines.
+    """
+
+    buffer = io.StringIO()
+    names = [column.replace('__', '_') for column in columns]
+    if file_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+    elif file_format != 'jsonl':
+        raise ValueError(f'Unsupported file format: {file_format}')
+
+    for count, row in enumerate(rows, start=1):
+        values = [to_text(value) for value in row]
+        if file_format == 'csv':
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(names, values))) + '\n')
+        if count % lines_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of text chunks into a gzip stream.
+
+    Args:
+        chunks (iterable): The text chunks.
+
+    Yields:
+        bytes: Chunks of the gzip stream.
+    """
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(dataset, file_format='csv', since=None, until=None, gzip=False):
+    """Stream a whole dataset export.
+
+    Args:
+        dataset (str): 'productions' or 'inventory'.
+        file_format (str): 'csv' or 'jsonl'.
+        since (datetime): Only export rows added at or after this moment.
+        until (datetime): Only export rows added before this moment.
+        gzip (bool): Whether to gzip the output.
+
+    Returns:
+        iterator: Text chunks, or bytes chunks if `gzip` is set.
+    """
+
+    chunks = render_lines(
+        EXPORT_COLUMNS[dataset], export_rows(dataset, since, until), file_format)
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+def open_export(path, gzip=False):
+    """Open a file for an export stream: binary if gzipped, else UTF-8 text written as is."""
+    if gzip:
+        return open(path, 'wb')
+    return open(path, 'w', encoding='utf-8', newline='')
@@ -0,0 +1,120 @@
+"""Production app template fragment caching
+
+Each cached fragment is keyed on the version counters of the models it
+displays. Saving or deleting a row bumps the counter of its model when the
+write commits (see `signals.py`; bulk writes bump it explicitly), so fragments are never
+invalidated one by one: stale ones are simply no longer looked up and expire.
+The time of the last bump is kept with each counter and serves as the
+`Last-Modified` of the pages built from those models. The API builds its
+validators from the same counters (see `apps.api.views`).
+
+Counters live in the default cache, which must be shared by every process
+(e.g. CACHE_URL=redis://...) for a change made in one process to be seen by
+the others.
+"""
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+
+def version_key(name):
+    """Return the cache key of a model's version counter."""
+    return f'version:{name}'
+
+
+def changed_key(name):
+    """Return the cache key of the time a model's version was last bumped."""
+    return f'version:{name}:changed'
+
+
+def initial_version():
+    # Counters lost from the cache restart from the clock, above any version
+    # handed out before, so fragments cached under an old version are not reused
+    return time.time_ns() // 1000
+
+
+def bump_versions(*names):
+    """Invalidate the fragments displaying the given models once the current transaction commits.
+
+    Bumped any earlier, a concurrent request could still read the old rows and
+    cache them under the new version.
+
+    Args:
+        *names (str): Model names, e.g. 'item'.
+    """
+
+    transaction.on_commit(lambda: increment_versions(names))
+
+
+def increment_versions(names):
+    """Increment the version counters of several models and stamp their change time."""
+    now = time.time()
+    for name in names:
+        key = version_key(name)
+        cache.add(key, initial_version(), None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(key, initial_version(), None)
+    cache.set_many({changed_key(name): now for name in names}, None)
+
+
+def get_versions(names):
+    """Read the version counters of several models, starting the missing ones.
+
+    Args:
+        names (iterable): Model names, e.g. 'item'.
+
+    Returns:
+        dict: Maps each name to its `(version, last changed timestamp)`.
+    """
+
+    names = list(names)
+    keys = [version_key(name) for name in names] + [changed_key(name) for name in names]
+    values = cache.get_many(keys)
+
+    versions = {}
+    for name in names:
+        version = values.get(version_key(name))
+        if version is None:
+            version = initial_version()
+            # Another request may have started the counter first
+            if not cache.add(version_key(name), version, None):
+                version = cache.get(version_key(name), version)
+        changed = values.get(changed_key(name))
+        if changed is None:
+            changed = time.time()
+            cache.add(changed_key(name), changed, None)
+        versions[name] = (version, changed)
+    return versions
+
+
+async def aget_versions(names):
+    """Read the version counters of several models from async code, see `get_versions`."""
+    return await sync_to_async(get_versions)(names)
+
+
+def fragment_key(name, versions, *variants):
+    """Build the cache key of a fragment.
+
+    Args:
+        name (str): The fragment, e.g. 'dashboard:items'.
+        versions (iterable): The versions of the models it displays.
+        *variants: Anything else the fragment depends on, e.g. a page cursor.
+
+    Returns:
+        str: The key, changing whenever one of the versions is bumped.
+    """
+
+    digest = hashlib.md5(repr((tuple(versions), variants)).encode(), usedforsecurity=False)
+    return f'fragment:{name}:{digest.hexdigest()}'
+
+
+def etag(*parts):
+    """Build a strong ETag from the fragment keys and whatever else a page depends on."""
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False)
+    return f'"{digest.hexdigest()}"'
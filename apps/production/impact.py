@@ -0,0 +1,122 @@
+"""Production app price impact analysis
+
+Answers "what happens to our costs if these item prices change?" before the
+prices are saved, e.g. for a supplier feed. The products affected by an item
+are found through the inverted index formed by `component_item_product_idx`
+(item -> products using it directly) and the BOM closure (product -> products
+containing it), so a batch of price changes is analysed with one query per
+chunk of items, whatever the depth of the BOMs.
+
+Open productions are those whose stock was not consumed yet: their cost is
+still expected to follow the price of their items.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import F, Sum
+
+from .catalog_cache import get_cached_many
+from .importing import batched
+from .models import Component, Product, ProductionDetail
+
+
+COST_PLACES = Decimal('0.01')
+
+
+def product_cost_deltas(prices, chunk_size=500):
+    """Compute how much the unit cost of each product moves with new item prices.
+
+    Args:
+        prices (dict): Maps item primary keys to their new price.
+        chunk_size (int): The number of items looked up per query.
+
+    Returns:
+        dict: Maps the primary key of every affected product to its unit cost delta.
+    """
+
+    deltas = defaultdict(Decimal)
+    for chunk in batched(prices, chunk_size):
+        usage = (Component.objects
+                 .filter(item__in=chunk, amount__isnull=False)
+                 .values_list('product__bom_ancestors__ancestor', 'item', 'item__price')
+                 .annotate(quantity=Sum(F('amount') * F('product__bom_ancestors__quantity')))
+                 .order_by())
+        for product_id, item_id, price, quantity in usage:
+            change = Decimal(prices[item_id]) - (price or Decimal(0))
+            if change:
+                deltas[product_id] += Decimal(quantity) * change
+    return {product_id: delta.quantize(COST_PLACES)
+            for product_id, delta in deltas.items() if delta.quantize(COST_PLACES)}
+
+
+def price_impact(prices, chunk_size=500):
+    """Report the products and open productions whose cost moves with new item prices.
+
+    Nothing is saved; costs are those currently stored, which may be stale for
+    products flagged for recomputation.
+
+    Args:
+        prices (dict): Maps item primary keys to their new price.
+        chunk_size (int): The number of items or products looked up per query.
+
+    Returns:
+        dict: `products` and `productions`, lists of dicts with the `uid`,
+        current `cost`, `new_cost` and `delta` of each affected row, largest
+        change first. Products also have their `slug` and `name`, productions
+        their `added` date.
+    """
+
+    deltas = product_cost_deltas(prices, chunk_size)
+
+    products = []
+    production_deltas = defaultdict(Decimal)
+    productions = {}
+    for chunk in batched(deltas, chunk_size):
+        rows = (Product.objects
+                .filter(pk__in=chunk)
+                .values_list('uid', 'slug', 'name', 'product_cost'))
+        for uid, slug, name, cost in rows:
+            products.append(impact_line(cost, deltas[uid], uid=uid, slug=slug, name=name))
+
+        details = (ProductionDetail.objects
+                   .filter(product__in=chunk, production__stock_consumed=False)
+                   .values_list('production', 'production__added', 'production__production_cost',
+                                'product', 'produced_units'))
+        for production_id, added, cost, product_id, units in details:
+            production_deltas[production_id] += deltas[product_id] * units
+            productions[production_id] = (added, cost)
+
+    return {
+        'products': sort_by_change(products),
+        'productions': sort_by_change([
+            impact_line(productions[uid][1], delta, uid=uid, added=productions[uid][0])
+            for uid, delta in production_deltas.items() if delta
+        ]),
+    }
+
+
+def impact_line(cost, delta, **fields):
+    """Describe the cost change of one product or production."""
+    return {**fields, 'cost': cost, 'new_cost': None if cost is None else cost + delta, 'delta': delta}
+
+
+def sort_by_change(lines):
+    """Sort impact lines largest change first."""
+    return sorted(lines, key=lambda line: (-abs(line['delta']), str(line['uid'])))
+
+
+def resolve_prices(prices):
+    """Map item slugs to primary keys in a dict of new prices.
+
+    Args:
+        prices (dict): Maps item slugs to their new price.
+
+    Returns:
+        tuple: The prices keyed by item primary key, and the sorted unknown slugs.
+    """
+
+    item_ids = {}
+    for chunk in batched(prices, 500):
+        item_ids.update((slug, item.pk) for slug, item in get_cached_many('item', chunk).items())
+    unknown = sorted(set(prices) - set(item_ids))
+    return {item_ids[slug]: price for slug, price in prices.items() if slug in item_ids}, unknown
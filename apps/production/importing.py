@@ -0,0 +1,270 @@
+"""Production app catalog import pipeline
+
+Rows are streamed from CSV or JSONL files with generators, validated and
+written in fixed-size batches, so memory use does not grow with file size.
+"""
+import csv
+import itertools
+import json
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from apps.category.models import Category
+
+from . import catalog_cache
+from .bom import ensure_bom_roots
+from .costing import mark_products_stale
+from .fragments import bump_versions
+from .models import Component, Item, Product
+from .planning import invalidate_boms
+from .search import index_objects
+
+
+# Importable fields for each kind of row, in the order they are validated
+IMPORT_FIELDS = {
+    'item': ('name', 'slug', 'description', 'price', 'amount', 'measurement_unit', 'category'),
+    'product': ('name', 'slug', 'description', 'price', 'units', 'category'),
+    'component': ('product', 'item', 'amount'),
+}
+
+# Fields identifying an existing row, never overwritten on update
+KEY_FIELDS = ('slug', 'product', 'item')
+
+IMPORT_MODELS = {
+    'item': Item,
+    'product': Product,
+    'component': Component,
+}
+
+
+class ImportStats:
+    """
+    Counters collected while importing a file.
+
+    Attributes:
+    - read: int, the number of rows read.
+    - created: int, the number of rows inserted.
+    - updated: int, the number of existing rows updated.
+    - rejected: int, the number of invalid rows.
+    """
+
+    def __init__(self):
+        self.read = 0
+        self.created = 0
+        self.updated = 0
+        self.rejected = 0
+
+
+def read_rows(path, file_format=None):
+    """Stream the rows of a CSV or JSONL file.
+
+    Args:
+        path (str): The path of the file.
+        file_format (str): 'csv' or 'jsonl'; guessed from the extension if omitted.
+
+    Yields:
+        tuple: The line number and the row as a dict, or as text if it cannot be parsed.
+    """
+
+    file_format = file_format or Path(path).suffix.lstrip('.').lower()
+    with open(path, newline='', encoding='utf-8') as handle:
+        if file_format == 'csv':
+            for line, row in enumerate(csv.DictReader(handle), start=2):
+                yield line, row
+        elif file_format in ('jsonl', 'ndjson'):
+            for line, raw in enumerate(handle, start=1):
+                if not raw.strip():
+                    continue
+                try:
+                    yield line, json.loads(raw)
+                except ValueError:
+                    # Malformed lines are passed on as text and rejected later
+                    yield line, raw.rstrip('\n')
+        else:
+            raise ValueError(f'Unsupported file format: {file_format}')
+
+
+def batched(iterable, size):
+    """Split an iterable into lists of at most `size` elements.
+
+    Args:
+        iterable: The iterable to split.
+        size (int): The size of each batch.
+
+    Yields:
+        list: The next batch.
+    """
+
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def clean_value(model, name, value):
+    """Convert and validate a raw value for a model field.
+
+    Args:
+        model: The model the field belongs to.
+        name (str): The field name.
+        value: The raw value read from the file.
+
+    Returns:
+        The cleaned Python value.
+
+    Raises:
+        ValidationError: If the value is not valid for the field.
+    """
+
+    if value == '':
+        value = None
+    field = model._meta.get_field(name)
+    try:
+        return field.clean(value, None)
+    except ValidationError as error:
+        raise ValidationError(f'{name}: {"; ".join(error.messages)}')
+
+
+class CatalogImporter:
+    """
+    Validates and writes batches of catalog rows.
+
+    Category slugs are resolved through a map loaded once, and the products and
+    items referenced by components are resolved with one query per batch.
+    """
+
+    def __init__(self, kind, rejected=None):
+        self.kind = kind
+        self.model = IMPORT_MODELS[kind]
+        self.fields = IMPORT_FIELDS[kind]
+        self.rejected = rejected
+        self.stats = ImportStats()
+        self.category_ids = dict(Category.objects.values_list('slug', 'id'))
+
+    def reject(self, line, row, error):
+        """Count an invalid row and write it to the rejected rows file."""
+        self.stats.rejected += 1
+        if self.rejected is not None:
+            self.rejected.write(json.dumps(
+                {'line': line, 'row': row, 'error': str(error)}, default=str) + '\n')
+
+    def clean_row(self, row, references):
+        """Validate a row and return the keyword arguments for its model."""
+        if not isinstance(row, dict):
+            raise ValidationError('malformed row')
+        values = {}
+        for name in self.fields:
+            raw = row.get(name)
+            if name in ('category', 'product', 'item'):
+                target = references[name].get(raw)
+                if target is None:
+                    raise ValidationError(f'{name}: unknown slug {raw!r}')
+                values[f'{name}_id'] = target
+            else:
+                values[name] = clean_value(self.model, name, raw)
+        return values
+
+    def resolve_references(self, rows):
+        """Map the slugs referenced by a batch of rows to primary keys."""
+        if self.kind != 'component':
+            return {'category': self.category_ids}
+        return {
+            'product': dict(Product.objects
+                            .filter(slug__in={row.get('product') for row in rows})
+                            .values_list('slug', 'uid')),
+            'item': dict(Item.objects
+                         .filter(slug__in={row.get('item') for row in rows})
+                         .values_list('slug', 'uid')),
+        }
+
+    def existing_keys(self, cleaned):
+        """Map the natural keys of a batch to the primary keys already stored."""
+        if self.kind == 'component':
+            pairs = Component.objects.filter(
+                product__in={values['product_id'] for values in cleaned.values()},
+                item__in={values['item_id'] for values in cleaned.values()},
+            ).values_list('product_id', 'item_id', 'uid')
+            return {(product, item): uid for product, item, uid in pairs}
+        return dict(self.model.objects
+                    .filter(slug__in=list(cleaned))
+                    .values_list('slug', 'uid'))
+
+    def natural_key(self, values):
+        """Return the key used to detect rows that already exist."""
+        if self.kind == 'component':
+            return values['product_id'], values['item_id']
+        return values['slug']
+
+    def import_batch(self, batch):
+        """Validate and write one batch of `(line, row)` pairs in a transaction."""
+        self.stats.read += len(batch)
+        references = self.resolve_references([row for _, row in batch if isinstance(row, dict)])
+
+        # Later rows with the same key replace earlier ones
+        cleaned = {}
+        for line, row in batch:
+            try:
+                values = self.clean_row(row, references)
+            except ValidationError as error:
+                self.reject(line, row, '; '.join(error.messages))
+                continue
+            cleaned[self.natural_key(values)] = values
+
+        with transaction.atomic():
+            existing = self.existing_keys(cleaned)
+            to_create, to_update = [], []
+            for key, values in cleaned.items():
+                if key in existing:
+                    to_update.append(self.model(uid=existing[key], **values))
+                else:
+                    to_create.append(self.model(**values))
+
+            self.model.objects.bulk_create(to_create)
+            self.model.objects.bulk_update(
+                to_update, [name for name in self.fields if name not in KEY_FIELDS])
+
+            # Bulk writes skip signals, so flag the affected products here
+            if self.kind == 'component':
+                product_ids = {component.product_id for component in to_create + to_update}
+                mark_products_stale(product_ids=product_ids)
+                invalidate_boms(product_ids)
+                catalog_cache.invalidate('product', product_ids)
+            elif self.kind == 'item':
+                from .ledger import reconcile_stock
+
+                # Stock amounts are set outright: record the changes in the stock ledger
+                reconcile_stock([item.uid for item in to_create + to_update])
+                item_ids = [item.uid for item in to_update]
+                mark_products_stale(item_ids=item_ids)
+                catalog_cache.invalidate('item', item_ids)
+                catalog_cache.invalidate('product', Component.objects.filter(
+                    item__in=item_ids).values_list('product_id', flat=True))
+            else:
+                ensure_bom_roots([product.uid for product in to_create])
+                catalog_cache.invalidate('product', [product.uid for product in to_update])
+            if self.kind != 'component':
+                index_objects(self.kind, [row.uid for row in to_create + to_update])
+            bump_versions(self.kind)
+
+        self.stats.created += len(to_create)
+        self.stats.updated += len(to_update)
+
+
+def import_catalog(kind, rows, batch_size=1000, rejected=None):
+    """Import a stream of catalog rows.
+
+    Args:
+        kind (str): 'item', 'product' or 'component'.
+        rows: An iterable of `(line, row)` pairs, e.g. from `read_rows`.
+        batch_size (int): The number of rows written per transaction.
+        rejected: A writable text file receiving invalid rows as JSONL.
+
+    Returns:
+        ImportStats: The import counters.
+    """
+
+    importer = CatalogImporter(kind, rejected=rejected)
+    for batch in batched(rows, batch_size):
+        importer.import_batch(batch)
+    return importer.stats
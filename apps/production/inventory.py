@@ -0,0 +1,205 @@
+"""Production app inventory consumption
+
+Recording a production decrements the stock of every consumed item in one
+transaction. Items are locked in primary key order so concurrent productions
+always acquire their locks in the same order and cannot deadlock, and the
+stock is decremented with a single `UPDATE ... CASE` built from F() expressions
+instead of a read-modify-write per item. The consumption is recorded in the
+stock ledger in the same transaction (see `ledger.py`).
+
+Once a production has consumed its stock, saving, adding or deleting one of its
+details consumes or returns the difference between what its details consume
+and what its movements in the ledger already took, through the same locked
+update, and deleting the production returns everything its movements took, so
+the stock follows the details however they are edited.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+
+from .costing import update_production_costs
+from .ledger import record_movements
+from .models import Production, ProductionDetail, StockMovement
+from .reporting import rollup_productions
+
+
+AMOUNT_FIELD = DecimalField(max_digits=8, decimal_places=2)
+
+
+def consumed_items(production_id):
+    """Compute the quantity of each item consumed by a production.
+
+    Args:
+        production_id: The primary key of the production.
+
+    Returns:
+        dict: Maps item primary keys to the consumed quantity.
+    """
+
+    # Every product reaches its own components and those of its sub-assemblies
+    # through the BOM closure
+    component = 'product__bom_descendants__descendant__component'
+    consumption = (ProductionDetail.objects
+                   .filter(production=production_id,
+                           **{f'{component}__amount__isnull': False})
+                   .values_list(f'{component}__item')
+                   .annotate(total=Sum(F(f'{component}__amount')
+                                       * F('product__bom_descendants__quantity')
+                                       * F('produced_units'),
+                                       output_field=AMOUNT_FIELD))
+                   .order_by())
+    return {item_id: total.quantize(Decimal('0.01')) for item_id, total in consumption}
+
+
+def decrement_stock(quantities, production=None):
+    """Take quantities out of stock, recording the consumption in the stock ledger.
+
+    Must be called inside a transaction. The rows are locked in primary key
+    order before being updated.
+
+    Args:
+        quantities (dict): Maps item primary keys to the quantity to remove.
+        production (Production): The production consuming them, if any.
+
+    Returns:
+        int: The number of items updated.
+    """
+
+    return len(record_movements(
+        StockMovement(item_id=item_id, kind=StockMovement.CONSUMPTION, quantity=-quantity,
+                      production=production)
+        for item_id, quantity in quantities.items()))
+
+
+def claim_consumption(production_id):
+    """Mark a recorded production as consumed, returning whether it was not already."""
+    return bool(Production.objects
+                .filter(pk=production_id, stock_consumed=False, draft=False)
+                .update(stock_consumed=True))
+
+
+def consume_stock(production):
+    """Decrement the stock of the items used by a production, only once.
+
+    Args:
+        production (Production): The recorded production.
+
+    Returns:
+        dict: Maps item primary keys to the consumed quantity; empty if the
+        production had already been consumed or is a draft.
+    """
+
+    with transaction.atomic():
+        if not claim_consumption(production.pk):
+            return {}
+        quantities = consumed_items(production.pk)
+        decrement_stock(quantities, production)
+    production.stock_consumed = True
+    return quantities
+
+
+def recorded_consumption(production_id):
+    """Sum the stock a production consumed from its movements in the stock ledger.
+
+    Args:
+        production_id: The primary key of the production.
+
+    Returns:
+        dict: Maps item primary keys to the quantity consumed, net of any returned.
+    """
+
+    movements = (StockMovement.objects
+                 .filter(production=production_id)
+                 .values_list('item')
+                 .annotate(total=Sum('quantity'))
+                 .order_by())
+    return {item_id: -total for item_id, total in movements if total}
+
+
+def follow_detail_change(production_id, claim=True):
+    """Consume or return stock after the details of a production changed.
+
+    The consumption recorded in the ledger for the production is brought in
+    line with what its current details consume, so whatever the BOMs became in
+    between, no more goes back to stock than was taken out of it. A recorded
+    production not consumed yet consumes all of its details instead, and
+    drafts consume nothing.
+
+    Args:
+        production_id: The primary key of the production.
+        claim (bool): Whether a production not consumed yet consumes its details.
+
+    Returns:
+        dict: Maps item primary keys to the quantity taken out of stock,
+        negative when returned.
+    """
+
+    production = Production(pk=production_id)
+    with transaction.atomic():
+        if claim and claim_consumption(production_id):
+            quantities = consumed_items(production_id)
+        # Locking the production serializes the concurrent edits of its details
+        elif (Production.objects.select_for_update()
+              .filter(pk=production_id, stock_consumed=True, draft=False).exists()):
+            wanted = consumed_items(production_id)
+            recorded = recorded_consumption(production_id)
+            quantities = {item_id: wanted.get(item_id, 0) - recorded.get(item_id, 0)
+                          for item_id in wanted.keys() | recorded.keys()}
+            quantities = {item_id: quantity for item_id, quantity in quantities.items() if quantity}
+        else:
+            return {}
+        decrement_stock(quantities, production)
+    return quantities
+
+
+def return_stock(production):
+    """Put back the stock consumed by a production about to be deleted.
+
+    What goes back is read from the movements of the production, not from the
+    current BOMs. The production is marked as not consumed, so the deletion of
+    its details returns nothing more.
+
+    Args:
+        production (Production): The production.
+
+    Returns:
+        dict: Maps item primary keys to the quantity returned.
+    """
+
+    with transaction.atomic():
+        returned = (Production.objects
+                    .filter(pk=production.pk, stock_consumed=True, draft=False)
+                    .update(stock_consumed=False))
+        if not returned:
+            return {}
+        quantities = recorded_consumption(production.pk)
+        # The movements outlive the production, so they are not linked to it
+        decrement_stock({item_id: -quantity for item_id, quantity in quantities.items()})
+    production.stock_consumed = False
+    return quantities
+
+
+def record_production(plan, added=None):
+    """Record a production and consume the stock it used, atomically.
+
+    Args:
+        plan (dict): Maps product primary keys to produced units.
+        added (datetime): When the production happened; now by default.
+
+    Returns:
+        Production: The recorded production.
+    """
+
+    with transaction.atomic():
+        production = Production(**({'added': added} if added else {}))
+        production.save()
+        ProductionDetail.objects.bulk_create([
+            ProductionDetail(production=production, product_id=product_id, produced_units=units)
+            for product_id, units in plan.items()
+        ])
+        # bulk_create skips the signals keeping production costs and rollups up to date
+        update_production_costs([production.pk])
+        rollup_productions([production])
+        consume_stock(production)
+    return production
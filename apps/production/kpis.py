@@ -0,0 +1,154 @@
+"""Production app dashboard KPIs
+
+Totals shown on the dashboard, computed by two aggregate queries in the
+database instead of iterating rows in Python or in templates:
+
+- the number of products per category, each category row also carrying, as
+  uncorrelated subqueries evaluated once:
+  - the inventory value, `Sum(amount * price)` over the items;
+  - the units produced over the last 1, 7 and 30 days by recorded (not
+    draft) productions, each sum reading only its own period through the
+    index on `Production.added`;
+- the items consumed the most over the last 30 days, from the stock ledger.
+
+Every item and product belongs to a category, so without categories there is
+nothing to total.
+
+The dashboard never computes them. It reads the last values from the default
+cache, and once they are older than KPI_CACHE_TIMEOUT seconds the first request
+queues `production.refresh_kpis` for the job workers and keeps showing the
+stale values with the time they were computed. With the KPI_BACKGROUND setting
+False (e.g. when no worker runs), that request computes them itself instead.
+"""
+import datetime
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Subquery, Sum, Value
+from django.utils import timezone
+
+from apps.category.models import Category
+from apps.jobs.tasks import enqueue
+
+from .models import Item, ProductionDetail, StockMovement
+
+
+# Seconds after which the KPIs are refreshed
+KPI_CACHE_TIMEOUT = getattr(settings, 'KPI_CACHE_TIMEOUT', 60)
+
+# Stale KPIs are still shown for this long if no refresh succeeds
+KPI_STALE_TIMEOUT = 60 * 60 * 24
+
+KPI_CACHE_KEY = 'dashboard:kpis'
+
+# Held while a refresh is pending, so a single request queues it
+KPI_REFRESH_KEY = 'dashboard:kpis:refresh'
+
+# Days the units produced are summed over
+KPI_PERIODS = (1, 7, 30)
+
+# Number of top consumed items listed
+TOP_CONSUMED_ITEMS = 5
+
+VALUE_FIELD = DecimalField(max_digits=20, decimal_places=2)
+
+
+def total(queryset, **aggregates):
+    """Return subqueries computing aggregates over a whole queryset, one per name."""
+    rows = queryset.order_by().annotate(whole=Value(1)).values('whole')
+    return {name: Subquery(rows.annotate(**{name: aggregate}).values(name))
+            for name, aggregate in aggregates.items()}
+
+
+def compute_kpis(now=None):
+    """Compute the dashboard KPIs with two aggregate queries.
+
+    Args:
+        now (datetime): The end of the periods; now by default.
+
+    Returns:
+        dict: `inventory_value`, `products_per_category` (dicts with the
+        `slug`, `name` and `products` of each category, largest first),
+        `units_produced` (maps each of KPI_PERIODS to the units produced over
+        that many days), `top_consumed` (dicts with the `slug`, `name`,
+        `measurement_unit` and `quantity` of the items consumed the most over
+        the longest period) and `computed`, when they were computed.
+    """
+
+    now = now or timezone.now()
+    starts = {days: now - datetime.timedelta(days=days) for days in KPI_PERIODS}
+    since = min(starts.values())
+
+    totals = total(
+        Item.objects.all(),
+        inventory_value=Sum(ExpressionWrapper(F('amount') * F('price'), output_field=VALUE_FIELD)))
+    recorded = ProductionDetail.objects.filter(production__draft=False, production__added__lte=now)
+    for days, start in starts.items():
+        totals.update(total(recorded.filter(production__added__gte=start),
+                            **{f'produced_{days}': Sum('produced_units')}))
+    categories = list(Category.objects
+                      .annotate(products=Count('product'), **totals)
+                      .values('slug', 'name', 'products', *totals)
+                      .order_by('-products', 'name'))
+    # The totals are repeated on every category row
+    first = categories[0] if categories else {}
+
+    consumed = (StockMovement.objects
+                .filter(kind=StockMovement.CONSUMPTION, added__gte=since, added__lte=now)
+                .values('item__slug', 'item__name', 'item__measurement_unit')
+                .annotate(quantity=Sum('quantity'))
+                .order_by('quantity')[:TOP_CONSUMED_ITEMS])
+
+    return {
+        'inventory_value': first.get('inventory_value') or Decimal(0),
+        'products_per_category': [{'slug': row['slug'], 'name': row['name'], 'products': row['products']}
+                                  for row in categories],
+        'units_produced': {days: first.get(f'produced_{days}') or 0 for days in KPI_PERIODS},
+        'top_consumed': [{'slug': row['item__slug'], 'name': row['item__name'],
+                          'measurement_unit': row['item__measurement_unit'],
+                          'quantity': -row['quantity']}
+                         for row in consumed],
+        'computed': now,
+    }
+
+
+def refresh_kpis():
+    """Compute the KPIs and cache them for the dashboard."""
+    kpis = compute_kpis()
+    cache.set(KPI_CACHE_KEY, kpis, KPI_STALE_TIMEOUT)
+    cache.delete(KPI_REFRESH_KEY)
+    return kpis
+
+
+def is_stale(kpis):
+    """Return whether cached KPIs, possibly None, are due for a refresh."""
+    return kpis is None or kpis['computed'] < timezone.now() - datetime.timedelta(seconds=KPI_CACHE_TIMEOUT)
+
+
+def request_refresh():
+    """Refresh the KPIs on the job queue, or right away without KPI_BACKGROUND.
+
+    Returns:
+        dict: The new KPIs if they were computed right away, None if queued.
+    """
+
+    if getattr(settings, 'KPI_BACKGROUND', True):
+        enqueue('production.refresh_kpis')
+        return None
+    return refresh_kpis()
+
+
+async def aget_kpis():
+    """Read the cached KPIs, requesting a refresh once they are stale.
+
+    Returns:
+        dict: The last KPIs computed, possibly stale, or None if none were
+        computed yet and the refresh was queued.
+    """
+
+    kpis = await cache.aget(KPI_CACHE_KEY)
+    if is_stale(kpis) and await cache.aadd(KPI_REFRESH_KEY, True, KPI_CACHE_TIMEOUT):
+        kpis = await sync_to_async(request_refresh)() or kpis
+    return kpis
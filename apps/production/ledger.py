@@ -0,0 +1,270 @@
+"""Production app stock ledger
+
+Every change to the stock of an item is appended to the ledger as a
+`StockMovement`: receipts, consumption by productions and adjustments (stock
+counts, admin edits, imports). `Item.amount` remains the current balance, so
+planning and scheduling keep reading a single column, but it only changes
+together with the movements explaining it, in the same transaction.
+
+Movements are written in batches with `bulk_create`, after the balances of all
+the items involved were updated with one `UPDATE ... CASE`, their rows locked
+in primary key order so concurrent writers cannot deadlock. They are stamped
+once the locks are held, so the movements of an item are stamped in the order
+they commit; yet a movement may still commit a moment after its stamp, so
+snapshots are only taken STOCK_SNAPSHOT_MARGIN seconds in the past, once every
+movement stamped before then is visible.
+
+`StockSnapshot` rows hold the balance of each item that moved since its
+previous snapshot. The stock as of any moment is the latest snapshot of each
+item at or before it plus the movements in between, read in one query through
+the (item, taken) and (item, added) indexes instead of summing the whole
+history. `compact_ledger` folds the movements older than
+STOCK_LEDGER_RETENTION_DAYS into snapshots and deletes them, after which the
+stock at earlier moments is only known at the resolution of the snapshots.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Case, DateTimeField, DecimalField, Exists, F, OuterRef, Subquery, Sum, Value, When)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import catalog_cache
+from .fragments import bump_versions
+from .importing import batched
+from .models import Item, StockMovement, StockSnapshot
+
+
+# Movements and snapshots written per query
+STOCK_LEDGER_BATCH_SIZE = getattr(settings, 'STOCK_LEDGER_BATCH_SIZE', 1000)
+
+# Days movements are kept before being folded into snapshots
+STOCK_LEDGER_RETENTION_DAYS = getattr(settings, 'STOCK_LEDGER_RETENTION_DAYS', 90)
+
+AMOUNT_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+STOCK_PLACES = Decimal('0.01')
+
+# Seconds snapshots lag behind now, longer than any transaction writing movements
+STOCK_SNAPSHOT_MARGIN = getattr(settings, 'STOCK_SNAPSHOT_MARGIN', 60)
+
+# Earlier than any movement, for items never snapshotted
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def apply_to_stock(quantities):
+    """Add quantities to the stock of several items with a single UPDATE.
+
+    Must be called inside a transaction. The rows are locked in primary key
+    order before being updated.
+
+    Args:
+        quantities (dict): Maps item primary keys to the quantity added, negative to remove.
+
+    Returns:
+        int: The number of items updated.
+    """
+
+    if not quantities:
+        return 0
+    item_ids = sorted(quantities)
+    list(Item.objects.select_for_update().filter(pk__in=item_ids).order_by('pk').values_list('pk'))
+    delta = Case(*[When(pk=item_id, then=Value(quantities[item_id])) for item_id in item_ids],
+                 output_field=AMOUNT_FIELD)
+    updated = Item.objects.filter(pk__in=item_ids).update(
+        amount=Coalesce(F('amount'), Value(0), output_field=AMOUNT_FIELD) + delta)
+    # Both wait for the transaction to commit
+    catalog_cache.invalidate('item', item_ids)
+    bump_versions('item')
+    return updated
+
+
+def record_movements(movements, update_stock=True, batch_size=None):
+    """Append movements to the ledger.
+
+    The movements are stamped with the moment they are written.
+
+    Args:
+        movements (iterable): Unsaved `StockMovement` instances; those moving nothing are skipped.
+        update_stock (bool): Whether to apply them to `Item.amount`; False when
+            the amounts were already written, e.g. by a bulk update.
+        batch_size (int): The number of movements inserted per query;
+            STOCK_LEDGER_BATCH_SIZE by default.
+
+    Returns:
+        dict: Maps the primary key of each item moved to its total change.
+    """
+
+    movements = [movement for movement in movements if movement.quantity]
+    totals = defaultdict(Decimal)
+    for movement in movements:
+        totals[movement.item_id] += movement.quantity
+
+    with transaction.atomic(savepoint=False):
+        # Lock the items before the inserts take their key share locks
+        if update_stock:
+            apply_to_stock(totals)
+        now = timezone.now()
+        for movement in movements:
+            movement.added = now
+        for batch in batched(movements, batch_size or STOCK_LEDGER_BATCH_SIZE):
+            StockMovement.objects.bulk_create(batch)
+    return dict(totals)
+
+
+def stock_queryset(when, items=None):
+    """Annotate items with their stock as of a moment.
+
+    Args:
+        when (datetime): The moment, movements at that exact time included.
+        items (QuerySet): The items to annotate; every item by default.
+
+    Returns:
+        QuerySet: The items with a `stock` annotation, the balance of the
+        ledger at that moment, and `moved`, whether they moved since their
+        latest snapshot.
+    """
+
+    snapshots = (StockSnapshot.objects
+                 .filter(item=OuterRef('pk'), taken__lte=when)
+                 .order_by('-taken'))
+    since_snapshot = StockMovement.objects.filter(
+        item=OuterRef('pk'), added__gt=OuterRef('snapshot_taken'), added__lte=when)
+    moved = (since_snapshot
+             .order_by()
+             .values('item')
+             .annotate(total=Sum('quantity'))
+             .values('total'))
+
+    return ((items if items is not None else Item.objects.all())
+            .annotate(
+                snapshot_taken=Coalesce(Subquery(snapshots.values('taken')[:1]),
+                                        Value(EPOCH, output_field=DateTimeField())),
+                snapshot_amount=Coalesce(Subquery(snapshots.values('amount')[:1]),
+                                         Value(Decimal(0)), output_field=AMOUNT_FIELD))
+            .annotate(
+                stock=F('snapshot_amount') + Coalesce(Subquery(moved, output_field=AMOUNT_FIELD),
+                                                      Value(Decimal(0)), output_field=AMOUNT_FIELD),
+                moved=Exists(since_snapshot)))
+
+
+def stock_as_of(when, item_ids=None):
+    """Compute the stock of items at a moment from the snapshots and the ledger.
+
+    Args:
+        when (datetime): The moment, movements at that exact time included.
+        item_ids (iterable): The primary keys of the items; every item by default.
+
+    Returns:
+        dict: Maps item primary keys to their stock at that moment.
+    """
+
+    if item_ids is None:
+        chunks = [stock_queryset(when)]
+    else:
+        chunks = (stock_queryset(when, Item.objects.filter(pk__in=chunk))
+                  for chunk in batched(item_ids, STOCK_LEDGER_BATCH_SIZE))
+    stock = {}
+    for items in chunks:
+        stock.update((pk, Decimal(amount).quantize(STOCK_PLACES))
+                     for pk, amount in items.values_list('pk', 'stock').order_by())
+    return stock
+
+
+def reconcile_stock(item_ids, kind=StockMovement.ADJUSTMENT):
+    """Record the movements explaining amounts written directly to items.
+
+    Used after `Item.amount` was set outright, by a save or a bulk import, so
+    the ledger keeps adding up to it.
+
+    Args:
+        item_ids (iterable): The primary keys of the items written.
+        kind (str): The kind of the movements recorded.
+
+    Returns:
+        dict: Maps the primary key of each item adjusted to its change.
+    """
+
+    now = timezone.now()
+    movements = []
+    for chunk in batched(item_ids, STOCK_LEDGER_BATCH_SIZE):
+        balances = (stock_queryset(now, Item.objects.filter(pk__in=chunk))
+                    .values_list('pk', 'amount', 'stock')
+                    .order_by())
+        movements.extend(
+            StockMovement(item_id=pk, kind=kind, added=now,
+                          quantity=(amount or Decimal(0)) - Decimal(stock).quantize(STOCK_PLACES))
+            for pk, amount, stock in balances)
+    return record_movements(movements, update_stock=False)
+
+
+def settled(when=None):
+    """Return a moment no later than STOCK_SNAPSHOT_MARGIN seconds ago, that ago by default."""
+    latest = timezone.now() - datetime.timedelta(seconds=STOCK_SNAPSHOT_MARGIN)
+    return min(when, latest) if when else latest
+
+
+def take_snapshot(when=None, batch_size=None):
+    """Record the stock as of a moment of every item that moved since its latest snapshot.
+
+    Args:
+        when (datetime): The moment counted, at most STOCK_SNAPSHOT_MARGIN
+            seconds ago, which is the default.
+        batch_size (int): The number of snapshots inserted per query;
+            STOCK_LEDGER_BATCH_SIZE by default.
+
+    Returns:
+        int: The number of snapshots written.
+    """
+
+    when = settled(when)
+    # Read every balance before inserting into the table they are computed from
+    balances = list(stock_queryset(when)
+                    .filter(moved=True)
+                    .values_list('pk', 'stock')
+                    .order_by('pk'))
+    rows = [StockSnapshot(item_id=pk, taken=when, amount=Decimal(stock).quantize(STOCK_PLACES))
+            for pk, stock in balances]
+
+    with transaction.atomic():
+        for batch in batched(rows, batch_size or STOCK_LEDGER_BATCH_SIZE):
+            StockSnapshot.objects.bulk_create(batch)
+    return len(rows)
+
+
+def compact_ledger(before=None, batch_size=None):
+    """Fold old movements into snapshots and delete them.
+
+    Args:
+        before (datetime): Movements at or before this moment are folded, at most
+            STOCK_SNAPSHOT_MARGIN seconds ago; STOCK_LEDGER_RETENTION_DAYS ago by default.
+        batch_size (int): The number of snapshots inserted per query.
+
+    Returns:
+        tuple: The number of snapshots written and of movements deleted.
+    """
+
+    before = settled(before or timezone.now() - datetime.timedelta(days=STOCK_LEDGER_RETENTION_DAYS))
+    with transaction.atomic():
+        written = take_snapshot(before, batch_size)
+        deleted = StockMovement.objects.filter(added__lte=before).delete()[0]
+    return written, deleted
+
+
+def receive_stock(quantities, kind=StockMovement.RECEIPT):
+    """Add quantities to the stock of items, e.g. for a delivery.
+
+    Args:
+        quantities (dict): Maps item primary keys to the quantity received.
+        kind (str): The kind of the movements recorded.
+
+    Returns:
+        dict: Maps the primary key of each item moved to its change.
+    """
+
+    return record_movements(StockMovement(item_id=item_id, kind=kind, quantity=quantity)
+                            for item_id, quantity in quantities.items())
@@ -0,0 +1,92 @@
+"""Benchmark concurrent production recording"""
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from apps.category.models import Category
+from apps.production.bom import ensure_bom_roots
+from apps.production.inventory import record_production
+from apps.production.models import Component, Item, Product, Production
+
+
+class Command(BaseCommand):
+    help = ('Submit productions in parallel against a throwaway catalog sharing the same '
+            'items, and report throughput, latency and whether the final stock is exact.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--productions', type=int, default=200)
+        parser.add_argument('--products', type=int, default=20)
+        parser.add_argument('--items', type=int, default=50)
+
+    def handle(self, *args, **options):
+        products, items = self.create_catalog(options['products'], options['items'])
+        start_stock = dict(Item.objects.filter(pk__in=items).values_list('pk', 'amount'))
+        plans = [{products[(n + k) % len(products)]: 1 + k for k in range(3)}
+                 for n in range(options['productions'])]
+
+        def submit(plan):
+            began = time.perf_counter()
+            try:
+                record_production(plan)
+            finally:
+                connection.close()
+            return time.perf_counter() - began
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            latencies = sorted(pool.map(submit, plans))
+        elapsed = time.perf_counter() - start
+
+        expected = dict(start_stock)
+        for plan in plans:
+            for product_id, units in plan.items():
+                for item_id, amount in Component.objects.filter(
+                        product=product_id).values_list('item_id', 'amount'):
+                    expected[item_id] -= amount * units
+        final_stock = dict(Item.objects.filter(pk__in=items).values_list('pk', 'amount'))
+        exact = final_stock == expected
+
+        self.delete_catalog()
+
+        self.stdout.write(
+            f'{len(plans)} productions with {options["workers"]} workers in {elapsed:.2f}s '
+            f'({len(plans) / elapsed:.1f}/s)\n'
+            f'latency p50 {statistics.median(latencies) * 1000:.1f}ms, '
+            f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms, '
+            f'max {latencies[-1] * 1000:.1f}ms')
+        if exact:
+            self.stdout.write(self.style.SUCCESS('Final stock matches the expected consumption'))
+        else:
+            self.stdout.write(self.style.ERROR('Final stock does not match the expected consumption'))
+
+    @transaction.atomic
+    def create_catalog(self, product_count, item_count):
+        category = Category.objects.create(name='Benchmark', slug='bench-consumption')
+        items = Item.objects.bulk_create([
+            Item(name=f'Bench item {i}', slug=f'bench-item-{i}', price=1,
+                 amount=Decimal(10 ** 5), measurement_unit='kg', category=category)
+            for i in range(item_count)
+        ])
+        products = Product.objects.bulk_create([
+            Product(name=f'Bench product {p}', slug=f'bench-product-{p}', units=1, category=category)
+            for p in range(product_count)
+        ])
+        Component.objects.bulk_create([
+            Component(product=product, item=items[(p * 7 + k) % item_count], amount=Decimal('0.5'))
+            for p, product in enumerate(products)
+            for k in range(5)
+        ])
+        ensure_bom_roots(product.pk for product in products)
+        return [product.pk for product in products], [item.pk for item in items]
+
+    @transaction.atomic
+    def delete_catalog(self):
+        Production.objects.filter(productiondetail__product__slug__startswith='bench-product-').delete()
+        Product.objects.filter(slug__startswith='bench-product-').delete()
+        Item.objects.filter(slug__startswith='bench-item-').delete()
+        Category.objects.filter(slug='bench-consumption').delete()
@@ -0,0 +1,142 @@
+"""Load test a page under WSGI and ASGI servers"""
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+
+SERVERS = {
+    'wsgi': ['core.wsgi:application'],
+    'asgi': ['core.asgi:application', '--worker-class', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def percentile(latencies, fraction):
+    """Return a percentile of sorted latencies, in milliseconds."""
+    index = min(len(latencies) - 1, int(len(latencies) * fraction))
+    return latencies[index] * 1000
+
+
+class Command(BaseCommand):
+    help = ('Start gunicorn with the threaded (gthread, WSGI) workers of gunicorn.conf.py '
+            'and/or uvicorn (ASGI) workers and measure the latency percentiles of an '
+            'authenticated page under concurrent load.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=('wsgi', 'asgi', 'both'), default='both')
+        parser.add_argument('--path', default='/', help='The page to request.')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--workers', type=int, default=2, help='Server worker processes.')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this file.')
+
+    def handle(self, *args, **options):
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self.login()}'
+        servers = ['wsgi', 'asgi'] if options['server'] == 'both' else [options['server']]
+
+        results = {}
+        for server in servers:
+            process = self.start(server, options['port'], options['workers'])
+            try:
+                self.get(options['port'], options['path'], cookie)  # warm up
+                results[server] = self.load(options, cookie)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+        for server, result in results.items():
+            self.stdout.write(
+                f'{server}: {result["requests"]} requests in {result["seconds"]:.2f}s '
+                f'({result["throughput"]:.1f}/s), p50 {result["p50_ms"]:.1f}ms, '
+                f'p90 {result["p90_ms"]:.1f}ms, p99 {result["p99_ms"]:.1f}ms, '
+                f'{result["errors"]} errors')
+        if options['json_path']:
+            with open(options['json_path'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+    def login(self):
+        """Create a session for a benchmark user and return its key."""
+        user, created = User.objects.get_or_create(username='bench-http')
+        if created:
+            user.set_unusable_password()
+            user.save()
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
+
+    def start(self, server, port, workers):
+        """Start gunicorn and wait until it accepts connections."""
+        command = [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+                   '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+                   '--log-level', 'warning', *SERVERS[server]]
+        process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=os.environ.copy())
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'The {server} server exited with code {process.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return process
+            except OSError:
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError(f'The {server} server did not start')
+
+    def get(self, port, path, cookie, connection=None):
+        """Request a page and return its status and latency in seconds."""
+        connection = connection or http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        began = time.perf_counter()
+        connection.request('GET', path, headers={'Cookie': cookie})
+        response = connection.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - began
+
+    def load(self, options, cookie):
+        """Send the requests from concurrent clients and summarize the latencies."""
+        per_client = max(1, options['requests'] // options['concurrency'])
+
+        def client(_):
+            connection = http.client.HTTPConnection('127.0.0.1', options['port'], timeout=60)
+            samples = []
+            for _ in range(per_client):
+                try:
+                    samples.append(self.get(options['port'], options['path'], cookie, connection))
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    samples.append((None, 0))
+            connection.close()
+            return samples
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            samples = [sample for batch in pool.map(client, range(options['concurrency']))
+                       for sample in batch]
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for status, latency in samples if status == 200)
+        if not latencies:
+            raise CommandError('Every request failed')
+        return {
+            'requests': len(samples),
+            'errors': len(samples) - len(latencies),
+            'seconds': elapsed,
+            'throughput': len(samples) / elapsed,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p90_ms': percentile(latencies, 0.90),
+            'p99_ms': percentile(latencies, 0.99),
+        }
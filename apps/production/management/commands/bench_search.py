@@ -0,0 +1,68 @@
+"""Benchmark catalog search latency"""
+import random
+import statistics
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.production.models import SearchDocument
+from apps.production.search import search
+
+
+class Command(BaseCommand):
+    help = ('Fill the search index with throwaway documents, run typeahead queries '
+            '(word prefixes of growing length) and report their latency percentiles.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--vocabulary', type=int, default=5000,
+                            help='Number of distinct words the names are built from.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        words = [''.join(generator.choices(string.ascii_lowercase, k=generator.randint(4, 9)))
+                 for _ in range(options['vocabulary'])]
+
+        start = time.perf_counter()
+        self.create_documents(generator, words, options['documents'])
+        self.stdout.write(f'Indexed {options["documents"]} documents in '
+                          f'{time.perf_counter() - start:.2f}s')
+
+        latencies = []
+        try:
+            for _ in range(options['queries']):
+                first, second = generator.sample(words, 2)
+                query = f'{first} {second[:generator.randint(2, len(second))]}'
+                began = time.perf_counter()
+                search(query, limit=10)
+                latencies.append(time.perf_counter() - began)
+        finally:
+            self.delete_documents()
+
+        latencies.sort()
+        self.stdout.write(
+            f'{len(latencies)} queries: p50 {statistics.median(latencies) * 1000:.1f}ms, '
+            f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms, '
+            f'max {latencies[-1] * 1000:.1f}ms')
+
+    @transaction.atomic
+    def create_documents(self, generator, words, count):
+        batch = []
+        for n in range(count):
+            batch.append(SearchDocument(
+                kind='item', slug=f'bench-search-{n}',
+                name=' '.join(generator.choices(words, k=3)),
+                description=' '.join(generator.choices(words, k=8)),
+                category_name=generator.choice(words)))
+            if len(batch) == 5000:
+                SearchDocument.objects.bulk_create(batch)
+                batch = []
+        SearchDocument.objects.bulk_create(batch)
+
+    @transaction.atomic
+    def delete_documents(self):
+        SearchDocument.objects.filter(slug__startswith='bench-search-').delete()
@@ -0,0 +1,42 @@
+"""Fold old stock movements into snapshots"""
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.production import tasks
+from apps.production.ledger import STOCK_LEDGER_RETENTION_DAYS, compact_ledger, take_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Fold the stock movements older than the retention window into per-item snapshots '
+            'and delete them, so the stock as of any date is read from the nearest snapshot '
+            'plus few movements. Run it nightly.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=STOCK_LEDGER_RETENTION_DAYS,
+                            help='Days of movements kept in the ledger.')
+        parser.add_argument('--snapshot-only', action='store_true',
+                            help='Snapshot the stock as of STOCK_SNAPSHOT_MARGIN seconds ago, without '
+                                 'deleting any movement.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--background', action='store_true',
+                            help='Queue the compaction for the job workers.')
+
+    def handle(self, *args, **options):
+        if options['background']:
+            job = tasks.compact_stock_ledger.enqueue(options['keep_days'])
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.pk}'))
+            return
+
+        start = time.perf_counter()
+        if options['snapshot_only']:
+            written, deleted = take_snapshot(batch_size=options['batch_size']), 0
+        else:
+            before = timezone.now() - datetime.timedelta(days=options['keep_days'])
+            written, deleted = compact_ledger(before, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} snapshots and deleted {deleted} movements in {elapsed:.2f}s'))
@@ -0,0 +1,57 @@
+"""Export productions and inventory to CSV or JSONL files"""
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.production.exporting import EXPORT_COLUMNS, export_stream, open_export, parse_bound
+from apps.production.tasks import export_data as export_task
+
+
+class Command(BaseCommand):
+    help = 'Stream the production history or the item inventory to a CSV or JSONL file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORT_COLUMNS))
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+        parser.add_argument('--since', help='Only export rows added on or after this ISO date.')
+        parser.add_argument('--until', help='Only export rows added before this ISO date.')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output.')
+        parser.add_argument('--output', '-o', help='The output file; stdout by default.')
+        parser.add_argument('--background', action='store_true',
+                            help='Queue the export for the job workers; requires --output.')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_bound(options['since'])
+            until = parse_bound(options['until'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        if options['background']:
+            if not options['output']:
+                raise CommandError('--background requires --output')
+            job = export_task.enqueue(options['dataset'], options['format'],
+                                      os.path.abspath(options['output']), options['since'],
+                                      options['until'], options['gzip'])
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.pk}'))
+            return
+
+        chunks = export_stream(options['dataset'], options['format'],
+                               since, until, options['gzip'])
+
+        start = time.perf_counter()
+        if options['output']:
+            with open_export(options['output'], options['gzip']) as output:
+                written = sum(output.write(chunk) for chunk in chunks)
+        else:
+            output = sys.stdout.buffer if options['gzip'] else sys.stdout
+            written = sum(output.write(chunk) for chunk in chunks)
+            output.flush()
+        elapsed = time.perf_counter() - start
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Exported {options["dataset"]} to {options["output"]} '
+                f'({written} {"bytes" if options["gzip"] else "characters"}) in {elapsed:.2f}s'))
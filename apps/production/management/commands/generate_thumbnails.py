@@ -0,0 +1,60 @@
+"""Generate thumbnail derivatives for existing media"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.category.models import Category
+from apps.production.models import Item, Product
+from apps.production.tasks import record_thumbnails
+from core.thumbnails import generate_derivatives
+
+
+def _setup_worker():
+    django.setup()
+
+
+def _generate(task):
+    name, overwrite = task
+    try:
+        return name, len(generate_derivatives(name, overwrite=overwrite)), None
+    except Exception as error:
+        return name, 0, str(error)
+
+
+class Command(BaseCommand):
+    help = 'Backfill the resized derivatives of every Category, Item and Product thumbnail.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes; one per CPU by default.')
+        parser.add_argument('--overwrite', action='store_true',
+                            help='Regenerate derivatives that already exist.')
+
+    def handle(self, *args, **options):
+        names = set()
+        for model in (Category, Item, Product):
+            names.update(model.objects.exclude(thumbnail='').values_list('thumbnail', flat=True))
+        # Worker processes only touch storage, they must not share our connections
+        connections.close_all()
+
+        start = time.perf_counter()
+        written = failed = 0
+        generated = []
+        tasks = [(name, options['overwrite']) for name in sorted(names)]
+        with ProcessPoolExecutor(max_workers=options['processes'], initializer=_setup_worker) as pool:
+            for name, count, error in pool.map(_generate, tasks, chunksize=16):
+                written += count
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                else:
+                    generated.append(name)
+        record_thumbnails(generated)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(tasks)} images in {elapsed:.2f}s: '
+            f'{written} derivatives written, {failed} failed'))
@@ -0,0 +1,54 @@
+"""Import items, products and components from CSV or JSONL files"""
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.production.importing import IMPORT_FIELDS, import_catalog, read_rows
+from apps.production.tasks import import_catalog as import_task
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or JSONL file of items, products or components into the catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The CSV or JSONL file to import.')
+        parser.add_argument('--model', choices=sorted(IMPORT_FIELDS), required=True,
+                            help='The kind of rows in the file.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='The file format; guessed from the extension by default.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows validated and written per transaction.')
+        parser.add_argument('--rejected', help='Where to write rejected rows as JSONL. '
+                                               'Defaults to <path>.rejected.jsonl.')
+        parser.add_argument('--background', action='store_true',
+                            help='Queue the import for the job workers, which must be able to '
+                                 'read the file; rejected rows go to <path>.rejected.jsonl.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if options['background']:
+            job = import_task.enqueue(options['model'], os.path.abspath(path), options['format'],
+                                      options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.pk}'))
+            return
+        rejected_path = options['rejected'] or f'{path}.rejected.jsonl'
+
+        start = time.perf_counter()
+        try:
+            with open(rejected_path, 'w', encoding='utf-8') as rejected:
+                stats = import_catalog(
+                    options['model'],
+                    read_rows(path, options['format']),
+                    batch_size=options['batch_size'],
+                    rejected=rejected)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {stats.read} rows in {elapsed:.2f}s '
+            f'({stats.read / elapsed if elapsed else 0:.0f} rows/s): '
+            f'{stats.created} created, {stats.updated} updated, {stats.rejected} rejected'))
+        if stats.rejected:
+            self.stdout.write(self.style.WARNING(f'Rejected rows written to {rejected_path}'))
@@ -0,0 +1,54 @@
+"""Report the cost impact of a supplier price feed"""
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from apps.production.impact import price_impact, resolve_prices
+from apps.production.importing import read_rows
+
+
+class Command(BaseCommand):
+    help = ('Read new item prices from a CSV or JSONL file with `slug` and `price` columns '
+            'and report the products and open productions whose cost would move. '
+            'Prices are not saved; import the file with import_catalog to apply them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The CSV or JSONL price feed.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='The file format; guessed from the extension by default.')
+        parser.add_argument('--output', help='Write the full report as JSON to this file.')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Number of products and productions listed, largest change first.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        prices = {}
+        try:
+            for line, row in read_rows(options['path'], options['format']):
+                try:
+                    prices[row['slug']] = Decimal(str(row['price']))
+                except (KeyError, TypeError, InvalidOperation):
+                    raise CommandError(f'Line {line}: expected a slug and a price')
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        prices, unknown = resolve_prices(prices)
+        report = price_impact(prices)
+        elapsed = time.perf_counter() - start
+
+        if unknown:
+            self.stdout.write(self.style.WARNING(f'Skipped {len(unknown)} unknown items'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(prices)} prices affect {len(report["products"])} products and '
+            f'{len(report["productions"])} open productions ({elapsed:.2f}s)'))
+        for line in report['products'][:options['top']]:
+            self.stdout.write(f'  product {line["slug"]}: {line["delta"]:+} per unit')
+        for line in report['productions'][:options['top']]:
+            self.stdout.write(f'  production {line["uid"]}: {line["delta"]:+}')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, cls=DjangoJSONEncoder, indent=2)
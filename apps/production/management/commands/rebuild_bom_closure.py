@@ -0,0 +1,20 @@
+"""Rebuild the BOM closure table"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.production.bom import rebuild_closure
+
+
+class Command(BaseCommand):
+    help = ('Recompute the BOM closure of every product from the sub-assembly links. '
+            'Signals keep it current; run this after changing sub-assemblies with raw '
+            'SQL, bulk_create or queryset updates.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = rebuild_closure()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} closure rows in {elapsed:.2f}s'))
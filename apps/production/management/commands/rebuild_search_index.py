@@ -0,0 +1,23 @@
+"""Rebuild the catalog search index"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.production.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = ('Recreate the search documents of every category, item and product. '
+            'Signals and the catalog importer keep them current; run this after '
+            'changing the catalog with raw SQL or queryset updates.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = rebuild_index(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {written} documents in {elapsed:.2f}s'))
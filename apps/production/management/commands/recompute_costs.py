@@ -0,0 +1,35 @@
+"""Recompute product and production costs"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.production import tasks
+from apps.production.costing import recompute_costs
+from apps.production.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute the unit cost of stale products and the cost of the productions using them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Reprice every product, not only the stale ones.')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of products priced per transaction.')
+        parser.add_argument('--background', action='store_true',
+                            help='Queue the recomputation for the job workers.')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            Product.objects.update(cost_stale=True)
+        if options['background']:
+            job = tasks.recompute_costs.enqueue()
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.pk}'))
+            return
+
+        start = time.perf_counter()
+        priced = recompute_costs(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Priced {priced} products in {elapsed:.2f}s'))
@@ -0,0 +1,49 @@
+"""Rebuild the daily production rollups"""
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.production import tasks
+from apps.production.reporting import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the daily production rollups read by the production reports. '
+            'Signals keep them current; run this after bulk changes or periodically.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild (YYYY-MM-DD); all history by default.')
+        parser.add_argument('--until', help='Last day to rebuild (YYYY-MM-DD); all history by default.')
+        parser.add_argument('--days', type=int,
+                            help='Rebuild only the last N days, e.g. from a nightly job.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--background', action='store_true',
+                            help='Queue the rebuild for the job workers.')
+
+    def handle(self, *args, **options):
+        since, until = (self.parse(options[name]) for name in ('since', 'until'))
+        if options['days']:
+            since = timezone.localdate() - datetime.timedelta(days=options['days'] - 1)
+
+        if options['background']:
+            job = tasks.rebuild_rollups.enqueue(since and since.isoformat(), until and until.isoformat())
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.pk}'))
+            return
+
+        start = time.perf_counter()
+        written = rebuild_rollups(since, until, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} rollup rows in {elapsed:.2f}s'))
+
+    def parse(self, value):
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        return day
@@ -0,0 +1,69 @@
+"""Run the benchmark suite"""
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from apps.production.benchmarks import BENCHMARKS, run_benchmarks
+from apps.production.models import Component, Item, Product, Production, ProductionDetail
+
+
+def current_commit():
+    """Return the checked out git commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the dashboard, admin changelists, cost rollup, exports, reports and '
+            'search on the current database and record latency, query count and peak '
+            'memory as JSON, optionally compared with an earlier run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                            help=f'Benchmarks to run: {", ".join(BENCHMARKS)}. All by default.')
+        parser.add_argument('--repeats', type=int, default=10)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='A JSON file from an earlier run to compare with.')
+
+    def handle(self, *args, **options):
+        unknown = sorted(set(options['benchmarks']) - set(BENCHMARKS))
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(unknown)}')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as source:
+                baseline = json.load(source)['benchmarks']
+
+        run = {
+            'commit': current_commit(),
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {model._meta.model_name: model.objects.count()
+                        for model in (Item, Product, Component, Production, ProductionDetail)},
+            'benchmarks': run_benchmarks(options['benchmarks'], options['repeats']),
+        }
+
+        for name, result in run['benchmarks'].items():
+            line = (f'{name:<20} median {result["median_ms"]:>9.2f}ms  p95 {result["p95_ms"]:>9.2f}ms  '
+                    f'{result["queries"]:>5} queries  {result["peak_memory_kib"]:>9.1f}KiB')
+            if baseline and name in baseline:
+                change = result['median_ms'] / baseline[name]['median_ms'] - 1
+                queries = result['queries'] - baseline[name]['queries']
+                line += f'  ({change:+.0%} time, {queries:+d} queries)'
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(run, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
@@ -0,0 +1,59 @@
+"""Plan the production of a demand as draft productions"""
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.production.importing import read_rows
+from apps.production.scheduling import resolve_demand, schedule_production, write_schedule
+
+
+class Command(BaseCommand):
+    help = ('Read a demand from a CSV or JSONL file with `slug` and `units` columns, plan it '
+            'over the coming days within the stock on hand and the line capacities, and save '
+            'the plan as draft productions, one per day. Release them from the admin.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The CSV or JSONL demand.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='The file format; guessed from the extension by default.')
+        parser.add_argument('--start', type=datetime.date.fromisoformat,
+                            help='The first day planned, as YYYY-MM-DD; tomorrow by default.')
+        parser.add_argument('--days', type=int, help='The number of days planned.')
+        parser.add_argument('--line-capacity', type=int,
+                            help='The units a day produced across every product.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the plan without saving it.')
+
+    def handle(self, *args, **options):
+        began = time.perf_counter()
+        demand = {}
+        try:
+            for line, row in read_rows(options['path'], options['format']):
+                try:
+                    demand[row['slug']] = demand.get(row['slug'], 0) + int(row['units'])
+                except (KeyError, TypeError, ValueError):
+                    raise CommandError(f'Line {line}: expected a slug and a number of units')
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        demand, unknown = resolve_demand(demand)
+        schedule = schedule_production(demand, start=options['start'], days=options['days'],
+                                       line_capacity=options['line_capacity'])
+        elapsed = time.perf_counter() - began
+
+        if unknown:
+            self.stdout.write(self.style.WARNING(f'Skipped {len(unknown)} unknown products'))
+        reasons = list(schedule['reasons'].values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Planned {sum(schedule["scheduled"].values())} of {sum(demand.values())} units '
+            f'over {len(schedule["days"])} days ({elapsed:.2f}s)'))
+        if schedule['unscheduled']:
+            self.stdout.write(
+                f'  {sum(schedule["unscheduled"].values())} units left out: '
+                f'{reasons.count("stock")} products short of stock, '
+                f'{reasons.count("capacity")} short of capacity')
+
+        if not options['dry_run']:
+            productions = write_schedule(schedule)
+            self.stdout.write(self.style.SUCCESS(f'Saved {len(productions)} draft productions'))
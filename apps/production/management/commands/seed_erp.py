@@ -0,0 +1,36 @@
+"""Seed a synthetic ERP dataset"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.production.seeding import SCALES, clear_seed, seed_erp
+
+
+class Command(BaseCommand):
+    help = ('Generate categories, items, products with their components and a production '
+            'history with bulk inserts. Start from a --scale preset and override any count.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small')
+        for name in SCALES['small']:
+            parser.add_argument(f'--{name}', type=int, help=f'Override the number of {name}.')
+        parser.add_argument('--days', type=int, default=3 * 365,
+                            help='Days of production history.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete the previously seeded rows first.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.stdout.write(f'Deleted {clear_seed()} seeded rows')
+
+        sizes = {name: options[name] if options[name] is not None else default
+                 for name, default in SCALES[options['scale']].items()}
+        start = time.perf_counter()
+        counts = seed_erp(**sizes, days=options['days'], seed=options['seed'],
+                          batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Seeded {summary} in {elapsed:.2f}s'))
@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-18 10:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0003_alter_item_added_alter_product_added_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='cost_stale',
+            field=models.BooleanField(db_index=True, default=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='product_cost',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='production',
+            name='production_cost',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='productiondetail',
+            name='production_cost',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=16, null=True),
+        ),
+    ]
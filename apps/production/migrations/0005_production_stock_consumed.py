@@ -0,0 +1,25 @@
+# Generated by Django 5.0 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0004_product_cost'),
+    ]
+
+    operations = [
+        # Existing productions were reconciled outside the app, so they are
+        # added as already consumed
+        migrations.AddField(
+            model_name='production',
+            name='stock_consumed',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='production',
+            name='stock_consumed',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
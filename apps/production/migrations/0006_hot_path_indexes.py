@@ -0,0 +1,95 @@
+# Generated by Django 5.0 on 2026-10-18 10:12
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+TRIGRAM_INDEXES = (
+    ('production_item_name_trgm_idx', 'production_item'),
+    ('production_product_name_trgm_idx', 'production_product'),
+    ('category_category_name_trgm_idx', 'category_category'),
+)
+
+
+def merge_duplicate_components(apps, schema_editor):
+    """Fold components repeating a product/item pair into one row before adding the constraint."""
+    Component = apps.get_model('production', 'Component')
+    duplicates = (Component.objects
+                  .values('product', 'item')
+                  .annotate(rows=Count('uid'), total=Sum('amount'))
+                  .filter(rows__gt=1))
+    for duplicate in duplicates:
+        components = Component.objects.filter(product=duplicate['product'], item=duplicate['item'])
+        keep = components.order_by('uid').first()
+        components.exclude(pk=keep.pk).delete()
+        Component.objects.filter(pk=keep.pk).update(amount=duplicate['total'])
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Index names for `ILIKE '%term%'` searches; PostgreSQL only."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (name gin_trgm_ops)')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('category', '0001_initial'),
+        ('production', '0005_production_stock_consumed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['-added', '-uid'], name='item_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', '-added'], name='item_category_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['name'], name='item_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-added', '-uid'], name='product_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-added'], name='product_category_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='product_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='production',
+            index=models.Index(fields=['-added', '-uid'], name='production_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productiondetail',
+            index=models.Index(fields=['production', 'product'], name='detail_production_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productiondetail',
+            index=models.Index(fields=['product', 'production'], name='detail_product_production_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_components, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='component',
+            constraint=models.UniqueConstraint(fields=('product', 'item'), name='component_product_item_unique'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
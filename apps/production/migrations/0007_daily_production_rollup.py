@@ -0,0 +1,54 @@
+# Generated by Django 5.0 on 2026-10-18 10:23
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """Sum the existing production details into daily rollup rows."""
+    DailyProductionRollup = apps.get_model('production', 'DailyProductionRollup')
+    ProductionDetail = apps.get_model('production', 'ProductionDetail')
+    totals = (ProductionDetail.objects
+              .annotate(day=TruncDate('production__added'))
+              .values('day', 'product_id', 'product__category_id')
+              .annotate(units=Sum('produced_units'))
+              .order_by())
+    DailyProductionRollup.objects.bulk_create(
+        (DailyProductionRollup(day=row['day'],
+                               product_id=row['product_id'],
+                               category_id=row['product__category_id'],
+                               produced_units=row['units'])
+         for row in totals.iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('category', '0001_initial'),
+        ('production', '0006_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProductionRollup',
+            fields=[
+                ('uid', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, unique=True)),
+                ('day', models.DateField()),
+                ('produced_units', models.PositiveBigIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='category.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='production.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'day'], name='rollup_product_day_idx'), models.Index(fields=['category', 'day'], name='rollup_category_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyproductionrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'product'), name='rollup_day_product_unique'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.0 on 2026-10-18 10:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SQLITE_INDEX = (
+    "CREATE VIRTUAL TABLE production_searchdocument_fts USING fts5("
+    "name, description, category_name, "
+    "content='production_searchdocument', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER production_searchdocument_fts_insert AFTER INSERT ON production_searchdocument BEGIN "
+    "INSERT INTO production_searchdocument_fts(rowid, name, description, category_name) "
+    "VALUES (new.id, new.name, new.description, new.category_name); END",
+    "CREATE TRIGGER production_searchdocument_fts_delete AFTER DELETE ON production_searchdocument BEGIN "
+    "INSERT INTO production_searchdocument_fts(production_searchdocument_fts, rowid, name, description, category_name) "
+    "VALUES ('delete', old.id, old.name, old.description, old.category_name); END",
+    "CREATE TRIGGER production_searchdocument_fts_update AFTER UPDATE ON production_searchdocument BEGIN "
+    "INSERT INTO production_searchdocument_fts(production_searchdocument_fts, rowid, name, description, category_name) "
+    "VALUES ('delete', old.id, old.name, old.description, old.category_name); "
+    "INSERT INTO production_searchdocument_fts(rowid, name, description, category_name) "
+    "VALUES (new.id, new.name, new.description, new.category_name); END",
+)
+
+SQLITE_DROP = (
+    'DROP TRIGGER IF EXISTS production_searchdocument_fts_insert',
+    'DROP TRIGGER IF EXISTS production_searchdocument_fts_delete',
+    'DROP TRIGGER IF EXISTS production_searchdocument_fts_update',
+    'DROP TABLE IF EXISTS production_searchdocument_fts',
+)
+
+POSTGRESQL_INDEX = (
+    "ALTER TABLE production_searchdocument ADD COLUMN document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', name), 'A') || "
+    "setweight(to_tsvector('simple', description), 'B') || "
+    "setweight(to_tsvector('simple', category_name), 'C')) STORED",
+    'CREATE INDEX production_searchdocument_document_idx '
+    'ON production_searchdocument USING gin (document)',
+)
+
+POSTGRESQL_DROP = (
+    'DROP INDEX IF EXISTS production_searchdocument_document_idx',
+    'ALTER TABLE production_searchdocument DROP COLUMN IF EXISTS document',
+)
+
+
+def create_search_index(apps, schema_editor):
+    """Create the backend specific full-text index over the search documents."""
+    statements = {'sqlite': SQLITE_INDEX, 'postgresql': POSTGRESQL_INDEX}
+    for statement in statements.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}
+    for statement in statements.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(statement)
+
+
+def index_catalog(apps, schema_editor):
+    """Create the search documents of the existing categories, items and products."""
+    SearchDocument = apps.get_model('production', 'SearchDocument')
+    Category = apps.get_model('category', 'Category')
+    SearchDocument.objects.bulk_create(
+        (SearchDocument(kind='category', category_id=pk, slug=slug, name=name)
+         for pk, slug, name in Category.objects.values_list('pk', 'slug', 'name').iterator()),
+        batch_size=1000)
+    for kind in ('item', 'product'):
+        rows = (apps.get_model('production', kind)
+                .objects.values_list('pk', 'slug', 'name', 'description', 'category__name'))
+        SearchDocument.objects.bulk_create(
+            (SearchDocument(kind=kind, slug=slug, name=name, description=description or '',
+                            category_name=category_name, **{f'{kind}_id': pk})
+             for pk, slug, name, description, category_name in rows.iterator()),
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('category', '0001_initial'),
+        ('production', '0007_daily_production_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('slug', models.SlugField()),
+                ('name', models.CharField(max_length=255)),
+                ('description', models.CharField(blank=True, default='', max_length=300)),
+                ('category_name', models.CharField(blank=True, default='', max_length=255)),
+                ('category', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='category.category')),
+                ('item', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='production.item')),
+                ('product', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='production.product')),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(index_catalog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0 on 2026-10-18 10:35
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+def link_products_to_themselves(apps, schema_editor):
+    """Create the reflexive closure row of every existing product."""
+    BomClosure = apps.get_model('production', 'BomClosure')
+    Product = apps.get_model('production', 'Product')
+    BomClosure.objects.bulk_create(
+        (BomClosure(ancestor_id=pk, descendant_id=pk, quantity=1, paths=1)
+         for pk in Product.objects.values_list('pk', flat=True).iterator()),
+        batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0008_catalog_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubAssembly',
+            fields=[
+                ('uid', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='used_in', to='production.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subassemblies', to='production.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BomClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=6, max_digits=24)),
+                ('paths', models.PositiveIntegerField(default=1)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bom_descendants', to='production.product')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bom_ancestors', to='production.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'ancestor'], name='bomclosure_descendant_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bomclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='bomclosure_ancestor_descendant_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='subassembly',
+            constraint=models.UniqueConstraint(fields=('product', 'component'), name='subassembly_product_component_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='subassembly',
+            constraint=models.CheckConstraint(check=models.Q(('product', models.F('component')), _negated=True), name='subassembly_not_self'),
+        ),
+        migrations.RunPython(link_products_to_themselves, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0009_bom_closure'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='component',
+            index=models.Index(fields=['item', 'product', 'amount'], name='component_item_product_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0010_component_where_used_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='daily_capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='production',
+            name='draft',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0 on 2026-10-18 10:56
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+def snapshot_current_stock(apps, schema_editor):
+    """Open the stock ledger of every item with a snapshot of its current amount."""
+    Item = apps.get_model('production', 'Item')
+    StockSnapshot = apps.get_model('production', 'StockSnapshot')
+    now = django.utils.timezone.now()
+    StockSnapshot.objects.bulk_create(
+        (StockSnapshot(item_id=pk, taken=now, amount=amount)
+         for pk, amount in Item.objects.exclude(amount=None).exclude(amount=0)
+         .values_list('pk', 'amount').iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0011_production_scheduling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('uid', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, unique=True)),
+                ('taken', models.DateTimeField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='production.item')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('uid', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, unique=True)),
+                ('kind', models.CharField(choices=[('receipt', 'Receipt'), ('consumption', 'Consumption'), ('adjustment', 'Adjustment')], max_length=16)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('added', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='production.item')),
+                ('production', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='production.production')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'added'], name='movement_item_added_idx'), models.Index(fields=['added'], name='movement_added_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('item', 'taken'), name='snapshot_item_taken_unique'),
+        ),
+        migrations.RunPython(snapshot_current_stock, migrations.RunPython.noop),
+    ]
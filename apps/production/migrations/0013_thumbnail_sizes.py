@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0012_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='thumbnail_sizes',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='thumbnail_sizes',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
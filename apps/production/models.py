@@ -2,11 +2,13 @@
 import datetime
 import uuid
 
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 from django.contrib import admin
 
 from apps.category.models import Category
+from core.thumbnails import thumbnail_url
 
 
 def item_directory_path(instance, filename):
@@ -47,19 +49,28 @@ class Item(models.Model):
     - slug: SlugField, a unique slug for the item.
     - description: CharField, a brief description of the item.
     - thumbnail: ImageField, an image representing the item.
+    - thumbnail_sizes: JSONField, the derivative sizes generated from the thumbnail, see `core.thumbnails`.
     - price: DecimalField, the price of the item.
-    - amount: DecimalField, the amount of the item.
+    - amount: DecimalField, the stock on hand, the balance of the stock ledger (see `StockMovement`).
     - measurement_unit: CharField, the unit of measurement for the item.
     - category: ForeignKey, links the item to a category.
     - added: DateTimeField, timestamp of when the item was added.
     """
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-added', '-uid'], name='item_added_idx'),
+            models.Index(fields=['category', '-added'], name='item_category_added_idx'),
+            models.Index(fields=['name'], name='item_name_idx'),
+        ]
+
     uid = models.UUIDField(
         default=uuid.uuid4, unique=True, primary_key=True)
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True)
     description = models.CharField(max_length=300, blank=True, null=True)
     thumbnail = models.ImageField(upload_to=item_directory_path)
+    thumbnail_sizes = models.JSONField(default=list, blank=True, editable=False)
     price = models.DecimalField(
         max_digits=11, decimal_places=2, blank=True, null=True)
     amount = models.DecimalField(
@@ -72,11 +83,51 @@ class Item(models.Model):
         """String representation of the Item."""
         return self.name
 
-    def get_thumbnail(self):
-        """Returns the URL of the item's thumbnail or an empty string if no thumbnail is available."""
-        if self.thumbnail:
-            return self.thumbnail.url
-        return ''
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded price, stock and thumbnail so saves can tell whether they changed."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_price = instance.__dict__.get('price')
+        instance._loaded_amount = instance.__dict__.get('amount')
+        instance._loaded_thumbnail = instance.__dict__.get('thumbnail')
+        return instance
+
+    def price_changed(self):
+        """
+        Checks if the price differs from the one loaded from the database.
+
+        Returns:
+            bool: True for new items or items whose price was modified, False otherwise.
+        """
+        return not hasattr(self, '_loaded_price') or self._loaded_price != self.price
+
+    def amount_changed(self):
+        """
+        Checks if the stock differs from the one loaded from the database.
+
+        Returns:
+            bool: True for new items or items whose amount was modified, False otherwise.
+        """
+        return not hasattr(self, '_loaded_amount') or self._loaded_amount != self.amount
+
+    def thumbnail_changed(self):
+        """
+        Checks if the thumbnail differs from the one loaded from the database.
+
+        Returns:
+            bool: True for new items or items whose thumbnail was replaced, False otherwise.
+        """
+        return not hasattr(self, '_loaded_thumbnail') or self._loaded_thumbnail != self.thumbnail.name
+
+    def get_thumbnail(self, size=None):
+        """
+        Returns the URL of the item's thumbnail or an empty string if no thumbnail is available.
+
+        Args:
+            size (str): A derivative size from THUMBNAIL_SIZES ('small', 'medium', 'large'),
+                or None for the original upload.
+        """
+        return thumbnail_url(self.thumbnail, size, self.thumbnail_sizes)
 
     @admin.display(
         boolean=True,
@@ -104,25 +155,41 @@ class Product(models.Model):
     - slug: SlugField, a unique slug for the product.
     - description: CharField, a brief description of the product.
     - thumbnail: ImageField, an image representing the product.
+    - thumbnail_sizes: JSONField, the derivative sizes generated from the thumbnail, see `core.thumbnails`.
     - price: DecimalField, the price of the product.
     - units: PositiveIntegerField, the number of units of the product.
     - composition: ManyToManyField, links the product to its components.
+    - product_cost: DecimalField, the cost of producing a unit, rolled up from its components.
+    - cost_stale: BooleanField, whether product_cost must be recomputed.
+    - daily_capacity: PositiveIntegerField, the units the line can produce per day, unlimited if empty.
     - category: ForeignKey, links the product to a category.
     - added: DateTimeField, timestamp of when the product was added.
     """
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-added', '-uid'], name='product_added_idx'),
+            models.Index(fields=['category', '-added'], name='product_category_added_idx'),
+            models.Index(fields=['name'], name='product_name_idx'),
+        ]
+
     uid = models.UUIDField(
         default=uuid.uuid4, unique=True, primary_key=True)
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True)
     description = models.CharField(max_length=300, blank=True, null=True)
     thumbnail = models.ImageField(upload_to=product_directory_path)
+    thumbnail_sizes = models.JSONField(default=list, blank=True, editable=False)
     price = models.DecimalField(
         max_digits=11, decimal_places=2, blank=True, null=True)
     units = models.PositiveIntegerField()
     composition = models.ManyToManyField(Item, through='Component')
     # Cost of producing a unit, based on items and other related parameters
-    # product_cost =
+    product_cost = models.DecimalField(
+        max_digits=14, decimal_places=2, blank=True, null=True, editable=False)
+    cost_stale = models.BooleanField(default=True, db_index=True, editable=False)
+    # Throughput of the product's line, used by the production scheduler
+    daily_capacity = models.PositiveIntegerField(blank=True, null=True)
     category = models.ForeignKey(Category, on_delete=models.PROTECT)
     added = models.DateTimeField(default=timezone.now)
 
@@ -130,11 +197,31 @@ class Product(models.Model):
         """String representation of the Product."""
         return self.name
 
-    def get_thumbnail(self):
-        """Returns the URL of the product's thumbnail or an empty string if no thumbnail is available."""
-        if self.thumbnail:
-            return self.thumbnail.url
-        return ''
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded thumbnail so saves can tell whether it changed."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_thumbnail = instance.__dict__.get('thumbnail')
+        return instance
+
+    def thumbnail_changed(self):
+        """
+        Checks if the thumbnail differs from the one loaded from the database.
+
+        Returns:
+            bool: True for new products or products whose thumbnail was replaced, False otherwise.
+        """
+        return not hasattr(self, '_loaded_thumbnail') or self._loaded_thumbnail != self.thumbnail.name
+
+    def get_thumbnail(self, size=None):
+        """
+        Returns the URL of the product's thumbnail or an empty string if no thumbnail is available.
+
+        Args:
+            size (str): A derivative size from THUMBNAIL_SIZES ('small', 'medium', 'large'),
+                or None for the original upload.
+        """
+        return thumbnail_url(self.thumbnail, size, self.thumbnail_sizes)
 
     @admin.display(
         boolean=True,
@@ -163,6 +250,15 @@ class Component(models.Model):
     - amount: DecimalField, the amount of the item in the component (per Kg).
     """
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'item'], name='component_product_item_unique'),
+        ]
+        indexes = [
+            # Where-used lookups read the products and amounts of an item from the index alone
+            models.Index(fields=['item', 'product', 'amount'], name='component_item_product_idx'),
+        ]
+
     uid = models.UUIDField(
         default=uuid.uuid4, unique=True, primary_key=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -175,6 +271,83 @@ class Component(models.Model):
         return f'{self.product.slug}__{self.item.slug}__relation'
 
 
+class SubAssembly(models.Model):
+    """
+    Represents a product used as a component of another product.
+
+    Attributes:
+    - uid: UUIDField, unique identifier for the sub-assembly.
+    - product: ForeignKey, the product being assembled.
+    - component: ForeignKey, the product used in it.
+    - amount: DecimalField, the units of the component per unit of the product.
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'component'], name='subassembly_product_component_unique'),
+            models.CheckConstraint(check=~models.Q(product=models.F('component')), name='subassembly_not_self'),
+        ]
+
+    uid = models.UUIDField(
+        default=uuid.uuid4, unique=True, primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='subassemblies')
+    component = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='used_in')
+    amount = models.DecimalField(max_digits=8, decimal_places=2)
+
+    def __str__(self):
+        """String representation of the SubAssembly."""
+        return f'{self.product_id}__{self.component_id}__subassembly'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded link so saves can undo it in the BOM closure."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_link = (instance.__dict__.get('product_id'),
+                                 instance.__dict__.get('component_id'),
+                                 instance.__dict__.get('amount'))
+        return instance
+
+    def clean(self):
+        """Reject links that would make a product part of itself."""
+        from .bom import creates_cycle
+
+        if self.product_id and self.component_id and creates_cycle(self.product_id, self.component_id):
+            raise ValidationError({'component': 'This product already contains the assembled product.'})
+
+
+class BomClosure(models.Model):
+    """
+    Represents a product reachable from another product through its sub-assemblies.
+
+    Every product is linked to itself, so the bill of materials of a product is
+    the components of all its descendants in a single join. Rows are maintained
+    incrementally by `apps.production.bom`.
+
+    Attributes:
+    - ancestor: ForeignKey, the assembled product.
+    - descendant: ForeignKey, a product used in it, directly or not, or itself.
+    - quantity: DecimalField, the units of the descendant per unit of the ancestor, over all paths.
+    - paths: PositiveIntegerField, the number of distinct paths from the ancestor to the descendant.
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='bomclosure_ancestor_descendant_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'ancestor'], name='bomclosure_descendant_idx'),
+        ]
+
+    ancestor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bom_descendants')
+    descendant = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bom_ancestors')
+    quantity = models.DecimalField(max_digits=24, decimal_places=6)
+    paths = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        """String representation of the BomClosure."""
+        return f'{self.ancestor_id}__{self.descendant_id}__closure'
+
+
 class Production(models.Model):
     """
     Represents a production process in the system.
@@ -182,19 +355,39 @@ class Production(models.Model):
     Attributes:
     - uid: UUIDField, unique identifier for the production.
     - products: ManyToManyField, links the production to its products.
-    - date: DateTimeField, timestamp of when the production occurred.
+    - production_cost: DecimalField, the total cost of the production.
+    - stock_consumed: BooleanField, whether the used items were taken out of stock.
+    - draft: BooleanField, whether the production is only planned, see `apps.production.scheduling`.
+    - added: DateTimeField, timestamp of when the production occurred, or is planned for.
     """
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-added', '-uid'], name='production_added_idx'),
+        ]
+
     uid = models.UUIDField(
         default=uuid.uuid4, unique=True, primary_key=True)
     products = models.ManyToManyField(Product, through='ProductionDetail')
     # total production cost
+    production_cost = models.DecimalField(
+        max_digits=16, decimal_places=2, blank=True, null=True, editable=False)
+    stock_consumed = models.BooleanField(default=False, editable=False)
+    # Drafts consume no stock and are left out of the reports until released
+    draft = models.BooleanField(default=False, editable=False)
     added = models.DateTimeField(default=timezone.now)
     
     def __str__(self):
         """String representation of the production"""
         return f'production_{self.uid}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded date so saves can tell whether it moved."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_added = instance.__dict__.get('added')
+        return instance
+
     @admin.display(
         boolean=True,
         ordering='added',
@@ -220,15 +413,183 @@ class ProductionDetail(models.Model):
     - production: ForeignKey, links the detail to a production.
     - product: ForeignKey, links the detail to a product.
     - produced_units: PositiveIntegerField, the number of units produced.
+    - production_cost: DecimalField, the cost of the produced units.
     """
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['production', 'product'], name='detail_production_product_idx'),
+            models.Index(fields=['product', 'production'], name='detail_product_production_idx'),
+        ]
+
     uid = models.UUIDField(
         default=uuid.uuid4, unique=True, primary_key=True)
     production = models.ForeignKey(Production, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     produced_units = models.PositiveIntegerField()
     # production cost
+    production_cost = models.DecimalField(
+        max_digits=16, decimal_places=2, blank=True, null=True, editable=False)
 
     def __str__(self):
         """String representation of the ProductionDetail."""
         return f'production_{self.production.uid}__{self.product.slug}_detail'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded production, product and units so saves can adjust the stock."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_detail = (instance.__dict__.get('production_id'),
+                                   instance.__dict__.get('product_id'),
+                                   instance.__dict__.get('produced_units'))
+        return instance
+
+
+class DailyProductionRollup(models.Model):
+    """
+    Represents the units of a product produced on a day, summed from the production details.
+
+    Rows are maintained by `apps.production.reporting` and read by the production
+    reports instead of aggregating every detail on each request.
+
+    Attributes:
+    - uid: UUIDField, unique identifier for the rollup row.
+    - day: DateField, the local date of the productions.
+    - product: ForeignKey, links the row to a product.
+    - category: ForeignKey, the category of the product, copied to group without a join.
+    - produced_units: PositiveBigIntegerField, the units of the product produced that day.
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='rollup_day_product_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'day'], name='rollup_product_day_idx'),
+            models.Index(fields=['category', 'day'], name='rollup_category_day_idx'),
+        ]
+
+    uid = models.UUIDField(
+        default=uuid.uuid4, unique=True, primary_key=True)
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    produced_units = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        """String representation of the DailyProductionRollup."""
+        return f'{self.day}__{self.product_id}_rollup'
+
+
+class StockMovement(models.Model):
+    """
+    Represents a change to the stock of an item, in the append-only stock ledger.
+
+    Rows are written in bulk by `apps.production.ledger`, which keeps
+    `Item.amount` equal to the sum of the movements, and folded into
+    `StockSnapshot` rows once old.
+
+    Attributes:
+    - uid: UUIDField, unique identifier for the movement.
+    - item: ForeignKey, the item whose stock changed.
+    - kind: CharField, 'receipt', 'consumption' or 'adjustment'.
+    - quantity: DecimalField, the change in stock, negative when stock left.
+    - production: ForeignKey, the production that consumed the stock, if any.
+    - added: DateTimeField, timestamp of when the stock changed.
+    """
+
+    RECEIPT = 'receipt'
+    CONSUMPTION = 'consumption'
+    ADJUSTMENT = 'adjustment'
+    KINDS = [
+        (RECEIPT, 'Receipt'),
+        (CONSUMPTION, 'Consumption'),
+        (ADJUSTMENT, 'Adjustment'),
+    ]
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'added'], name='movement_item_added_idx'),
+            models.Index(fields=['added'], name='movement_added_idx'),
+        ]
+
+    uid = models.UUIDField(
+        default=uuid.uuid4, unique=True, primary_key=True)
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='stock_movements')
+    kind = models.CharField(max_length=16, choices=KINDS)
+    quantity = models.DecimalField(max_digits=12, decimal_places=2)
+    production = models.ForeignKey(
+        Production, on_delete=models.SET_NULL, blank=True, null=True, related_name='stock_movements')
+    added = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        """String representation of the StockMovement."""
+        return f'{self.item_id}__{self.kind}__{self.quantity}'
+
+
+class StockSnapshot(models.Model):
+    """
+    Represents the stock of an item at a point in time, folded from the ledger.
+
+    Snapshots are sparse: one is taken for an item only if it moved since its
+    previous snapshot, which stays valid otherwise.
+
+    Attributes:
+    - uid: UUIDField, unique identifier for the snapshot.
+    - item: ForeignKey, the item counted.
+    - taken: DateTimeField, the moment the stock is counted at; later movements are excluded.
+    - amount: DecimalField, the stock of the item at that moment.
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'taken'], name='snapshot_item_taken_unique'),
+        ]
+
+    uid = models.UUIDField(
+        default=uuid.uuid4, unique=True, primary_key=True)
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='stock_snapshots')
+    taken = models.DateTimeField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+
+    def __str__(self):
+        """String representation of the StockSnapshot."""
+        return f'{self.item_id}__{self.taken:%Y-%m-%d}_snapshot'
+
+
+class SearchDocument(models.Model):
+    """
+    Represents the searchable text of an item, product or category.
+
+    The full-text index over these rows is backend specific and created by the
+    migrations: an FTS5 table on SQLite and a weighted tsvector column on
+    PostgreSQL (see `apps.production.search`).
+
+    Attributes:
+    - kind: CharField, 'item', 'product' or 'category'.
+    - item: OneToOneField, the indexed item, if any.
+    - product: OneToOneField, the indexed product, if any.
+    - category: OneToOneField, the indexed category, if any.
+    - slug: SlugField, the slug of the indexed object.
+    - name: CharField, the name of the indexed object.
+    - description: CharField, the description of the indexed object.
+    - category_name: CharField, the name of the category of the indexed object.
+    """
+
+    KINDS = ('item', 'product', 'category')
+
+    kind = models.CharField(max_length=16)
+    item = models.OneToOneField(
+        Item, on_delete=models.CASCADE, blank=True, null=True, related_name='search_document')
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, blank=True, null=True, related_name='search_document')
+    category = models.OneToOneField(
+        Category, on_delete=models.CASCADE, blank=True, null=True, related_name='search_document')
+    slug = models.SlugField()
+    name = models.CharField(max_length=255)
+    description = models.CharField(max_length=300, blank=True, default='')
+    category_name = models.CharField(max_length=255, blank=True, default='')
+
+    def __str__(self):
+        """String representation of the SearchDocument."""
+        return f'{self.kind}__{self.slug}'
@@ -0,0 +1,123 @@
+"""Production app pagination"""
+import base64
+import binascii
+import datetime
+import uuid
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+
+def encode_cursor(instance):
+    """Encode the position of an instance as an opaque pagination cursor.
+
+    Args:
+        instance: A model instance with `added` and `uid` attributes, or a
+            dict with `added` and `uid` keys as returned by `values()`.
+
+    Returns:
+        str: A URL-safe cursor pointing right after the instance.
+    """
+
+    if isinstance(instance, dict):
+        added, uid = instance['added'], instance['uid']
+    else:
+        added, uid = instance.added, instance.uid
+    raw = f'{added.isoformat()}|{uid}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor generated by `encode_cursor`.
+
+    Args:
+        cursor (str): The opaque cursor received from the client.
+
+    Returns:
+        tuple: The `(added, uid)` pair, or None if the cursor is missing or malformed.
+    """
+
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        added, uid = raw.split('|')
+        return datetime.datetime.fromisoformat(added), uuid.UUID(uid)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """
+    A page of results fetched with keyset (cursor) pagination.
+
+    Attributes:
+    - object_list: list, the instances in the page.
+    - has_next: bool, whether more results exist after this page.
+    - next_cursor: str, the cursor for the following page, or None.
+    """
+
+    def __init__(self, object_list, has_next):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.next_cursor = encode_cursor(object_list[-1]) if has_next else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_paginate(queryset, cursor=None, per_page=25):
+    """Return a page of `queryset` ordered by newest first.
+
+    Rows are ordered by `(-added, -uid)` so the position is stable even when
+    several rows share the same timestamp, and the database can seek straight
+    to the page instead of counting and skipping with OFFSET.
+
+    Args:
+        queryset: A queryset of a model with `added` and `uid` fields, or
+            a `values()` queryset including them.
+        cursor (str): The cursor returned with the previous page, if any.
+        per_page (int): The maximum number of rows in the page.
+
+    Returns:
+        KeysetPage: The requested page.
+    """
+
+    position = decode_cursor(cursor)
+    if position is not None:
+        added, uid = position
+        queryset = queryset.filter(
+            Q(added__lt=added) | Q(added=added, uid__lt=uid))
+
+    rows = list(queryset.order_by('-added', '-uid')[:per_page + 1])
+    return KeysetPage(rows[:per_page], len(rows) > per_page)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids an exact COUNT(*) over large unfiltered tables.
+
+    On PostgreSQL the row count of an unfiltered queryset is read from the
+    planner statistics when it exceeds ESTIMATE_THRESHOLD; smaller tables,
+    filtered querysets and other backends are counted exactly.
+    """
+
+    ESTIMATE_THRESHOLD = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if (isinstance(queryset, QuerySet) and not queryset.query.where
+                and connections[queryset.db].vendor == 'postgresql'):
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > self.ESTIMATE_THRESHOLD:
+                return row[0]
+        return super().count
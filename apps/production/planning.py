@@ -0,0 +1,114 @@
+"""Production app material requirements planning
+
+A planned run maps products to units. Its bill of materials is exploded into
+the total quantity of every item needed and compared with the stock on hand.
+BOMs include the components of sub-assemblies at every level (see `bom.py`).
+The BOM of each product is cached and invalidated when its components, or
+those of a product it contains, change (see `signals.py`), so repeated plans
+only hit the database for stock levels.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .bom import ancestor_ids, explode_products
+from .models import Item
+
+
+BOM_CACHE_TIMEOUT = getattr(settings, 'MRP_BOM_CACHE_TIMEOUT', 60 * 60 * 24)
+
+# Requirements are rounded to the precision of the stock amounts
+STOCK_PLACES = Decimal('0.01')
+
+
+def bom_cache_key(product_id):
+    """Return the cache key of a product's bill of materials."""
+    return f'mrp:bom:{product_id}'
+
+
+def invalidate_boms(product_ids):
+    """Drop the cached bills of materials of several products and of the products containing them."""
+    product_ids = list(product_ids)
+    if product_ids:
+        cache.delete_many([bom_cache_key(product_id) for product_id in ancestor_ids(product_ids)])
+
+
+def get_boms(product_ids):
+    """Return the bills of materials of several products.
+
+    Cached BOMs are read with one cache round trip, and the missing ones are
+    loaded with a single query and cached.
+
+    Args:
+        product_ids (iterable): The primary keys of the products.
+
+    Returns:
+        dict: For each product, a dict mapping item primary keys to the amount per unit.
+    """
+
+    keys = {bom_cache_key(product_id): product_id for product_id in product_ids}
+    cached = cache.get_many(list(keys))
+    boms = {keys[key]: bom for key, bom in cached.items()}
+
+    missing = [product_id for product_id in keys.values() if product_id not in boms]
+    if missing:
+        loaded = explode_products(missing)
+        cache.set_many({bom_cache_key(product_id): bom for product_id, bom in loaded.items()},
+                       BOM_CACHE_TIMEOUT)
+        boms.update(loaded)
+
+    return boms
+
+
+def explode(plan):
+    """Compute the total quantity of each item needed by a production plan.
+
+    Args:
+        plan (dict): Maps product primary keys to planned units.
+
+    Returns:
+        dict: Maps item primary keys to the required quantity, rounded like stock amounts.
+    """
+
+    requirements = defaultdict(Decimal)
+    for product_id, bom in get_boms(plan).items():
+        units = Decimal(plan[product_id])
+        for item_id, amount in bom.items():
+            requirements[item_id] += amount * units
+    return {item_id: quantity.quantize(STOCK_PLACES) for item_id, quantity in requirements.items()}
+
+
+def plan_requirements(plan):
+    """Compare the items needed by a production plan with the stock on hand.
+
+    Args:
+        plan (dict): Maps product primary keys to planned units.
+
+    Returns:
+        list: One dict per required item with its `uid`, `slug`, `name`,
+        `measurement_unit`, `required`, `on_hand` and `shortfall`, largest
+        shortfall first.
+    """
+
+    requirements = explode(plan)
+    stock = (Item.objects
+             .filter(pk__in=list(requirements))
+             .values_list('uid', 'slug', 'name', 'measurement_unit', 'amount'))
+
+    lines = []
+    for uid, slug, name, measurement_unit, on_hand in stock:
+        required = requirements[uid]
+        on_hand = on_hand or Decimal(0)
+        lines.append({
+            'uid': uid,
+            'slug': slug,
+            'name': name,
+            'measurement_unit': measurement_unit,
+            'required': required,
+            'on_hand': on_hand,
+            'shortfall': max(required - on_hand, Decimal(0)),
+        })
+    lines.sort(key=lambda line: (-line['shortfall'], line['slug']))
+    return lines
@@ -0,0 +1,162 @@
+"""Production app reporting
+
+Units produced are pre-aggregated per product and local day in
+`DailyProductionRollup`. Signals rebuild the days touched by a change (see
+`signals.py`), and `rebuild_rollups` recomputes any range of days, e.g. from
+the `rollup_productions` command. Reports read only the rollup rows, so their
+cost depends on the number of days and products, not on the number of
+production details.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Sum
+from django.db.models.functions import TruncDate, TruncDay, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+from .importing import batched
+from .models import DailyProductionRollup, ProductionDetail
+
+
+PERIODS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+GROUPS = {
+    'total': {},
+    'product': {'slug': F('product__slug'), 'name': F('product__name')},
+    'category': {'slug': F('category__slug'), 'name': F('category__name')},
+}
+
+
+def day_start(day):
+    """Return the aware datetime at which a local day starts."""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def rebuild_rollups(since=None, until=None, batch_size=1000):
+    """Recompute the rollup rows of a range of days from the production details.
+
+    Rows are upserted on (day, product), so concurrent rebuilds of the same
+    day cannot collide on the unique constraint, and the rows left with no
+    production detail are deleted.
+
+    Args:
+        since (date): The first day to rebuild; the oldest production by default.
+        until (date): The last day to rebuild, inclusive; the newest production by default.
+        batch_size (int): The number of rows inserted per query.
+
+    Returns:
+        int: The number of rollup rows written.
+    """
+
+    rollups = DailyProductionRollup.objects.all()
+    # Draft productions are only planned
+    details = ProductionDetail.objects.filter(production__draft=False)
+    if since is not None:
+        rollups = rollups.filter(day__gte=since)
+        details = details.filter(production__added__gte=day_start(since))
+    if until is not None:
+        rollups = rollups.filter(day__lte=until)
+        details = details.filter(
+            production__added__lt=day_start(until + datetime.timedelta(days=1)))
+
+    totals = (details
+              .annotate(day=TruncDate('production__added'))
+              .values('day', 'product_id', 'product__category_id')
+              .annotate(units=Sum('produced_units'))
+              .order_by())
+
+    produced = (details
+                .annotate(day=TruncDate('production__added'))
+                .filter(day=OuterRef('day'), product=OuterRef('product')))
+
+    written = 0
+    with transaction.atomic():
+        rollups.exclude(Exists(produced)).delete()
+        rows = (DailyProductionRollup(day=row['day'],
+                                      product_id=row['product_id'],
+                                      category_id=row['product__category_id'],
+                                      produced_units=row['units'])
+                for row in totals.iterator())
+        for batch in batched(rows, batch_size):
+            DailyProductionRollup.objects.bulk_create(
+                batch, update_conflicts=True, unique_fields=['day', 'product'],
+                update_fields=['produced_units', 'category'])
+            written += len(batch)
+    return written
+
+
+def rollup_days(days):
+    """Rebuild the rollup rows of the given local days.
+
+    Args:
+        days (iterable): The dates to rebuild.
+    """
+
+    for day in sorted(set(days)):
+        rebuild_rollups(since=day, until=day)
+
+
+def rollup_productions(productions):
+    """Rebuild the rollup rows of the days the given productions happened on.
+
+    Args:
+        productions (iterable): Production instances.
+    """
+
+    rollup_days(timezone.localdate(production.added) for production in productions)
+
+
+def move_product_category(product):
+    """Copy the current category of a product onto its rollup rows.
+
+    Args:
+        product (Product): The saved product.
+
+    Returns:
+        int: The number of rollup rows updated.
+    """
+
+    return (DailyProductionRollup.objects
+            .filter(product=product)
+            .exclude(category=product.category_id)
+            .update(category=product.category_id))
+
+
+def production_report(period='month', group_by='product', since=None, until=None):
+    """Sum the units produced per period, read only from the rollup rows.
+
+    Args:
+        period (str): One of PERIODS: 'day', 'week', 'month' or 'year'.
+        group_by (str): One of GROUPS: 'product', 'category' or 'total'.
+        since (date): The first day included, if any.
+        until (date): The last day included, if any.
+
+    Returns:
+        list: Dicts with `period` (the first day of the period), `produced_units`
+            and, unless grouped by 'total', the `slug` and `name` of the group,
+            ordered by period and slug.
+    """
+
+    rollups = DailyProductionRollup.objects.all()
+    if since is not None:
+        rollups = rollups.filter(day__gte=since)
+    if until is not None:
+        rollups = rollups.filter(day__lte=until)
+
+    group = GROUPS[group_by]
+    rows = (rollups
+            .values(period=PERIODS[period]('day'), **group)
+            .annotate(units=Sum('produced_units'))
+            .order_by('period', *group))
+
+    return [
+        {'period': row['period'],
+         **{name: row[name] for name in group},
+         'produced_units': row['units']}
+        for row in rows
+    ]
@@ -0,0 +1,275 @@
+"""Production app scheduling
+
+Turns a demand (product -> units) into a multi-day plan that the stock on
+hand and the line capacities can actually deliver, written out as draft
+`Production` rows, one per day.
+
+The plan is built greedily. Items whose stock covers the whole demand never
+constrain it; for the others, the pressure of an item is the quantity the
+demand requires divided by the stock. Products are served in increasing order
+of the pressure-weighted share of the scarce stock one unit uses, so the
+products competing least for scarce items are made first, which maximizes the
+units delivered much like the ratio heuristic for multidimensional knapsacks.
+Among equally scarce products, those needing the most days at their line
+capacity start first.
+Each product gets as many units as its remaining items allow, spread over the
+earliest days with room left under its `daily_capacity` and the capacity of
+the whole plant (SCHEDULE_LINE_CAPACITY units a day, unlimited by default).
+
+BOMs come from the MRP cache (see `planning.py`) and the stock is read once,
+so scheduling thousands of products runs a handful of queries and is bound by
+one pass over the BOM lines.
+
+Drafts consume no stock and are left out of the reports until released, but
+the outstanding ones count as already planned: the items they will consume are
+taken off the stock, and their units off the capacities of their days, so
+scheduling a demand twice never promises the same stock or line time twice.
+"""
+import datetime
+import math
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .catalog_cache import get_cached_many
+from .costing import update_production_costs
+from .fragments import bump_versions
+from .importing import batched
+from .inventory import consume_stock
+from .models import Item, Product, Production, ProductionDetail
+from .planning import STOCK_PLACES, get_boms
+from .reporting import day_start, rollup_productions
+
+
+# Units a day produced across every product, unlimited if None
+SCHEDULE_LINE_CAPACITY = getattr(settings, 'SCHEDULE_LINE_CAPACITY', None)
+
+# Days a schedule spans by default
+SCHEDULE_HORIZON_DAYS = getattr(settings, 'SCHEDULE_HORIZON_DAYS', 30)
+
+# Products and items looked up per query
+CHUNK_SIZE = 500
+
+
+def load_capacities(product_ids):
+    """Return the daily capacity of several products, None meaning unlimited.
+
+    Raises:
+        LookupError: If one of the products does not exist.
+    """
+
+    capacities = {}
+    for chunk in batched(product_ids, CHUNK_SIZE):
+        capacities.update(Product.objects.filter(pk__in=chunk).values_list('pk', 'daily_capacity'))
+    missing = set(product_ids) - set(capacities)
+    if missing:
+        raise LookupError(f'Unknown products: {", ".join(sorted(map(str, missing)))}')
+    return capacities
+
+
+def load_stock(item_ids):
+    """Return the stock on hand of several items, missing amounts counting as none."""
+    stock = {}
+    for chunk in batched(item_ids, CHUNK_SIZE):
+        stock.update(Item.objects.filter(pk__in=chunk).values_list('pk', 'amount'))
+    return {item_id: stock.get(item_id) or Decimal(0) for item_id in item_ids}
+
+
+def load_drafts(start, days):
+    """Return what the outstanding draft productions have already planned.
+
+    Args:
+        start (date): The first day of the schedule.
+        days (int): The number of days planned.
+
+    Returns:
+        tuple: The units of each product in every draft, and for each day of
+        the schedule, the units of each product its drafts make.
+    """
+
+    totals = defaultdict(int)
+    planned = [defaultdict(int) for _ in range(days)]
+    rows = (ProductionDetail.objects
+            .filter(production__draft=True)
+            .values_list('production__added', 'product_id')
+            .annotate(units=Sum('produced_units'))
+            .order_by())
+    for added, product_id, units in rows:
+        totals[product_id] += units
+        day = (timezone.localtime(added).date() - start).days
+        if 0 <= day < days:
+            planned[day][product_id] += units
+    return totals, planned
+
+
+def schedule_production(demand, start=None, days=None, line_capacity=None):
+    """Plan the production of a demand over several days.
+
+    Nothing is saved; pass the result to `write_schedule` to create the drafts.
+    Outstanding drafts are planned around, not replaced.
+
+    Args:
+        demand (dict): Maps product primary keys to the units wanted.
+        start (date): The first day of the schedule; tomorrow by default.
+        days (int): The number of days planned; SCHEDULE_HORIZON_DAYS by default.
+        line_capacity (int): The units a day produced across every product;
+            SCHEDULE_LINE_CAPACITY by default.
+
+    Returns:
+        dict: `days`, a list of `(date, {product primary key: units})` for
+        each day with something to make; `scheduled` and `unscheduled`, the
+        units of each product planned and left out; `reasons`, why each
+        product left out was cut ('stock' or 'capacity'); and `consumption`,
+        the quantity of each item the plan uses, on top of the drafts.
+
+    Raises:
+        LookupError: If a product does not exist.
+    """
+
+    start = start or timezone.localdate() + datetime.timedelta(days=1)
+    days = days or SCHEDULE_HORIZON_DAYS
+    line_capacity = SCHEDULE_LINE_CAPACITY if line_capacity is None else line_capacity
+    demand = {product_id: int(units) for product_id, units in demand.items() if units > 0}
+
+    capacities = load_capacities(list(demand))
+    drafted, drafted_by_day = load_drafts(start, days)
+    boms = {}
+    for chunk in batched(set(demand) | set(drafted), CHUNK_SIZE):
+        boms.update(get_boms(chunk))
+
+    required = defaultdict(Decimal)
+    for product_id, units in demand.items():
+        for item_id, amount in boms[product_id].items():
+            required[item_id] += amount * units
+    stock = load_stock(list(required))
+    # Only the items the demand needs matter; the drafts' share of them is spoken for
+    for product_id, units in drafted.items():
+        for item_id, amount in boms.get(product_id, {}).items():
+            if item_id in stock:
+                stock[item_id] -= amount * units
+
+    # Pressure-weighted share of the scarce stock used by one unit of each product
+    pressure = {item_id: (float(required[item_id] / stock[item_id]) if stock[item_id] > 0 else math.inf)
+                for item_id in required if required[item_id] > stock[item_id]}
+
+    def scarcity(product_id):
+        return sum(float(amount / stock[item_id]) * pressure[item_id] if stock[item_id] > 0 else math.inf
+                   for item_id, amount in boms[product_id].items() if item_id in pressure)
+
+    def days_needed(product_id):
+        capacity = capacities[product_id]
+        return demand[product_id] / capacity if capacity else 0
+
+    order = sorted(demand, key=lambda product_id: (
+        scarcity(product_id), -days_needed(product_id), str(product_id)))
+
+    left = dict(stock)
+    room = [(line_capacity if line_capacity is not None else math.inf) - sum(planned.values())
+            for planned in drafted_by_day]
+    first_open = 0
+    plan = [{} for _ in range(days)]
+    scheduled, unscheduled, reasons = {}, {}, {}
+
+    for product_id in order:
+        wanted = demand[product_id]
+        bom = boms[product_id]
+        feasible = min([wanted] + [int(max(left[item_id], 0) // amount)
+                                   for item_id, amount in bom.items() if amount > 0])
+        per_day = capacities[product_id] if capacities[product_id] is not None else math.inf
+
+        placed = 0
+        day = first_open
+        while placed < feasible and day < days:
+            units = min(feasible - placed, room[day], per_day - drafted_by_day[day][product_id])
+            if units > 0:
+                plan[day][product_id] = units
+                room[day] -= units
+                placed += units
+            day += 1
+        while first_open < days and room[first_open] <= 0:
+            first_open += 1
+
+        for item_id, amount in bom.items():
+            left[item_id] -= amount * placed
+        if placed:
+            scheduled[product_id] = placed
+        if placed < wanted:
+            unscheduled[product_id] = wanted - placed
+            reasons[product_id] = 'stock' if feasible == placed and feasible < wanted else 'capacity'
+
+    return {
+        'days': [(start + datetime.timedelta(days=day), plan[day]) for day in range(days) if plan[day]],
+        'scheduled': scheduled,
+        'unscheduled': unscheduled,
+        'reasons': reasons,
+        'consumption': {item_id: (stock[item_id] - left[item_id]).quantize(STOCK_PLACES)
+                        for item_id in stock if left[item_id] != stock[item_id]},
+    }
+
+
+def write_schedule(schedule, batch_size=1000):
+    """Save a schedule as draft productions, one per day, in bulk.
+
+    Args:
+        schedule (dict): A result of `schedule_production`.
+        batch_size (int): The number of details inserted per query.
+
+    Returns:
+        list: The draft `Production` instances created.
+    """
+
+    with transaction.atomic():
+        productions = [Production(added=day_start(day), draft=True) for day, _ in schedule['days']]
+        Production.objects.bulk_create(productions)
+        details = (ProductionDetail(production=production, product_id=product_id, produced_units=units)
+                   for production, (_, plan) in zip(productions, schedule['days'])
+                   for product_id, units in plan.items())
+        for batch in batched(details, batch_size):
+            ProductionDetail.objects.bulk_create(batch)
+        # bulk_create skips the signals keeping production costs up to date
+        update_production_costs([production.pk for production in productions])
+    bump_versions('production')
+    return productions
+
+
+def release_production(production):
+    """Turn a draft production into a recorded one and consume its stock, only once.
+
+    Args:
+        production (Production): A draft production.
+
+    Returns:
+        dict: Maps item primary keys to the consumed quantity; empty if the
+        production was not a draft.
+    """
+
+    with transaction.atomic():
+        released = Production.objects.filter(pk=production.pk, draft=True).update(draft=False)
+        if not released:
+            return {}
+        production.draft = False
+        rollup_productions([production])
+        consumed = consume_stock(production)
+    bump_versions('production')
+    return consumed
+
+
+def resolve_demand(demand):
+    """Map product slugs to primary keys in a demand.
+
+    Args:
+        demand (dict): Maps product slugs to the units wanted.
+
+    Returns:
+        tuple: The demand keyed by product primary key, and the sorted unknown slugs.
+    """
+
+    product_ids = {}
+    for chunk in batched(demand, CHUNK_SIZE):
+        product_ids.update((slug, product.pk) for slug, product in get_cached_many('product', chunk).items())
+    unknown = sorted(set(demand) - set(product_ids))
+    return {product_ids[slug]: units for slug, units in demand.items() if slug in product_ids}, unknown
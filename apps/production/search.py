@@ -0,0 +1,199 @@
+"""Production app catalog search
+
+Items, products and categories are copied into `SearchDocument` rows, kept
+current by signals and by the catalog importer. Each backend indexes those
+rows its own way (see migration 0008):
+
+- SQLite: an external content FTS5 table synced by triggers, with prefix
+  indexes for the first two and three characters, ranked with bm25.
+- PostgreSQL: a generated tsvector column weighting the name over the
+  description over the category name, with a GIN index, ranked with ts_rank.
+- Other backends fall back to `icontains` lookups.
+
+Every word of a query is matched as a prefix, so the partial input of a search
+box already finds results.
+"""
+import itertools
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from apps.category.models import Category
+
+from .models import Item, Product, SearchDocument
+
+
+FTS_TABLE = 'production_searchdocument_fts'
+
+MODELS = {
+    'item': Item,
+    'product': Product,
+    'category': Category,
+}
+
+# Longer queries only narrow the results further
+MAX_TERMS = 8
+
+WORD = re.compile(r'\w+')
+
+
+def search_terms(query):
+    """Split a query into the lowercase words that are matched as prefixes."""
+    return WORD.findall(query.lower())[:MAX_TERMS]
+
+
+def search_vendor():
+    """Return the vendor of the database search queries are sent to."""
+    return connections[router.db_for_read(SearchDocument)].vendor
+
+
+def build_documents(kind, queryset):
+    """Build the search documents of a queryset of items, products or categories.
+
+    Args:
+        kind (str): One of SearchDocument.KINDS.
+        queryset: The objects of that kind to index.
+
+    Yields:
+        SearchDocument: One unsaved document per object.
+    """
+
+    if kind == 'category':
+        for pk, slug, name in queryset.values_list('pk', 'slug', 'name').iterator():
+            yield SearchDocument(kind=kind, category_id=pk, slug=slug, name=name)
+        return
+
+    rows = queryset.values_list('pk', 'slug', 'name', 'description', 'category__name')
+    for pk, slug, name, description, category_name in rows.iterator():
+        yield SearchDocument(kind=kind, slug=slug, name=name, description=description or '',
+                             category_name=category_name, **{f'{kind}_id': pk})
+
+
+def index_objects(kind, pks):
+    """Index new or changed items, products or categories.
+
+    Args:
+        kind (str): One of SearchDocument.KINDS.
+        pks (iterable): The primary keys of the objects.
+    """
+
+    pks = list(pks)
+    if not pks:
+        return
+    SearchDocument.objects.filter(**{f'{kind}__in': pks}).delete()
+    SearchDocument.objects.bulk_create(
+        build_documents(kind, MODELS[kind].objects.filter(pk__in=pks)))
+
+
+def rename_category(category):
+    """Index a saved category and copy its name onto the documents of its items and products.
+
+    Args:
+        category (Category): The saved category.
+    """
+
+    index_objects('category', [category.pk])
+    (SearchDocument.objects
+     .filter(Q(item__category=category) | Q(product__category=category))
+     .exclude(category_name=category.name)
+     .update(category_name=category.name))
+
+
+def rebuild_index(batch_size=1000):
+    """Rebuild every search document from the catalog.
+
+    Args:
+        batch_size (int): The number of documents inserted per query.
+
+    Returns:
+        int: The number of documents written.
+    """
+
+    SearchDocument.objects.all().delete()
+    written = 0
+    for kind, model in MODELS.items():
+        documents = build_documents(kind, model.objects.all())
+        while batch := list(itertools.islice(documents, batch_size)):
+            SearchDocument.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def fts5_query(terms):
+    """Build an FTS5 MATCH expression requiring every term as a prefix."""
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def tsquery(terms):
+    """Build a PostgreSQL tsquery requiring every term as a prefix."""
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def search(query, kinds=None, limit=10):
+    """Search the catalog, best matches first.
+
+    Args:
+        query (str): The words typed by the user; each is matched as a prefix.
+        kinds (iterable): Restrict the results to these SearchDocument.KINDS.
+        limit (int): The maximum number of results.
+
+    Returns:
+        list: SearchDocument instances with a `rank` attribute on SQLite and
+        PostgreSQL; empty without terms, known kinds or a positive limit.
+    """
+
+    terms = search_terms(query)
+    kinds = [kind for kind in (kinds or SearchDocument.KINDS) if kind in SearchDocument.KINDS]
+    # An empty IN () is a syntax error on PostgreSQL, and SQLite reads LIMIT -1 as no limit
+    if not terms or not kinds or limit < 1:
+        return []
+    kind_filter = f'AND d.kind IN ({", ".join(["%s"] * len(kinds))})'
+    vendor = search_vendor()
+
+    if vendor == 'sqlite':
+        # bm25 scores are negative, the best match has the lowest
+        sql = (f'SELECT d.*, bm25({FTS_TABLE}, 10.0, 2.0, 1.0) AS rank '
+               f'FROM {FTS_TABLE} JOIN production_searchdocument d ON d.id = {FTS_TABLE}.rowid '
+               f'WHERE {FTS_TABLE} MATCH %s {kind_filter} ORDER BY rank LIMIT %s')
+        return list(SearchDocument.objects.raw(sql, [fts5_query(terms), *kinds, limit]))
+
+    if vendor == 'postgresql':
+        sql = ("SELECT d.*, ts_rank(d.document, q) AS rank "
+               "FROM production_searchdocument d, to_tsquery('simple', %s) q "
+               f"WHERE d.document @@ q {kind_filter} ORDER BY rank DESC LIMIT %s")
+        return list(SearchDocument.objects.raw(sql, [tsquery(terms), *kinds, limit]))
+
+    documents = SearchDocument.objects.filter(kind__in=kinds)
+    for term in terms:
+        documents = documents.filter(name__icontains=term)
+    return list(documents.order_by('name')[:limit])
+
+
+def matching_documents(query):
+    """Build a subquery selecting the ids of the documents matching a query.
+
+    Unlike `search` it is not limited or ranked, so it can filter a queryset,
+    e.g. `Item.objects.filter(search_document__in=matching_documents(query))`.
+
+    Args:
+        query (str): The words typed by the user.
+
+    Returns:
+        An expression usable with an `__in` lookup.
+    """
+
+    terms = search_terms(query)
+    vendor = search_vendor()
+    if terms and vendor == 'sqlite':
+        return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                      [fts5_query(terms)])
+    if terms and vendor == 'postgresql':
+        return RawSQL("SELECT id FROM production_searchdocument "
+                      "WHERE document @@ to_tsquery('simple', %s)", [tsquery(terms)])
+
+    documents = SearchDocument.objects.all()
+    for term in terms:
+        documents = documents.filter(name__icontains=term)
+    return documents.values('id')
@@ -0,0 +1,173 @@
+"""Production app synthetic data
+
+Builds realistic catalogs and production histories at a configurable scale for
+benchmarks and load tests. Rows are generated lazily and written with
+`bulk_create` in fixed-size batches; the denormalized data that signals would
+normally maintain (BOM closure, stock ledger, costs, rollups, search documents)
+is rebuilt once at the end.
+Every seeded slug starts with SEED_PREFIX so `clear_seed` can remove them.
+"""
+import datetime
+import random
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.category.models import Category
+
+from .bom import ensure_bom_roots
+from .costing import recompute_costs
+from .fragments import bump_versions
+from .importing import batched
+from .ledger import reconcile_stock
+from .models import Component, Item, Product, Production, ProductionDetail
+from .reporting import rebuild_rollups
+from .search import rebuild_index
+
+
+SEED_PREFIX = 'seed-'
+
+SCALES = {
+    'small': {'categories': 10, 'items': 500, 'products': 200, 'components': 8,
+              'productions': 1000, 'details': 5},
+    'medium': {'categories': 50, 'items': 10000, 'products': 2000, 'components': 10,
+               'productions': 20000, 'details': 8},
+    'large': {'categories': 200, 'items': 100000, 'products': 20000, 'components': 12,
+              'productions': 200000, 'details': 10},
+}
+
+ADJECTIVES = ('Fine', 'Coarse', 'Organic', 'Refined', 'Whole', 'Dark', 'Light', 'Roasted',
+              'Raw', 'Smoked', 'Aged', 'Fresh', 'Dried', 'Toasted', 'Premium')
+MATERIALS = ('flour', 'sugar', 'butter', 'cocoa', 'vanilla', 'yeast', 'salt', 'milk', 'cream',
+             'almond', 'hazelnut', 'honey', 'oat', 'rye', 'cinnamon', 'raisin', 'egg', 'malt')
+PRODUCTS = ('bread', 'cake', 'cookie', 'croissant', 'muffin', 'tart', 'brownie', 'bagel',
+            'pie', 'scone', 'loaf', 'roll', 'biscuit', 'waffle', 'donut')
+UNITS = ('kg', 'g', 'l', 'ml', 'unit')
+
+
+class Seeder:
+    """
+    Generates and writes one synthetic dataset.
+
+    Attributes:
+    - random: Random, the generator; the same seed builds the same rows.
+    - batch_size: int, the number of rows written per query.
+    - counts: dict, the number of rows written per model.
+    """
+
+    def __init__(self, seed=0, batch_size=5000):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.counts = {}
+
+    def write(self, model, rows):
+        """Insert generated rows in batches and return their primary keys."""
+        pks = []
+        for batch in batched(rows, self.batch_size):
+            model.objects.bulk_create(batch)
+            pks.extend(row.pk for row in batch)
+        self.counts[model._meta.model_name] = len(pks)
+        return pks
+
+    def categories(self, count):
+        for n in range(count):
+            material = MATERIALS[n % len(MATERIALS)]
+            yield Category(name=f'{material.title()} goods {n}', slug=f'{SEED_PREFIX}category-{n}')
+
+    def items(self, count, category_ids):
+        for n in range(count):
+            name = f'{self.random.choice(ADJECTIVES)} {self.random.choice(MATERIALS)} {n}'
+            yield Item(
+                name=name, slug=f'{SEED_PREFIX}item-{n}',
+                description=f'{name} from supplier {self.random.randint(1, 200)}',
+                price=Decimal(self.random.randint(50, 50000)) / 100,
+                amount=Decimal(self.random.randint(0, 10 ** 6)) / 100,
+                measurement_unit=self.random.choice(UNITS),
+                category_id=self.random.choice(category_ids))
+
+    def products(self, count, category_ids):
+        for n in range(count):
+            name = f'{self.random.choice(ADJECTIVES)} {self.random.choice(PRODUCTS)} {n}'
+            yield Product(
+                name=name, slug=f'{SEED_PREFIX}product-{n}', description=name,
+                price=Decimal(self.random.randint(500, 200000)) / 100,
+                units=self.random.randint(1, 24),
+                daily_capacity=self.random.choice((None, 50, 100, 200, 500)),
+                category_id=self.random.choice(category_ids))
+
+    def components(self, product_ids, item_ids, per_product):
+        for product_id in product_ids:
+            for item_id in self.random.sample(item_ids, min(per_product, len(item_ids))):
+                yield Component(product_id=product_id, item_id=item_id,
+                                amount=Decimal(self.random.randint(10, 500)) / 100)
+
+    def productions(self, count, days):
+        now = timezone.now()
+        for _ in range(count):
+            # Production volume grows over time, like a real business
+            age = days * (1 - self.random.random() ** 0.5)
+            yield Production(added=now - datetime.timedelta(days=age), stock_consumed=True)
+
+    def details(self, production_ids, product_ids, per_production):
+        for production_id in production_ids:
+            for product_id in self.random.sample(product_ids, min(per_production, len(product_ids))):
+                yield ProductionDetail(production_id=production_id, product_id=product_id,
+                                       produced_units=self.random.randint(1, 500))
+
+
+def seed_erp(categories, items, products, components, productions, details,
+             days=3 * 365, seed=0, batch_size=5000):
+    """Write a synthetic dataset and rebuild the data derived from it.
+
+    Args:
+        categories (int): The number of categories.
+        items (int): The number of items.
+        products (int): The number of products.
+        components (int): The number of components of each product.
+        productions (int): The number of productions.
+        details (int): The number of products in each production.
+        days (int): How many days of history the productions span.
+        seed (int): The random seed; the same seed builds the same dataset.
+        batch_size (int): The number of rows written per query.
+
+    Returns:
+        dict: The number of rows written per model.
+    """
+
+    seeder = Seeder(seed, batch_size)
+    with transaction.atomic():
+        category_ids = seeder.write(Category, seeder.categories(categories))
+        item_ids = seeder.write(Item, seeder.items(items, category_ids))
+        product_ids = seeder.write(Product, seeder.products(products, category_ids))
+        seeder.write(Component, seeder.components(product_ids, item_ids, components))
+        production_ids = seeder.write(Production, seeder.productions(productions, days))
+        seeder.write(ProductionDetail, seeder.details(production_ids, product_ids, details))
+
+    # bulk_create skips the signals maintaining the derived data
+    ensure_bom_roots()
+    reconcile_stock(item_ids)
+    recompute_costs()
+    rebuild_rollups()
+    rebuild_index()
+    bump_versions('category', 'item', 'product', 'component', 'production', 'productiondetail')
+    return seeder.counts
+
+
+@transaction.atomic
+def clear_seed():
+    """Delete every seeded row.
+
+    Returns:
+        int: The number of rows deleted.
+    """
+
+    deleted = 0
+    products = Product.objects.filter(slug__startswith=SEED_PREFIX)
+    deleted += Production.objects.filter(pk__in=ProductionDetail.objects
+                                         .filter(product__in=products)
+                                         .values('production')).delete()[0]
+    deleted += products.delete()[0]
+    deleted += Item.objects.filter(slug__startswith=SEED_PREFIX).delete()[0]
+    deleted += Category.objects.filter(slug__startswith=SEED_PREFIX).delete()[0]
+    return deleted
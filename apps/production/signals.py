@@ -0,0 +1,272 @@
+"""Production app signals"""
+import contextvars
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.category.models import Category
+from core.thumbnails import schedule_derivatives
+
+from . import bom, catalog_cache, tasks
+from .costing import mark_products_stale, update_production_costs
+from .fragments import bump_versions
+from .inventory import follow_detail_change, return_stock
+from .ledger import reconcile_stock
+from .models import Component, Item, Product, Production, ProductionDetail, SubAssembly
+from .planning import invalidate_boms
+from .reporting import move_product_category, rollup_days, rollup_productions
+from .search import index_objects, rename_category
+
+
+@receiver(post_save, sender=Item)
+def flag_products_on_price_change(sender, instance, created, **kwargs):
+    """Flag the products using an item whose price changed."""
+    if not created and instance.price_changed():
+        mark_products_stale(item_ids=[instance.pk])
+    instance._loaded_price = instance.price
+
+
+@receiver(post_save, sender=Item)
+def record_stock_adjustment(sender, instance, created, **kwargs):
+    """Record a stock set outright, e.g. from the admin, in the stock ledger."""
+    if instance.amount_changed() and (instance.amount or not created):
+        reconcile_stock([instance.pk])
+    instance._loaded_amount = instance.amount
+
+
+@receiver(post_save, sender=Component)
+@receiver(post_delete, sender=Component)
+def flag_product_on_composition_change(sender, instance, **kwargs):
+    """Flag the product whose composition changed and drop its cached BOM and row."""
+    mark_products_stale(product_ids=[instance.product_id])
+    invalidate_boms([instance.product_id])
+    catalog_cache.invalidate('product', [instance.product_id])
+
+
+@receiver(post_save, sender=ProductionDetail)
+@receiver(post_delete, sender=ProductionDetail)
+def update_production_on_detail_change(sender, instance, **kwargs):
+    """Recompute the costs of the production a detail belongs to."""
+    update_production_costs([instance.production_id])
+
+
+@receiver(post_save, sender=ProductionDetail)
+@receiver(post_delete, sender=ProductionDetail)
+def update_rollup_on_detail_change(sender, instance, **kwargs):
+    """Rebuild the daily rollup of the day the detail was produced on."""
+    rollup_productions([instance.production])
+
+
+@receiver(post_save, sender=ProductionDetail)
+def update_stock_on_detail_save(sender, instance, **kwargs):
+    """Consume or return the stock of the units added to or removed from a production."""
+    loaded = getattr(instance, '_loaded_detail', None)
+    current = (instance.production_id, instance.product_id, instance.produced_units)
+    if loaded != current:
+        if loaded is not None and loaded[0] not in (None, instance.production_id):
+            follow_detail_change(loaded[0], claim=False)
+        follow_detail_change(instance.production_id)
+    instance._loaded_detail = current
+
+
+@receiver(post_delete, sender=ProductionDetail)
+def update_stock_on_detail_delete(sender, instance, **kwargs):
+    """Return the stock consumed by a deleted detail."""
+    follow_detail_change(instance.production_id, claim=False)
+
+
+@receiver(pre_delete, sender=Production)
+def return_stock_on_production_delete(sender, instance, **kwargs):
+    """Put back the stock consumed by a production being deleted."""
+    return_stock(instance)
+
+
+@receiver(post_save, sender=Production)
+def update_rollup_on_production_move(sender, instance, created, **kwargs):
+    """Move the units of a production whose date changed to its new day."""
+    loaded = getattr(instance, '_loaded_added', None)
+    if not created and loaded is not None:
+        days = {timezone.localdate(loaded), timezone.localdate(instance.added)}
+        if len(days) > 1:
+            rollup_days(days)
+    instance._loaded_added = instance.added
+
+
+@receiver(post_save, sender=Product)
+def update_rollup_category(sender, instance, created, **kwargs):
+    """Keep the category copied onto the rollup rows of a product current."""
+    if not created:
+        move_product_category(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_cached_category(sender, instance, **kwargs):
+    """Drop a changed category from the catalog cache."""
+    catalog_cache.invalidate('category', [instance.pk])
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_cached_item(sender, instance, **kwargs):
+    """Drop a changed item, and the cached products holding it, from the catalog cache."""
+    catalog_cache.invalidate('item', [instance.pk])
+    catalog_cache.invalidate(
+        'product', Component.objects.filter(item=instance.pk).values_list('product_id', flat=True))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cached_product(sender, instance, **kwargs):
+    """Drop a changed product from the catalog cache."""
+    catalog_cache.invalidate('product', [instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Component)
+@receiver(post_delete, sender=Component)
+@receiver(post_save, sender=Production)
+@receiver(post_delete, sender=Production)
+@receiver(post_save, sender=ProductionDetail)
+@receiver(post_delete, sender=ProductionDetail)
+def bump_model_version(sender, instance, **kwargs):
+    """Invalidate the cached fragments and API responses displaying the saved or deleted model."""
+    bump_versions(sender._meta.model_name)
+
+
+@receiver(m2m_changed, sender=Product.composition.through)
+def flag_products_on_composition_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Handle products changed through `Product.composition` or `Item.product_set`.
+
+    These bulk operations skip the Component save and delete signals.
+    """
+    if not reverse:
+        product_ids = [instance.pk] if action.startswith('post_') else []
+    elif action == 'pre_clear':
+        # Clearing an item's products does not report which ones were removed
+        product_ids = list(instance.product_set.values_list('pk', flat=True))
+    elif action.startswith('post_') and pk_set:
+        product_ids = list(pk_set)
+    else:
+        product_ids = []
+
+    if product_ids:
+        mark_products_stale(product_ids=product_ids)
+        invalidate_boms(product_ids)
+        catalog_cache.invalidate('product', product_ids)
+        bump_versions('component')
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Product)
+def index_catalog_object(sender, instance, **kwargs):
+    """Refresh the search document of a saved item or product.
+
+    Deleted objects take their document with them through the cascade.
+    """
+    index_objects(sender._meta.model_name, [instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, **kwargs):
+    """Refresh the search documents of a saved category and of its items and products."""
+    rename_category(instance)
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Item)
+@receiver(pre_save, sender=Product)
+def reset_thumbnail_sizes(sender, instance, **kwargs):
+    """Forget the derivatives of a replaced thumbnail until the new ones are generated."""
+    if instance.thumbnail_changed():
+        instance.thumbnail_sizes = []
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Product)
+def generate_thumbnails(sender, instance, **kwargs):
+    """Generate the resized derivatives of an uploaded thumbnail on the job queue."""
+    changed = instance.thumbnail_changed()
+    instance._loaded_thumbnail = instance.thumbnail.name
+    if not changed or not instance.thumbnail:
+        return
+    if getattr(settings, 'THUMBNAIL_BACKGROUND', True):
+        tasks.generate_thumbnails.enqueue(instance.thumbnail.name)
+    else:
+        schedule_derivatives(instance.thumbnail.name, then=tasks.record_thumbnails)
+
+
+# Sub-assembly links deleted by the cascade of a product being deleted. The
+# closure of the products containing it is rebuilt once the product is gone.
+_cascading_links = contextvars.ContextVar('cascading_links', default=frozenset())
+
+
+def flag_assemblies(product_ids):
+    """Flag the cost and drop the cached BOMs of products and of those containing them."""
+    mark_products_stale(product_ids=product_ids)
+    invalidate_boms(product_ids)
+
+
+@receiver(post_save, sender=Product)
+def create_bom_root(sender, instance, created, **kwargs):
+    """Link a new product to itself in the BOM closure."""
+    if created:
+        bom.ensure_bom_roots([instance.pk])
+
+
+@receiver(pre_save, sender=SubAssembly)
+def reject_bom_cycles(sender, instance, **kwargs):
+    """Refuse links that would make a product part of itself."""
+    if bom.creates_cycle(instance.product_id, instance.component_id):
+        raise ValidationError('A product cannot contain itself, directly or not.')
+
+
+@receiver(post_save, sender=SubAssembly)
+def update_closure_on_link_change(sender, instance, created, **kwargs):
+    """Replace the paths of a changed link in the BOM closure."""
+    loaded = getattr(instance, '_loaded_link', None)
+    if loaded is not None and not created:
+        bom.unlink(*loaded)
+    bom.link(instance.product_id, instance.component_id, instance.amount)
+    instance._loaded_link = (instance.product_id, instance.component_id, instance.amount)
+    flag_assemblies({instance.product_id, *(loaded[:1] if loaded else ())})
+
+
+@receiver(post_delete, sender=SubAssembly)
+def update_closure_on_link_delete(sender, instance, **kwargs):
+    """Remove the paths of a deleted link from the BOM closure."""
+    if instance.pk in _cascading_links.get():
+        return
+    product_id, component_id, amount = getattr(
+        instance, '_loaded_link', (instance.product_id, instance.component_id, instance.amount))
+    bom.unlink(product_id, component_id, amount)
+    flag_assemblies([product_id])
+
+
+@receiver(pre_delete, sender=Product)
+def prepare_closure_for_product_delete(sender, instance, **kwargs):
+    """Remember the products containing a product about to be deleted."""
+    instance._bom_ancestors = bom.ancestor_ids([instance.pk]) - {instance.pk}
+    links = SubAssembly.objects.filter(Q(product=instance.pk) | Q(component=instance.pk))
+    instance._bom_links = frozenset(links.values_list('pk', flat=True))
+    _cascading_links.set(_cascading_links.get() | instance._bom_links)
+
+
+@receiver(post_delete, sender=Product)
+def update_closure_on_product_delete(sender, instance, **kwargs):
+    """Rebuild the closure of the products that contained a deleted product."""
+    _cascading_links.set(_cascading_links.get() - getattr(instance, '_bom_links', frozenset()))
+    ancestors = getattr(instance, '_bom_ancestors', None)
+    if ancestors:
+        bom.rebuild_closure(ancestors)
+        flag_assemblies(ancestors)
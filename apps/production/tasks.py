@@ -0,0 +1,85 @@
+"""Production app background tasks
+
+Run by `manage.py run_workers` (see `apps.jobs`), off the web workers.
+"""
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.jobs.tasks import task
+from core.thumbnails import THUMBNAIL_SIZES, generate_derivatives
+
+from . import catalog_cache
+from .costing import recompute_costs as recompute_stale_costs
+from .exporting import export_stream, open_export, parse_bound
+from .fragments import bump_versions
+from .importing import batched, import_catalog as import_rows, read_rows
+from .kpis import refresh_kpis as compute_and_cache_kpis
+from .ledger import compact_ledger
+from .reporting import rebuild_rollups as rebuild_daily_rollups
+
+
+def record_thumbnails(names):
+    """Record that every derivative of some images exists on the rows holding them.
+
+    Args:
+        names (iterable): The storage names of the original images.
+    """
+
+    sizes = sorted(THUMBNAIL_SIZES, key=THUMBNAIL_SIZES.get)
+    for chunk in batched(names, 500):
+        for kind, model in catalog_cache.CATALOG_MODELS.items():
+            pks = list(model.objects.filter(thumbnail__in=chunk).values_list('pk', flat=True))
+            if pks:
+                # A bulk update skips the signals dropping cached rows and fragments
+                model.objects.filter(pk__in=pks).update(thumbnail_sizes=sizes)
+                catalog_cache.invalidate(kind, pks)
+                bump_versions(kind)
+
+
+@task('production.generate_thumbnails', unique=True, max_attempts=5)
+def generate_thumbnails(name):
+    """Create the missing derivatives of an uploaded image."""
+    generate_derivatives(name)
+    record_thumbnails([name])
+
+
+@task('production.recompute_costs', unique=True, max_attempts=5)
+def recompute_costs():
+    """Reprice the stale products and the productions using them."""
+    recompute_stale_costs()
+
+
+@task('production.rebuild_rollups')
+def rebuild_rollups(since=None, until=None):
+    """Rebuild the daily production rollups between two ISO dates, inclusive."""
+    rebuild_daily_rollups(since and parse_date(since), until and parse_date(until))
+
+
+@task('production.import_catalog')
+def import_catalog(kind, path, file_format=None, batch_size=1000):
+    """Import a catalog file readable by the workers, rejected rows going to <path>.rejected.jsonl."""
+    with open(f'{path}.rejected.jsonl', 'w', encoding='utf-8') as rejected:
+        import_rows(kind, read_rows(path, file_format), batch_size=batch_size, rejected=rejected)
+
+
+@task('production.export_data')
+def export_data(dataset, file_format, path, since=None, until=None, gzip=False):
+    """Write an export to a file, between two ISO dates or datetimes."""
+    chunks = export_stream(dataset, file_format, parse_bound(since), parse_bound(until), gzip)
+    with open_export(path, gzip) as output:
+        for chunk in chunks:
+            output.write(chunk)
+
+
+@task('production.compact_stock_ledger', unique=True)
+def compact_stock_ledger(keep_days=None):
+    """Fold the stock movements older than `keep_days` into snapshots."""
+    compact_ledger(keep_days and timezone.now() - datetime.timedelta(days=keep_days))
+
+
+@task('production.refresh_kpis', unique=True, max_attempts=1)
+def refresh_kpis():
+    """Recompute the dashboard KPIs."""
+    compute_and_cache_kpis()
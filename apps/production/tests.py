@@ -1,3 +1,1311 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+import uuid
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.cache import cache, caches
+from django.db import IntegrityError, connection
+from django.http import JsonResponse
+from django.test.utils import CaptureQueriesContext
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from apps.category.models import Category
+from apps.jobs.models import Job
+from apps.jobs.tasks import TASKS
+from apps.jobs.worker import claim_job, run_job
+from core import profiling
+from core.routers import ReplicaRouter, use_replica
+from core.thumbnails import derivative_name, generate_derivatives
+
+from . import catalog_cache, views
+from .bom import creates_cycle, explode_products, products_using, rebuild_closure, where_used
+from .costing import recompute_costs
+from .exporting import export_stream
+from .fragments import bump_versions
+from .impact import price_impact
+from .importing import import_catalog, read_rows
+from .inventory import consume_stock, record_production
+from .kpis import KPI_CACHE_KEY, compute_kpis, refresh_kpis
+from .ledger import compact_ledger, receive_stock, record_movements, stock_as_of, take_snapshot
+from .models import (
+    BomClosure, Component, DailyProductionRollup, Item, Product, Production, ProductionDetail,
+    SearchDocument, StockMovement, StockSnapshot, SubAssembly)
+from .pagination import keyset_paginate
+from .planning import plan_requirements
+from .reporting import production_report, rebuild_rollups
+from .scheduling import release_production, schedule_production, write_schedule
+from .search import rebuild_index, search
+from .seeding import clear_seed, seed_erp
+from .benchmarks import run_benchmarks
+from .management.commands import bench_http
+
+
+def make_catalog(products=3, items_per_product=2):
+    """Create a small catalog of items, products and components for tests."""
+    # Rows cached by earlier tests share the slugs but not the primary keys
+    caches['catalog'].clear()
+    category = Category.objects.create(
+        name='Bakery', slug='bakery', thumbnail='category/bakery/x.png')
+    now = timezone.now()
+    items = [
+        Item.objects.create(
+            name=f'Item {i}', slug=f'item-{i}', thumbnail='item/x.png',
+            price=i + 1, amount=100, measurement_unit='kg', category=category,
+            added=now - datetime.timedelta(minutes=i))
+        for i in range(items_per_product)
+    ]
+    for p in range(products):
+        product = Product.objects.create(
+            name=f'Product {p}', slug=f'product-{p}', thumbnail='product/x.png',
+            price=10, units=1, category=category,
+            added=now - datetime.timedelta(minutes=p))
+        for item in items:
+            Component.objects.create(product=product, item=item, amount=2)
+    return category, items
+
+
+class CostRollupTests(TestCase):
+
+    def setUp(self):
+        _, self.items = make_catalog(products=2, items_per_product=2)
+        self.production = Production.objects.create()
+        for product in Product.objects.all():
+            ProductionDetail.objects.create(
+                production=self.production, product=product, produced_units=10)
+
+    def test_costs_are_rolled_up_from_components(self):
+        # item prices are 1 and 2, each used twice per product
+        self.assertEqual(recompute_costs(), 2)
+        for product in Product.objects.all():
+            self.assertEqual(product.product_cost, 6)
+            self.assertFalse(product.cost_stale)
+        self.production.refresh_from_db()
+        self.assertEqual(self.production.production_cost, 120)
+
+    def test_only_products_using_a_repriced_item_are_recomputed(self):
+        recompute_costs()
+        item = Item.objects.get(pk=self.items[0].pk)
+        item.amount = 50
+        item.save()
+        self.assertFalse(Product.objects.filter(cost_stale=True).exists())
+
+        item.price = 11
+        item.save()
+        self.assertEqual(Product.objects.filter(cost_stale=True).count(), 2)
+        # the workers reprice the flagged products, one job for a burst of changes
+        item.price = 12
+        item.save()
+        self.assertEqual(Job.objects.filter(task='production.recompute_costs', status=Job.QUEUED).count(), 1)
+        item.price = 11
+        item.save()
+        self.assertEqual(recompute_costs(), 2)
+        self.assertEqual(recompute_costs(), 0)
+        self.production.refresh_from_db()
+        self.assertEqual(self.production.production_cost, 520)
+
+    def test_removing_a_detail_updates_the_production_total(self):
+        recompute_costs()
+        self.production.productiondetail_set.first().delete()
+        self.production.refresh_from_db()
+        self.assertEqual(self.production.production_cost, 60)
+
+
+class CatalogImportTests(TestCase):
+
+    def setUp(self):
+        Category.objects.create(name='Dairy', slug='dairy', thumbnail='category/x.png')
+
+    def write_file(self, suffix, content):
+        handle = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        handle.write(content)
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+        return handle.name
+
+    def test_csv_items_are_created_then_updated(self):
+        path = self.write_file('.csv', (
+            'name,slug,description,price,amount,measurement_unit,category\n'
+            'Milk,milk,,1.50,10,l,dairy\n'
+            'Cream,cream,Fresh,3.20,5,l,dairy\n'
+            'Butter,butter,,not-a-price,1,kg,dairy\n'
+            'Cheese,cheese,,8,2,kg,unknown\n'))
+        rejected = io.StringIO()
+        stats = import_catalog('item', read_rows(path), batch_size=2, rejected=rejected)
+        self.assertEqual((stats.read, stats.created, stats.updated, stats.rejected), (4, 2, 0, 2))
+        errors = [json.loads(line) for line in rejected.getvalue().splitlines()]
+        self.assertEqual([error['line'] for error in errors], [4, 5])
+
+        stats = import_catalog('item', read_rows(path), batch_size=10)
+        self.assertEqual((stats.created, stats.updated), (0, 2))
+        self.assertEqual(Item.objects.get(slug='cream').description, 'Fresh')
+
+    def test_jsonl_components_resolve_slugs_and_flag_costs(self):
+        import_catalog('item', [(1, {'name': 'Milk', 'slug': 'milk', 'price': '2',
+                                     'measurement_unit': 'l', 'category': 'dairy'})])
+        import_catalog('product', [(1, {'name': 'Yogurt', 'slug': 'yogurt', 'units': 1,
+                                        'category': 'dairy'})])
+        recompute_costs()
+        path = self.write_file('.jsonl', (
+            '{"product": "yogurt", "item": "milk", "amount": "0.5"}\n'
+            '{"product": "yogurt", "item": "ghost", "amount": "1"}\n'
+            '{broken\n'))
+        stats = import_catalog('component', read_rows(path))
+        self.assertEqual((stats.created, stats.rejected), (1, 2))
+        self.assertTrue(Product.objects.get(slug='yogurt').cost_stale)
+        recompute_costs()
+        self.assertEqual(Product.objects.get(slug='yogurt').product_cost, 1)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        make_catalog(products=2, items_per_product=3)
+        recompute_costs()
+        self.old = Production.objects.create(added=timezone.now() - datetime.timedelta(days=40))
+        self.new = Production.objects.create()
+        for production in (self.old, self.new):
+            for product in Product.objects.all():
+                ProductionDetail.objects.create(
+                    production=production, product=product, produced_units=4)
+
+    def test_productions_csv_is_filtered_by_date(self):
+        since = timezone.now() - datetime.timedelta(days=1)
+        text = ''.join(export_stream('productions', 'csv', since=since))
+        rows = list(csv.DictReader(io.StringIO(text)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual({row['production_uid'] for row in rows}, {str(self.new.uid)})
+        self.assertEqual(rows[0]['production_cost'], '48.00')
+
+    def test_inventory_jsonl_gzip(self):
+        data = b''.join(export_stream('inventory', 'jsonl', gzip=True))
+        rows = [json.loads(line) for line in gzip.decompress(data).decode().splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['category_slug'], 'bakery')
+
+    def test_command_and_task_write_the_same_utf8_files(self):
+        Item.objects.filter(slug='item-0').update(name='Crème fraîche')
+        with tempfile.TemporaryDirectory() as directory:
+            command_path = os.path.join(directory, 'command.csv')
+            task_path = os.path.join(directory, 'task.csv')
+            call_command('export_data', 'inventory', output=command_path, stdout=io.StringIO())
+            TASKS['production.export_data'].function('inventory', 'csv', task_path)
+            with open(command_path, 'rb') as command_file, open(task_path, 'rb') as task_file:
+                data = command_file.read()
+                self.assertEqual(data, task_file.read())
+        self.assertIn('Crème fraîche'.encode(), data)
+        self.assertIn(b'\r\n', data)
+
+    def test_export_view_streams_attachment(self):
+        user = User.objects.create_user('analyst', password='secret-pass')
+        self.client.force_login(user)
+        response = self.client.get(reverse('export-productions'), {'since': '2000-01-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        response = self.client.get(reverse('export-inventory'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MaterialRequirementsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        _, self.items = make_catalog(products=3, items_per_product=2)
+        self.products = list(Product.objects.order_by('slug'))
+
+    def test_plan_is_exploded_against_stock(self):
+        # every product uses 2 of each item and 100 of each are on hand
+        plan = {product.uid: 20 for product in self.products}
+        lines = plan_requirements(plan)
+        self.assertEqual(len(lines), 2)
+        for line in lines:
+            self.assertEqual(line['required'], 120)
+            self.assertEqual(line['shortfall'], 20)
+
+    def test_boms_are_cached_until_components_change(self):
+        plan = {self.products[0].uid: 10}
+        plan_requirements(plan)
+        with self.assertNumQueries(1):
+            plan_requirements(plan)
+
+        Component.objects.filter(product=self.products[0], item=self.items[0]).delete()
+        lines = plan_requirements(plan)
+        self.assertEqual([line['slug'] for line in lines], [self.items[1].slug])
+
+    def test_mrp_view(self):
+        user = User.objects.create_user('planner', password='secret-pass')
+        self.client.force_login(user)
+        response = self.client.post(
+            reverse('mrp'), {'plan': {'product-0': 60}, 'shortfalls_only': True},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([line['shortfall'] for line in response.json()['lines']], ['20.00', '20.00'])
+        response = self.client.post(
+            reverse('mrp'), {'plan': {'nothing': 1}}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class InventoryConsumptionTests(TestCase):
+
+    def setUp(self):
+        _, self.items = make_catalog(products=2, items_per_product=2)
+        self.products = list(Product.objects.order_by('slug'))
+
+    def test_recording_a_production_consumes_stock_once(self):
+        # each product uses 2 of each item
+        production = record_production({self.products[0].uid: 5, self.products[1].uid: 10})
+        for item in Item.objects.all():
+            self.assertEqual(item.amount, 70)
+        self.assertTrue(Production.objects.get(pk=production.pk).stock_consumed)
+
+        self.assertEqual(consume_stock(production), {})
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 70)
+
+    def test_stock_is_decremented_with_one_update(self):
+        production = Production.objects.create()
+        # bulk_create skips the signals consuming the stock of each saved detail
+        ProductionDetail.objects.bulk_create([
+            ProductionDetail(production=production, product=product, produced_units=1)
+            for product in self.products])
+        # savepoint, claim, aggregate, lock, update, ledger insert, release
+        with self.assertNumQueries(7):
+            consume_stock(production)
+        self.assertEqual(Item.objects.get(pk=self.items[1].pk).amount, 96)
+
+    def test_details_saved_one_by_one_consume_stock(self):
+        production = Production.objects.create()
+        ProductionDetail.objects.create(production=production, product=self.products[0], produced_units=5)
+        ProductionDetail.objects.create(production=production, product=self.products[1], produced_units=1)
+        self.assertEqual(consume_stock(production), {})
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 88)
+
+        draft = Production.objects.create(draft=True)
+        ProductionDetail.objects.create(production=draft, product=self.products[0], produced_units=5)
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 88)
+
+    def test_edits_after_consumption_follow_the_stock(self):
+        production = record_production({self.products[0].uid: 5})
+        detail = ProductionDetail.objects.get(production=production)
+        detail.produced_units = 8
+        detail.save()
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 84)
+
+        added = ProductionDetail.objects.create(
+            production=production, product=self.products[1], produced_units=3)
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 78)
+        added.product = self.products[0]
+        added.save()
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 78)
+
+        detail.delete()
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 94)
+        Production.objects.get(pk=production.pk).delete()
+        for item in Item.objects.all():
+            self.assertEqual(item.amount, 100)
+        self.assertEqual(set(stock_as_of(timezone.now()).values()), {Decimal(100)})
+
+    def test_returns_follow_the_ledger_after_a_bom_change(self):
+        first = record_production({self.products[0].uid: 5})
+        second = record_production({self.products[0].uid: 5})
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 80)
+        for component in Component.objects.filter(product=self.products[0]):
+            component.amount = 3
+            component.save()
+
+        ProductionDetail.objects.get(production=first).delete()
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 90)
+        Production.objects.get(pk=second.pk).delete()
+        for item in Item.objects.all():
+            self.assertEqual(item.amount, 100)
+        self.assertEqual(set(stock_as_of(timezone.now()).values()), {Decimal(100)})
+
+
+class StockLedgerTests(TestCase):
+
+    def setUp(self):
+        # Each item opens with an adjustment of 100, each product uses 2 of each item
+        _, self.items = make_catalog(products=2, items_per_product=2)
+        self.products = list(Product.objects.order_by('slug'))
+
+    def assertLedgerMatchesStock(self):
+        self.assertEqual(stock_as_of(timezone.now()),
+                         dict(Item.objects.values_list('pk', 'amount')))
+
+    def test_every_stock_change_is_a_movement(self):
+        receive_stock({self.items[0].pk: 50})
+        production = record_production({self.products[0].uid: 5})
+        item = Item.objects.get(pk=self.items[1].pk)
+        item.amount = 120
+        item.save()
+
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 140)
+        movements = StockMovement.objects.filter(item=self.items[1].pk).order_by('added')
+        self.assertEqual([(movement.kind, movement.quantity) for movement in movements], [
+            ('adjustment', 100), ('consumption', -10), ('adjustment', 30)])
+        self.assertEqual(movements[1].production, production)
+        self.assertLedgerMatchesStock()
+
+    def test_stock_as_of_reads_the_latest_snapshot_and_later_movements(self):
+        now = timezone.now()
+        item = self.items[0].pk
+        StockMovement.objects.update(added=now - datetime.timedelta(days=10))
+        for days, quantity in ((5, 10), (3, -4), (1, 20)):
+            receive_stock({item: quantity})
+            StockMovement.objects.filter(added__gt=now - datetime.timedelta(days=1)).update(
+                added=now - datetime.timedelta(days=days))
+
+        def stock(days):
+            return stock_as_of(now - datetime.timedelta(days=days), [item])[item]
+
+        self.assertEqual([stock(7), stock(4), stock(2), stock(0)], [100, 110, 106, 126])
+        self.assertEqual(take_snapshot(now - datetime.timedelta(days=4)), 2)
+        self.assertEqual(take_snapshot(now - datetime.timedelta(days=4)), 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(stock(2), 106)
+
+        # Only the item that moved since its snapshot gets a new one
+        self.assertEqual(compact_ledger(now - datetime.timedelta(days=2)), (1, 4))
+        self.assertEqual(StockSnapshot.objects.count(), 3)
+        self.assertEqual([stock(4), stock(2), stock(0)], [110, 106, 126])
+        self.assertLedgerMatchesStock()
+
+    def test_imported_amounts_are_adjusted_in_the_ledger(self):
+        import_catalog('item', [(2, {'name': 'Item 0', 'slug': 'item-0', 'price': '1', 'amount': '80',
+                                     'measurement_unit': 'kg', 'category': 'bakery'})])
+        self.assertEqual(StockMovement.objects.filter(item=self.items[0].pk).count(), 2)
+        self.assertLedgerMatchesStock()
+
+    def test_stock_view_and_compaction_command(self):
+        self.client.force_login(User.objects.create_user('storekeeper', password='secret-pass'))
+        before = timezone.now()
+        receive_stock({self.items[0].pk: 5})
+        response = self.client.get(
+            reverse('stock-as-of'), {'as_of': before.isoformat(), 'items': 'item-0'})
+        self.assertEqual(response.json()['stock'], {'item-0': '100.00'})
+        response = self.client.get(reverse('stock-as-of'))
+        self.assertEqual(response.json()['stock'], {'item-0': '105.00', 'item-1': '100.00'})
+        self.assertEqual(self.client.get(reverse('stock-as-of'), {'as_of': 'soon'}).status_code, 400)
+
+        # Movements of the last STOCK_SNAPSHOT_MARGIN seconds may not all be committed yet
+        StockMovement.objects.update(added=before - datetime.timedelta(minutes=2))
+        receive_stock({self.items[1].pk: 7})
+        out = io.StringIO()
+        call_command('compact_stock_ledger', keep_days=0, stdout=out)
+        self.assertIn('Wrote 2 snapshots and deleted 3 movements', out.getvalue())
+        call_command('compact_stock_ledger', snapshot_only=True, stdout=out)
+        self.assertIn('Wrote 0 snapshots and deleted 0 movements', out.getvalue())
+        self.assertEqual(StockMovement.objects.get().quantity, 7)
+        self.assertLedgerMatchesStock()
+
+    def test_movements_are_stamped_when_written(self):
+        before = timezone.now()
+        movement = StockMovement(item_id=self.items[0].pk, kind=StockMovement.RECEIPT, quantity=1,
+                                 added=before - datetime.timedelta(days=1))
+        record_movements([movement])
+        self.assertGreaterEqual(StockMovement.objects.get(pk=movement.pk).added, before)
+        self.assertEqual(take_snapshot(timezone.now()), 0)
+
+
+class MultiLevelBomTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        # product-0 and product-1 each use 2 of item-0 and 2 of item-1
+        _, self.items = make_catalog(products=3, items_per_product=2)
+        self.dough, self.bread, self.basket = Product.objects.order_by('slug')
+        Component.objects.filter(product=self.basket).delete()
+        # a basket holds 3 breads, each bread is 2 doughs plus its own items
+        self.bread_link = SubAssembly.objects.create(product=self.bread, component=self.dough, amount=2)
+        SubAssembly.objects.create(product=self.basket, component=self.bread, amount=3)
+
+    def closure(self):
+        return set(BomClosure.objects.values_list('ancestor', 'descendant', 'quantity', 'paths'))
+
+    def test_products_are_exploded_through_every_level(self):
+        boms = explode_products([self.basket.pk, self.bread.pk])
+        # per bread: 2 own + 2 doughs * 2 = 6 of each item
+        self.assertEqual(boms[self.bread.pk], {item.pk: 6 for item in self.items})
+        self.assertEqual(boms[self.basket.pk], {item.pk: 18 for item in self.items})
+
+        lines = plan_requirements({self.basket.uid: 2})
+        self.assertEqual([line['required'] for line in lines], [36, 36])
+
+    def test_costs_and_consumption_include_sub_assemblies(self):
+        recompute_costs()
+        self.basket.refresh_from_db()
+        # item prices are 1 and 2
+        self.assertEqual(self.basket.product_cost, 54)
+
+        record_production({self.basket.uid: 1})
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 82)
+
+        # repricing an item flags the products using it at every level
+        item = Item.objects.get(pk=self.items[0].pk)
+        item.price = 2
+        item.save()
+        self.assertEqual(Product.objects.filter(cost_stale=True).count(), 3)
+
+    def test_where_used(self):
+        self.assertEqual(set(where_used(self.items[0].pk)), {self.dough, self.bread, self.basket})
+        self.assertEqual(set(products_using(self.dough.pk)), {self.bread, self.basket})
+        self.assertEqual(set(products_using(self.basket.pk)), set())
+
+    def test_cycles_are_rejected(self):
+        self.assertTrue(creates_cycle(self.dough.pk, self.basket.pk))
+        self.assertFalse(creates_cycle(self.basket.pk, self.dough.pk))
+        with self.assertRaises(ValidationError):
+            SubAssembly.objects.create(product=self.dough, component=self.basket, amount=1)
+        with self.assertRaises(IntegrityError):
+            SubAssembly.objects.bulk_create([SubAssembly(product=self.dough, component=self.dough, amount=1)])
+
+    def test_closure_is_maintained_incrementally(self):
+        # a second path from the basket to the dough
+        SubAssembly.objects.create(product=self.basket, component=self.dough, amount=1)
+        self.assertIn((self.basket.pk, self.dough.pk, 7, 2), self.closure())
+
+        link = SubAssembly.objects.get(pk=self.bread_link.pk)
+        link.amount = 5
+        link.save()
+        self.assertIn((self.basket.pk, self.dough.pk, 16, 2), self.closure())
+        incremental = self.closure()
+        rebuild_closure()
+        self.assertEqual(self.closure(), incremental)
+
+        link.delete()
+        self.assertIn((self.basket.pk, self.dough.pk, 1, 1), self.closure())
+        self.assertNotIn(self.bread.pk, {row[0] for row in self.closure() if row[1] == self.dough.pk})
+
+    def test_deleting_a_sub_assembly_product(self):
+        self.bread.delete()
+        self.assertEqual(explode_products([self.basket.pk])[self.basket.pk], {})
+        incremental = self.closure()
+        rebuild_closure()
+        self.assertEqual(self.closure(), incremental)
+        self.assertEqual(len(incremental), 2)
+
+
+class PriceImpactTests(TestCase):
+
+    def setUp(self):
+        # product-0 and product-1 each use 2 of item-0 (price 1) and 2 of item-1 (price 2)
+        _, self.items = make_catalog(products=2, items_per_product=2)
+        self.products = list(Product.objects.order_by('slug'))
+        self.bundle = Product.objects.create(
+            name='Bundle', slug='bundle', price=50, units=1, category=self.products[0].category)
+        SubAssembly.objects.create(product=self.bundle, component=self.products[0], amount=3)
+        recompute_costs()
+        # Details consume the stock of recorded productions as they are saved
+        self.open = Production.objects.create(draft=True)
+        ProductionDetail.objects.create(production=self.open, product=self.bundle, produced_units=2)
+        self.closed = record_production({self.products[1].uid: 1})
+
+    def test_products_and_open_productions_are_reported(self):
+        report = price_impact({self.items[0].pk: Decimal('1.50'), self.items[1].pk: 2})
+        lines = {line['slug']: line for line in report['products']}
+        self.assertEqual(report['products'][0]['slug'], 'bundle')
+        self.assertEqual(set(lines), {'bundle', 'product-0', 'product-1'})
+        self.assertEqual(lines['product-0']['delta'], 1)
+        self.assertEqual(lines['product-0']['new_cost'], 7)
+        self.assertEqual(lines['bundle']['delta'], 3)
+        # the recorded production already consumed its stock
+        self.assertEqual(report['productions'], [{
+            'uid': self.open.uid, 'added': self.open.added,
+            'cost': 36, 'new_cost': 42, 'delta': 6,
+        }])
+        # nothing is saved
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).price, 1)
+
+    def test_unchanged_prices_have_no_impact(self):
+        with self.assertNumQueries(1):
+            report = price_impact({self.items[0].pk: 1})
+        self.assertEqual(report, {'products': [], 'productions': []})
+
+    def test_price_impact_view(self):
+        user = User.objects.create_user('buyer', password='secret-pass')
+        self.client.force_login(user)
+        response = self.client.post(
+            reverse('price-impact'), {'prices': {'item-1': '3'}}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([line['delta'] for line in response.json()['products']], ['6.00', '2.00', '2.00'])
+        response = self.client.post(
+            reverse('price-impact'), {'prices': {'nothing': 1}}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductionSchedulingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        # Every product uses 2 of item-0 and 2 of item-1 (100 in stock each)
+        category, self.items = make_catalog(products=3, items_per_product=2)
+        self.products = list(Product.objects.order_by('slug'))
+        # product-2 also needs 5 saffron a unit, and only 10 are in stock
+        self.saffron = Item.objects.create(
+            name='Saffron', slug='saffron', thumbnail='item/x.png', price=30, amount=10,
+            measurement_unit='g', category=category)
+        Component.objects.create(product=self.products[2], item=self.saffron, amount=5)
+        Product.objects.filter(pk=self.products[0].pk).update(daily_capacity=5)
+        recompute_costs()
+        self.start = datetime.date(2031, 5, 1)
+        self.demand = {self.products[0].pk: 20, self.products[1].pk: 20, self.products[2].pk: 10}
+
+    def test_plan_fits_stock_and_capacities(self):
+        schedule = schedule_production(self.demand, start=self.start, days=4, line_capacity=12)
+        p0, p1, p2 = (product.pk for product in self.products)
+        self.assertEqual(schedule['days'], [
+            (datetime.date(2031, 5, 1), {p0: 5, p1: 7}),
+            (datetime.date(2031, 5, 2), {p0: 5, p1: 7}),
+            (datetime.date(2031, 5, 3), {p0: 5, p1: 6, p2: 1}),
+            (datetime.date(2031, 5, 4), {p0: 5, p2: 1}),
+        ])
+        # product-2 competes for the saffron, so it is served last
+        self.assertEqual(schedule['scheduled'], {p0: 20, p1: 20, p2: 2})
+        self.assertEqual(schedule['unscheduled'], {p2: 8})
+        self.assertEqual(schedule['reasons'], {p2: 'stock'})
+        self.assertEqual(schedule['consumption'], {
+            self.items[0].pk: 84, self.items[1].pk: 84, self.saffron.pk: 10})
+
+    def test_short_horizons_are_capacity_bound(self):
+        schedule = schedule_production(self.demand, start=self.start, days=3, line_capacity=12)
+        p0, p1, p2 = (product.pk for product in self.products)
+        self.assertEqual(schedule['unscheduled'], {p0: 5, p2: 9})
+        self.assertEqual(schedule['reasons'], {p0: 'capacity', p2: 'capacity'})
+        with self.assertRaises(LookupError):
+            schedule_production({uuid.uuid4(): 1})
+
+    def test_drafts_are_written_in_bulk_and_released_once(self):
+        schedule = schedule_production(self.demand, start=self.start, days=4, line_capacity=12)
+        with self.assertNumQueries(6):
+            drafts = write_schedule(schedule)
+        self.assertEqual(len(drafts), 4)
+        self.assertEqual(ProductionDetail.objects.filter(production__draft=True).count(), 9)
+        # 5 units of product-0 and 7 of product-1, at 6 a unit
+        self.assertEqual(Production.objects.get(pk=drafts[0].pk).production_cost, 72)
+        # Drafts take nothing out of stock and stay out of the reports
+        self.assertEqual(consume_stock(drafts[0]), {})
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 100)
+        rebuild_rollups()
+        self.assertEqual(production_report('day', 'total'), [])
+
+        self.assertEqual(release_production(drafts[0]), {self.items[0].pk: 24, self.items[1].pk: 24})
+        self.assertEqual(release_production(drafts[0]), {})
+        self.assertEqual(Item.objects.get(pk=self.items[0].pk).amount, 76)
+        self.assertEqual(production_report('day', 'total')[0]['produced_units'], 12)
+
+    def test_outstanding_drafts_are_planned_around(self):
+        write_schedule(schedule_production(self.demand, start=self.start, days=4, line_capacity=12))
+        schedule = schedule_production(self.demand, start=self.start, days=4, line_capacity=12)
+        p0, p1, p2 = (product.pk for product in self.products)
+        # Only the last day has line time left, and product-0 is at capacity every day
+        self.assertEqual(schedule['days'], [(datetime.date(2031, 5, 4), {p1: 6})])
+        self.assertEqual(schedule['reasons'], {p0: 'capacity', p1: 'capacity', p2: 'stock'})
+        # 16 of item-0 and item-1 are left after the drafts, and no saffron
+        self.assertEqual(schedule['consumption'], {self.items[0].pk: 12, self.items[1].pk: 12})
+
+        # Drafts outside the horizon still hold their stock
+        schedule = schedule_production(self.demand, start=datetime.date(2031, 6, 1), days=4)
+        self.assertEqual(sum(schedule['scheduled'].values()), 8)
+
+    def test_schedule_production_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'demand.csv')
+            with open(path, 'w', newline='') as handle:
+                handle.write('slug,units\nproduct-1,4\nproduct-1,6\nnothing,3\n')
+            out = io.StringIO()
+            call_command('schedule_production', path, days=5, stdout=out)
+        self.assertIn('Planned 10 of 10 units over 1 days', out.getvalue())
+        self.assertIn('Skipped 1 unknown products', out.getvalue())
+        detail = ProductionDetail.objects.get(production__draft=True)
+        self.assertEqual((detail.product, detail.produced_units), (self.products[1], 10))
+
+
+class ProductionReportTests(TestCase):
+
+    def setUp(self):
+        make_catalog(products=2, items_per_product=1)
+        self.products = list(Product.objects.order_by('slug'))
+        self.dairy = Category.objects.create(name='Dairy', slug='dairy', thumbnail='category/x.png')
+
+    def produce(self, day, units):
+        added = timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+        return record_production(
+            {product.uid: units for product in self.products}, added=added)
+
+    def test_rollups_follow_detail_changes(self):
+        production = self.produce(datetime.date(2023, 1, 5), 3)
+        self.produce(datetime.date(2023, 1, 5), 2)
+        self.assertEqual(
+            DailyProductionRollup.objects.get(product=self.products[0]).produced_units, 5)
+
+        detail = production.productiondetail_set.get(product=self.products[0])
+        detail.produced_units = 10
+        detail.save()
+        self.assertEqual(
+            DailyProductionRollup.objects.get(product=self.products[0]).produced_units, 12)
+
+        production.delete()
+        self.assertEqual(
+            DailyProductionRollup.objects.get(product=self.products[0]).produced_units, 2)
+
+    def test_rebuilds_upsert_over_rows_written_concurrently(self):
+        self.produce(datetime.date(2023, 1, 5), 3)
+        # As left by a concurrent rebuild of the same day, plus a row no detail explains
+        DailyProductionRollup.objects.update(produced_units=99)
+        DailyProductionRollup.objects.filter(product=self.products[1]).update(day=datetime.date(2023, 1, 6))
+        DailyProductionRollup.objects.create(
+            day=datetime.date(2023, 1, 5), product=self.products[1], category=self.dairy, produced_units=1)
+        self.assertEqual(rebuild_rollups(datetime.date(2023, 1, 5), datetime.date(2023, 1, 6)), 2)
+        self.assertEqual(
+            sorted(DailyProductionRollup.objects.values_list('day', 'product__slug', 'category__slug',
+                                                             'produced_units')),
+            [(datetime.date(2023, 1, 5), 'product-0', 'bakery', 3),
+             (datetime.date(2023, 1, 5), 'product-1', 'bakery', 3)])
+
+    def test_moving_a_production_moves_its_units(self):
+        production = self.produce(datetime.date(2023, 1, 5), 3)
+        production = Production.objects.get(pk=production.pk)
+        production.added += datetime.timedelta(days=40)
+        production.save()
+        self.assertEqual(
+            list(DailyProductionRollup.objects.values_list('day', flat=True).distinct()),
+            [datetime.date(2023, 2, 14)])
+
+    def test_product_category_changes_reach_the_rollups(self):
+        self.produce(datetime.date(2023, 1, 5), 3)
+        self.products[0].category = self.dairy
+        self.products[0].save()
+        rows = production_report('year', 'category')
+        self.assertEqual(
+            [(row['slug'], row['produced_units']) for row in rows], [('bakery', 3), ('dairy', 3)])
+
+    def test_report_reads_only_the_rollups(self):
+        for month in range(1, 13):
+            self.produce(datetime.date(2022, month, 1), month)
+        self.produce(datetime.date(2023, 3, 1), 100)
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = production_report('year', 'product')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('productiondetail', queries[0]['sql'])
+        self.assertEqual(
+            [(row['period'].year, row['slug'], row['produced_units']) for row in rows],
+            [(2022, 'product-0', 78), (2022, 'product-1', 78),
+             (2023, 'product-0', 100), (2023, 'product-1', 100)])
+
+        rows = production_report('month', 'total', since=datetime.date(2022, 11, 1),
+                                 until=datetime.date(2022, 12, 31))
+        self.assertEqual([row['produced_units'] for row in rows], [22, 24])
+
+    def test_rebuild_matches_the_signals(self):
+        self.produce(datetime.date(2023, 1, 5), 3)
+        self.produce(datetime.date(2023, 1, 6), 4)
+        expected = set(DailyProductionRollup.objects.values_list('day', 'product', 'produced_units'))
+        DailyProductionRollup.objects.all().delete()
+        self.assertEqual(rebuild_rollups(), 4)
+        self.assertEqual(
+            set(DailyProductionRollup.objects.values_list('day', 'product', 'produced_units')),
+            expected)
+
+    def test_report_view(self):
+        self.produce(datetime.date(2023, 1, 5), 3)
+        self.client.force_login(User.objects.create_user('manager', password='secret-pass'))
+        response = self.client.get(reverse('production-report'), {'period': 'week', 'group': 'total'})
+        self.assertEqual(response.json()['rows'], [{'period': '2023-01-02', 'produced_units': 6}])
+        response = self.client.get(reverse('production-report'), {'period': 'decade'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogSearchTests(TestCase):
+
+    def setUp(self):
+        self.category, _ = make_catalog(products=2, items_per_product=2)
+        Item.objects.create(
+            name='Wheat flour', slug='wheat-flour', description='Stone ground',
+            thumbnail='item/x.png', price=1, amount=1, measurement_unit='kg', category=self.category)
+        Item.objects.create(
+            name='Bread improver', slug='bread-improver', description='Mix with flour',
+            thumbnail='item/x.png', price=1, amount=1, measurement_unit='kg', category=self.category)
+
+    def slugs(self, query, **kwargs):
+        return [document.slug for document in search(query, **kwargs)]
+
+    def test_prefixes_match_and_names_rank_first(self):
+        self.assertEqual(self.slugs('flo'), ['wheat-flour', 'bread-improver'])
+        self.assertEqual(self.slugs('whe flo'), ['wheat-flour'])
+        self.assertEqual(self.slugs('stone'), ['wheat-flour'])
+        self.assertEqual(self.slugs('  '), [])
+
+    def test_category_names_and_kinds(self):
+        self.assertEqual(self.slugs('bakery', kinds=['category']), ['bakery'])
+        self.assertEqual(len(self.slugs('bakery', kinds=['product'])), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.slugs('bakery', kinds=['foo']), [])
+
+    def test_documents_follow_catalog_changes(self):
+        item = Item.objects.get(slug='wheat-flour')
+        item.name = 'Rye flour'
+        item.save()
+        self.assertEqual(self.slugs('rye'), ['wheat-flour'])
+        self.assertEqual(self.slugs('wheat'), [])
+
+        self.category.name = 'Pastry'
+        self.category.save()
+        self.assertEqual(len(self.slugs('pastry', kinds=['item'])), 4)
+
+        item.delete()
+        self.assertEqual(self.slugs('rye'), [])
+
+    def test_imports_are_indexed(self):
+        import_catalog('item', enumerate([{
+            'name': 'Cane sugar', 'slug': 'cane-sugar', 'price': '2', 'amount': '5',
+            'measurement_unit': 'kg', 'category': 'bakery'}], start=2))
+        self.assertEqual(self.slugs('cane'), ['cane-sugar'])
+
+    def test_rebuild(self):
+        SearchDocument.objects.all().delete()
+        self.assertEqual(self.slugs('flour'), [])
+        self.assertEqual(rebuild_index(), 1 + 4 + 2)
+        self.assertEqual(self.slugs('flour'), ['wheat-flour', 'bread-improver'])
+
+    def test_search_view_and_admin(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='secret-pass'))
+        response = self.client.get(reverse('catalog-search'), {'q': 'bread imp'})
+        self.assertEqual(response.json()['results'],
+                         [{'kind': 'item', 'slug': 'bread-improver', 'name': 'Bread improver'}])
+        response = self.client.get(reverse('catalog-search'), {'q': 'flour', 'kind': 'foo'})
+        self.assertEqual(response.json()['results'], [])
+        response = self.client.get(reverse('catalog-search'), {'q': 'flour', 'limit': -1})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('admin:production_item_changelist'), {'q': 'flour'})
+        self.assertEqual(
+            {item.slug for item in response.context['cl'].result_list}, {'wheat-flour', 'bread-improver'})
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'query plans are checked on SQLite')
+class QueryPlanTests(TestCase):
+
+    def assertUsesIndex(self, queryset, *indexes):
+        plan = queryset.explain()
+        self.assertTrue(any(f'USING INDEX {index}' in plan for index in indexes), plan)
+
+    def test_newest_first_lists_use_the_added_indexes(self):
+        self.assertUsesIndex(Item.objects.order_by('-added', '-uid')[:26], 'item_added_idx')
+        self.assertUsesIndex(Product.objects.order_by('-added', '-uid')[:26], 'product_added_idx')
+        self.assertUsesIndex(Production.objects.order_by('-added', '-uid')[:26], 'production_added_idx')
+
+    def test_category_filter_uses_the_composite_index(self):
+        self.assertUsesIndex(
+            Item.objects.filter(category=1).order_by('-added'), 'item_category_added_idx')
+        self.assertUsesIndex(
+            Product.objects.filter(category=1).order_by('-added'), 'product_category_added_idx')
+
+    def test_joins_use_the_composite_indexes(self):
+        production, product = uuid.uuid4(), uuid.uuid4()
+        self.assertUsesIndex(
+            ProductionDetail.objects.filter(production=production, product=product),
+            'detail_production_product_idx', 'detail_product_production_idx')
+        # SQLite backs the unique constraint with an automatic index
+        plan = Component.objects.filter(product=product, item=uuid.uuid4()).explain()
+        self.assertIn('(product_id=? AND item_id=?)', plan)
+
+    def test_components_are_unique_per_product_and_item(self):
+        make_catalog(products=1, items_per_product=1)
+        with self.assertRaises(IntegrityError):
+            Component.objects.create(
+                product=Product.objects.get(), item=Item.objects.get(), amount=1)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+
+    def test_reads_use_the_replica_only_inside_use_replica(self):
+        router = ReplicaRouter()
+        with mock.patch('core.routers.connections') as connections:
+            connections.databases = {'default': {}, 'replica': {}}
+            self.assertIsNone(router.db_for_read(Item))
+            with use_replica():
+                self.assertEqual(router.db_for_read(Item), 'replica')
+                self.assertEqual(router.db_for_write(Item), 'default')
+            self.assertIsNone(router.db_for_read(Item))
+
+    def test_reads_stay_on_default_without_a_replica(self):
+        with use_replica():
+            self.assertIsNone(ReplicaRouter().db_for_read(Item))
+
+
+class CatalogCacheTests(TestCase):
+
+    def setUp(self):
+        caches['catalog'].clear()
+        self.category, self.items = make_catalog(products=1, items_per_product=2)
+        self.product = Product.objects.get()
+
+    def test_reads_are_served_from_the_cache(self):
+        catalog_cache.get_item(slug='item-0')
+        with self.assertNumQueries(0):
+            item = catalog_cache.get_item(slug='item-0')
+            self.assertEqual(catalog_cache.get_item(pk=item.pk), item)
+        self.assertGreaterEqual(catalog_cache.cache_stats()['item']['hits'], 2)
+
+    def test_products_are_cached_with_their_components(self):
+        catalog_cache.get_product(pk=self.product.pk)
+        with self.assertNumQueries(0):
+            product = catalog_cache.get_product(pk=self.product.pk)
+            names = sorted(component.item.name for component in product.component_set.all())
+        self.assertEqual(names, ['Item 0', 'Item 1'])
+
+    def test_saves_and_composition_changes_invalidate(self):
+        catalog_cache.get_category(slug='bakery')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.category.name = 'Bread'
+            self.category.save()
+            # Until the save commits, other readers could cache the old row again
+            self.assertEqual(catalog_cache.get_category(slug='bakery').name, 'Bakery')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(catalog_cache.get_category(slug='bakery').name, 'Bread')
+
+        catalog_cache.get_product(slug='product-0')
+        with self.captureOnCommitCallbacks(execute=True):
+            Component.objects.filter(item=self.items[0]).delete()
+        self.assertEqual(catalog_cache.get_product(slug='product-0').component_set.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.composition.add(self.items[0], through_defaults={'amount': 1})
+        self.assertEqual(len(catalog_cache.get_product(slug='product-0').component_set.all()), 2)
+
+        item = Item.objects.get(pk=self.items[1].pk)
+        item.name = 'Flour'
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        product = catalog_cache.get_product(slug='product-0')
+        self.assertIn('Flour', [component.item.name for component in product.component_set.all()])
+
+    def test_renamed_slugs_are_not_served(self):
+        catalog_cache.get_item(slug='item-0')
+        Item.objects.filter(slug='item-0').update(slug='item-zero')
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog_cache.invalidate('item', [self.items[0].pk])
+        self.assertIsNone(catalog_cache.get_item(slug='item-0'))
+        self.assertEqual(catalog_cache.get_item(slug='item-zero').pk, self.items[0].pk)
+
+    def test_api_details_are_served_from_the_cache(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('scanner', password='secret-pass'))
+        self.client.get(reverse('api-product', args=['product-0']))
+        # The session, the user, the product, its components and its category are cached
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api-product', args=['product-0']))
+        body = response.json()
+        self.assertEqual(body['category'], 'bakery')
+        self.assertEqual(sorted(component['item'] for component in body['components']), ['item-0', 'item-1'])
+
+    def test_slugs_are_resolved_through_the_cache(self):
+        self.assertEqual(set(catalog_cache.get_cached_many('item', ['item-0', 'item-1', 'missing'])),
+                         {'item-0', 'item-1'})
+        with self.assertNumQueries(0):
+            items = catalog_cache.get_cached_many('item', ['item-1', 'item-0'])
+        self.assertEqual(items['item-0'].pk, self.items[0].pk)
+
+
+@override_settings(THUMBNAIL_BACKGROUND=False)
+class ThumbnailTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root.name))
+        self.category = Category.objects.create(name='Tools', slug='tools')
+
+    def upload(self, width, height):
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), 'orange').save(buffer, 'PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def test_derivatives_are_generated_on_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = Item.objects.create(
+                name='Saw', slug='saw', thumbnail=self.upload(2000, 1000),
+                measurement_unit='unit', category=self.category)
+        item.refresh_from_db()
+        self.assertEqual(item.thumbnail_sizes, ['small', 'medium', 'large'])
+        self.assertEqual(item.get_thumbnail(), item.thumbnail.url)
+        self.assertTrue(item.get_thumbnail(size='small').endswith('photo__small.webp'))
+        with item.thumbnail.storage.open(derivative_name(item.thumbnail.name, 'medium')) as medium:
+            self.assertEqual(Image.open(medium).size, (320, 160))
+
+    def test_original_is_served_until_derivatives_exist(self):
+        item = Item.objects.create(
+            name='Saw', slug='saw', thumbnail=self.upload(50, 50),
+            measurement_unit='unit', category=self.category)
+        self.assertEqual(item.get_thumbnail(size='large'), item.thumbnail.url)
+        self.assertEqual(len(generate_derivatives(item.thumbnail.name)), 3)
+        self.assertEqual(generate_derivatives(item.thumbnail.name), [])
+
+    @override_settings(THUMBNAIL_BACKGROUND=True)
+    def test_derivatives_are_queued_for_the_workers(self):
+        item = Item.objects.create(
+            name='Saw', slug='saw', thumbnail=self.upload(400, 200),
+            measurement_unit='unit', category=self.category)
+        item.save()
+        job = Job.objects.get(task='production.generate_thumbnails')
+        self.assertEqual(job.args, [item.thumbnail.name])
+
+        run_job(claim_job('test'))
+        item.refresh_from_db()
+        self.assertTrue(item.get_thumbnail(size='small').endswith('photo__small.webp'))
+
+    @override_settings(THUMBNAIL_BACKGROUND=True)
+    def test_only_new_thumbnails_are_queued(self):
+        item = Item.objects.create(
+            name='Saw', slug='saw', thumbnail=self.upload(400, 200),
+            measurement_unit='unit', category=self.category)
+        item = Item.objects.get(pk=item.pk)
+        item.price = 12
+        item.save()
+        self.assertEqual(Job.objects.filter(task='production.generate_thumbnails').count(), 1)
+
+        run_job(claim_job('test'))
+        item = Item.objects.get(pk=item.pk)
+        item.thumbnail = self.upload(300, 300)
+        item.save()
+        self.assertEqual(item.thumbnail_sizes, [])
+        self.assertEqual(Job.objects.filter(task='production.generate_thumbnails', status=Job.QUEUED).count(), 1)
+
+    def test_urls_are_built_without_storage_lookups(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = Item.objects.create(
+                name='Saw', slug='saw', thumbnail=self.upload(400, 200),
+                measurement_unit='unit', category=self.category)
+        item.refresh_from_db()
+        with mock.patch('django.core.files.storage.FileSystemStorage.exists') as exists:
+            self.assertTrue(item.get_thumbnail(size='medium').endswith('photo__medium.webp'))
+        exists.assert_not_called()
+
+
+class AdminChangelistTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_superuser('admin', password='secret-pass')
+        self.client.force_login(user)
+        # Later requests find the user in the cache
+        self.client.get(reverse('admin:index'))
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:production_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        make_catalog(products=5, items_per_product=3)
+        for product in Product.objects.all():
+            ProductionDetail.objects.create(
+                production=Production.objects.create(), product=product, produced_units=1)
+        small = {model: self.changelist_queries(model)
+                 for model in ('item', 'product', 'component', 'production', 'productiondetail')}
+
+        for n in range(60):
+            product = Product.objects.create(
+                name=f'Extra {n}', slug=f'extra-{n}', units=1,
+                category=Category.objects.get(), thumbnail='product/x.png')
+            for item in Item.objects.all():
+                Component.objects.create(product=product, item=item, amount=1)
+            ProductionDetail.objects.create(
+                production=Production.objects.create(), product=product, produced_units=1)
+        for model, count in small.items():
+            self.assertEqual(self.changelist_queries(model), count, model)
+            self.assertLessEqual(count, 10, model)
+
+    def test_composition_is_aggregated_in_the_database(self):
+        make_catalog(products=1, items_per_product=2)
+        response = self.client.get(reverse('admin:production_product_changelist'))
+        names = response.context['cl'].result_list[0].composition_names
+        self.assertEqual(sorted(names.split(', ')), ['Item 0', 'Item 1'])
+
+
+class KeysetPaginationTests(TestCase):
+
+    def test_pages_cover_every_row_once(self):
+        make_catalog(products=7)
+        seen = []
+        cursor = None
+        while True:
+            page = keyset_paginate(Product.objects.all(), cursor, per_page=3)
+            seen.extend(product.uid for product in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(set(seen), set(Product.objects.values_list('uid', flat=True)))
+
+    def test_ties_on_added_are_broken_by_uid(self):
+        make_catalog(products=0)
+        added = timezone.now()
+        for _ in range(5):
+            Production.objects.create(added=added)
+        first = keyset_paginate(Production.objects.all(), None, per_page=2)
+        second = keyset_paginate(Production.objects.all(), first.next_cursor, per_page=2)
+        self.assertFalse(set(p.uid for p in first) & set(p.uid for p in second))
+
+    def test_malformed_cursor_returns_first_page(self):
+        make_catalog(products=2)
+        page = keyset_paginate(Product.objects.all(), 'not-a-cursor', per_page=5)
+        self.assertEqual(len(page), 2)
+        self.assertFalse(page.has_next)
+
+
+@override_settings(DASHBOARD_PARALLEL_QUERIES=False)
+class DashboardTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('worker', password='secret-pass')
+        self.client.force_login(self.user)
+
+    def test_dashboard_query_budget_is_independent_of_catalog_size(self):
+        _, items = make_catalog(products=20, items_per_product=4)
+        production = Production.objects.create()
+        ProductionDetail.objects.create(
+            production=production, product=Product.objects.first(), produced_units=3)
+        # user, KPI refresh job lookup + insert, items, products, components + items,
+        # productions; the session is cached
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, items[0].name)
+
+    def test_dashboard_links_to_next_page(self):
+        make_catalog(products=30, items_per_product=1)
+        response = self.client.get(reverse('dashboard'))
+        self.assertTrue(response.context['products'].has_next)
+        cursor = response.context['products'].next_cursor
+        response = self.client.get(reverse('dashboard'), {'products_after': cursor})
+        self.assertEqual(len(response.context['products']), 5)
+        self.assertFalse(response.context['products'].has_next)
+
+    def test_lists_are_cached_until_their_models_change(self):
+        _, items = make_catalog(products=3, items_per_product=2)
+        self.client.get(reverse('dashboard'))
+        # The session, the user and the lists all come from the cache
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, items[0].name)
+
+        item = Item.objects.get(pk=items[0].pk)
+        item.name = 'Rye flour'
+        with self.captureOnCommitCallbacks() as callbacks:
+            item.save()
+        # Until the save commits, the fragments keep their version
+        with self.assertNumQueries(0):
+            self.client.get(reverse('dashboard'))
+        for callback in callbacks:
+            callback()
+        # items, products, components + items
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'Rye flour', count=4)
+
+    def test_unchanged_dashboard_is_not_modified(self):
+        make_catalog(products=2, items_per_product=1)
+        response = self.client.get(reverse('dashboard'))
+        self.assertIn('private', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('dashboard'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('dashboard'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Production.objects.create()
+        response = self.client.get(reverse('dashboard'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_dashboard_redirects_anonymous_users_to_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(reverse('user-login')))
+
+
+# The other dashboard tests run their queries serially: the rows they create
+# are not committed, so the query threads could not see them
+class ParallelDashboardTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        _, self.items = make_catalog(products=3, items_per_product=2)
+        self.client.force_login(User.objects.create_user('worker', password='secret-pass'))
+
+    def test_queries_run_on_the_shared_threads(self):
+        for _ in range(3):
+            # New versions so every list is queried again
+            bump_versions('item', 'product', 'production')
+            response = self.client.get(reverse('dashboard'))
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, self.items[0].name)
+            self.assertEqual(len(response.context['products']), 3)
+        threads = views._query_executor._threads
+        self.assertTrue(1 <= len(threads) <= views.DASHBOARD_QUERY_THREADS)
+        self.assertTrue(all(thread.name.startswith('dashboard-query') for thread in threads))
+
+
+@override_settings(DASHBOARD_PARALLEL_QUERIES=False)
+class KpiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        _, self.items = make_catalog(products=2, items_per_product=2)
+        self.products = list(Product.objects.order_by('slug'))
+        self.user = User.objects.create_user('worker', password='secret-pass')
+        self.client.force_login(self.user)
+
+    def test_kpis_are_computed_with_two_queries(self):
+        record_production({self.products[0].uid: 5})
+        record_production({self.products[1].uid: 4}, added=timezone.now() - datetime.timedelta(days=10))
+        draft = Production.objects.create(draft=True)
+        ProductionDetail.objects.create(production=draft, product=self.products[0], produced_units=7)
+        now = timezone.now()
+
+        with self.assertNumQueries(2):
+            kpis = compute_kpis(now)
+        # 82 kg of each item left, priced 1 and 2
+        self.assertEqual(kpis['inventory_value'], Decimal('246'))
+        self.assertEqual(kpis['products_per_category'], [{'slug': 'bakery', 'name': 'Bakery', 'products': 2}])
+        self.assertEqual(kpis['units_produced'], {1: 5, 7: 5, 30: 9})
+        self.assertEqual([item['quantity'] for item in kpis['top_consumed']], [18, 18])
+        self.assertEqual(kpis['computed'], now)
+
+    def test_dashboard_queues_a_single_refresh(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertIsNone(response.context['kpis'])
+        self.assertContains(response, 'being computed')
+        self.client.get(reverse('dashboard'))
+        self.assertEqual(Job.objects.filter(task='production.refresh_kpis').count(), 1)
+
+        run_job(claim_job('worker-1', tasks=['production.refresh_kpis']))
+        self.assertIsNotNone(cache.get(KPI_CACHE_KEY))
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['kpis']['inventory_value'], Decimal('300'))
+
+    def test_stale_kpis_are_shown_while_refreshing(self):
+        kpis = refresh_kpis()
+        kpis['computed'] -= datetime.timedelta(hours=1)
+        cache.set(KPI_CACHE_KEY, kpis)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['kpis']['computed'], kpis['computed'])
+        self.assertTrue(Job.objects.filter(task='production.refresh_kpis').exists())
+
+    @override_settings(KPI_BACKGROUND=False)
+    def test_kpis_are_computed_by_the_request_without_background_refresh(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['kpis']['units_produced'], {1: 0, 7: 0, 30: 0})
+        self.assertFalse(Job.objects.filter(task='production.refresh_kpis').exists())
+
+
+@override_settings(PROFILING=True, PROFILING_SLOW_REQUEST_MS=0, DASHBOARD_PARALLEL_QUERIES=False,
+                   METRICS_TOKEN='scrape-me')
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        profiling.registry.reset()
+        make_catalog(products=3, items_per_product=2)
+        self.client.force_login(User.objects.create_user('worker', password='secret-pass'))
+
+    def test_dashboard_metrics_in_prometheus_format(self):
+        with self.assertLogs('core.profiling.slow', 'WARNING') as logs:
+            response = self.client.get(reverse('dashboard'))
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        trace = json.loads(logs.records[0].getMessage())
+        self.assertEqual(trace['view'], 'dashboard')
+        # user, KPI refresh job lookup + insert, items, products, components + items, productions
+        self.assertEqual(trace['sql_queries'], 7)
+        self.assertGreater(trace['template_ms'], 0)
+
+        metrics = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me').content.decode()
+        self.assertIn('# TYPE erp_request_duration_seconds histogram', metrics)
+        self.assertIn('erp_sql_queries_bucket{view="dashboard",le="5"} 0', metrics)
+        self.assertIn('erp_sql_queries_bucket{view="dashboard",le="10"} 1', metrics)
+        self.assertIn('erp_sql_queries_count{view="dashboard"} 1', metrics)
+        self.assertIn('erp_duplicate_queries_total{view="dashboard"} 0', metrics)
+
+    def test_duplicate_queries_are_reported(self):
+        def view(request):
+            for product in Product.objects.all():
+                list(product.component_set.all())
+            return JsonResponse({})
+
+        request = RequestFactory().get('/')
+        request.resolver_match = mock.Mock(view_name='per-product')
+        with self.assertLogs('core.profiling.slow', 'WARNING') as logs:
+            profiling.ProfilingMiddleware(view)(request)
+        trace = json.loads(logs.records[0].getMessage())
+        self.assertEqual(trace['duplicate_queries'][0]['count'], 3)
+        self.assertEqual(profiling.registry.duplicates['per-product'], 2)
+
+    def test_metrics_need_the_token_or_a_staff_user(self):
+        # Behind a reverse proxy every client comes from 127.0.0.1
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer guessed')
+        self.assertEqual(response.status_code, 404)
+        with self.settings(METRICS_TOKEN=''):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 404)
+
+        self.client.force_login(User.objects.create_superuser('admin', password='secret-pass'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(DASHBOARD_PARALLEL_QUERIES=False)
+class SeedAndBenchmarkTests(TestCase):
+
+    def setUp(self):
+        self.counts = seed_erp(categories=2, items=20, products=5, components=3,
+                               productions=10, details=2, batch_size=7)
+
+    def test_seeded_dataset_is_complete(self):
+        self.assertEqual(self.counts['component'], 15)
+        self.assertEqual(ProductionDetail.objects.count(), 20)
+        self.assertFalse(Product.objects.filter(cost_stale=True).exists())
+        self.assertFalse(Production.objects.filter(production_cost__isnull=True).exists())
+        self.assertEqual(
+            sum(row['produced_units'] for row in production_report('year', 'total')),
+            sum(ProductionDetail.objects.values_list('produced_units', flat=True)))
+        self.assertEqual(SearchDocument.objects.count(), 2 + 20 + 5)
+
+        clear_seed()
+        for model in (Category, Item, Product, Production, DailyProductionRollup, SearchDocument):
+            self.assertFalse(model.objects.exists())
+
+    def test_benchmarks_record_latency_queries_and_memory(self):
+        results = run_benchmarks(['dashboard', 'dashboard_uncached', 'cost_rollup'], repeats=2)
+        self.assertEqual(set(results), {'dashboard', 'dashboard_uncached', 'cost_rollup'})
+        # The session, the user and the lists all come from the cache
+        self.assertEqual(results['dashboard']['queries'], 0)
+        # items, products, components + items, productions
+        self.assertEqual(results['dashboard_uncached']['queries'], 4)
+        self.assertGreater(results['cost_rollup']['peak_memory_kib'], 0)
+        self.assertLessEqual(results['dashboard']['min_ms'], results['dashboard']['max_ms'])
+
+    def test_http_benchmark_session_reaches_the_dashboard(self):
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = bench_http.Command().login()
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
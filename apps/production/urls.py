@@ -5,4 +5,12 @@ from . import views
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
+    path('export/productions', views.export_productions, name='export-productions'),
+    path('export/inventory', views.export_inventory, name='export-inventory'),
+    path('mrp', views.mrp, name='mrp'),
+    path('items/price-impact', views.price_impact_view, name='price-impact'),
+    path('items/stock', views.stock_view, name='stock-as-of'),
+    path('reports/production', views.production_report_view, name='production-report'),
+    path('search', views.catalog_search, name='catalog-search'),
+    path('cache/stats', views.catalog_cache_stats, name='catalog-cache-stats'),
 ]
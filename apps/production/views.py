@@ -1,24 +1,340 @@
 """Production app views"""
-from django.shortcuts import render
+import asyncio
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Prefetch
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, resolve_url
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
+from django.utils import timezone
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+
+from core.routers import use_replica
+
+from .catalog_cache import cache_stats, get_cached_many
+from .exporting import CONTENT_TYPES, export_stream, parse_bound
+from .fragments import aget_versions, etag, fragment_key
+from .impact import price_impact, resolve_prices
+from .kpis import aget_kpis
+from .ledger import STOCK_PLACES, stock_queryset
+from .models import Component, Item, Product, Production
+from .pagination import keyset_paginate
+from .planning import plan_requirements
+from .reporting import GROUPS, PERIODS, production_report
+from .search import search
+
+
+DASHBOARD_PAGE_SIZE = getattr(settings, 'DASHBOARD_PAGE_SIZE', 25)
 
-from .models import Item, Product, Production
+DASHBOARD_FRAGMENT_TIMEOUT = getattr(settings, 'DASHBOARD_FRAGMENT_TIMEOUT', 60 * 60)
+
+# Threads, and so database connections, running the dashboard queries of a process
+DASHBOARD_QUERY_THREADS = getattr(settings, 'DASHBOARD_QUERY_THREADS', 3)
+
+# Shared by every request, so its threads and their connections outlive each
+# one, even under WSGI where every request runs in a new event loop
+_query_executor = ThreadPoolExecutor(max_workers=DASHBOARD_QUERY_THREADS,
+                                     thread_name_prefix='dashboard-query')
 
 
 # Dashboard
-@login_required(login_url='user-login')
-def dashboard(request):
-    
-    user_name = request.user.username
-    items = Item.objects.order_by('-added')
-    products = Product.objects.order_by('-added')
-    productions = Production.objects.order_by('-added')
-    
-    context = {
-        'user_name': user_name,
-        'items': items,
-        'products': products,
-        'productions': productions
+def _run_query(function, *args):
+    """Run a blocking query for the async dashboard.
+
+    With DASHBOARD_PARALLEL_QUERIES each call runs on one of the
+    DASHBOARD_QUERY_THREADS threads of the process, each with its own
+    persistent database connection, letting independent queries overlap.
+    Otherwise they run one after another on the request thread, as Django's
+    async ORM does.
+    """
+
+    if not getattr(settings, 'DASHBOARD_PARALLEL_QUERIES', True):
+        return sync_to_async(function)(*args)
+
+    def query():
+        # Worker threads keep their connection between requests, so apply
+        # CONN_MAX_AGE and health checks as request_started does
+        close_old_connections()
+        return function(*args)
+
+    # Carry the request context, e.g. use_replica, over to the thread
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(_query_executor, context.run, query)
+
+
+# Dashboard lists: the models they display and their cursor parameter
+DASHBOARD_LISTS = {
+    'items': (('item',), 'items_after'),
+    'products': (('product', 'component', 'item'), 'products_after'),
+    'productions': (('production',), 'productions_after'),
+}
+
+
+def _dashboard_querysets():
+    return {
+        'items': Item.objects.all(),
+        'products': Product.objects.prefetch_related(
+            Prefetch('component_set', queryset=Component.objects.select_related('item'))),
+        'productions': Production.objects.all(),
+    }
+
+
+def _render_dashboard(request, context, keys, fragments, pages):
+    """Render the missing list fragments, cache them and render the page."""
+
+    rendered = {name: render_to_string(f'production/dashboard/{name}.html', {name: page}, request)
+                for name, page in pages.items()}
+    cache.set_many({keys[name]: html for name, html in rendered.items()}, DASHBOARD_FRAGMENT_TIMEOUT)
+    fragments = {name: mark_safe(html) for name, html in {**fragments, **rendered}.items()}
+    return render(request, 'production/dashboard.html', context={**context, 'fragments': fragments})
+
+
+@use_replica()
+async def dashboard(request):
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path(), resolve_url('user-login'))
+
+    # Each list is cached as a fragment keyed on the versions of the models it
+    # displays, which also identify the whole page for conditional requests.
+    # KPIs are only read from the cache, a stale value queueing a refresh
+    versions, kpis = await asyncio.gather(
+        aget_versions({name for models, _ in DASHBOARD_LISTS.values() for name in models}),
+        aget_kpis())
+    keys = {
+        name: fragment_key(f'dashboard:{name}', [versions[model][0] for model in models],
+                           request.GET.get(cursor), DASHBOARD_PAGE_SIZE)
+        for name, (models, cursor) in DASHBOARD_LISTS.items()
     }
-    
-    return render(request, 'production/dashboard.html', context=context)
+    kpis_computed = kpis['computed'].timestamp() if kpis else 0
+    page_etag = etag(user.pk, user.username, kpis_computed, *keys.values())
+    last_modified = max(kpis_computed, *(changed for _, changed in versions.values()))
+    response = get_conditional_response(request, etag=page_etag, last_modified=int(last_modified))
+    if response is None:
+        cached = await cache.aget_many(list(keys.values()))
+        fragments = {name: cached[key] for name, key in keys.items() if key in cached}
+        missing = [name for name in DASHBOARD_LISTS if name not in fragments]
+        querysets = _dashboard_querysets()
+        pages = await asyncio.gather(*(
+            _run_query(keyset_paginate, querysets[name],
+                       request.GET.get(DASHBOARD_LISTS[name][1]), DASHBOARD_PAGE_SIZE)
+            for name in missing))
+
+        context = {'user_name': user.username, 'kpis': kpis, **dict(zip(missing, pages))}
+        response = await sync_to_async(_render_dashboard)(
+            request, context, keys, fragments, dict(zip(missing, pages)))
+
+    response['ETag'] = page_etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Let browsers keep the page but revalidate it on every visit
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# Exports
+def export_view(dataset):
+    """Build a view streaming a dataset export.
+
+    The view accepts `format` ('csv' or 'jsonl'), `since` and `until` (ISO dates)
+    and `gzip` query parameters.
+
+    Args:
+        dataset (str): 'productions' or 'inventory'.
+
+    Returns:
+        function: The view.
+    """
+
+    @login_required(login_url='user-login')
+    @use_replica()
+    def view(request):
+
+        file_format = request.GET.get('format', 'csv')
+        if file_format not in CONTENT_TYPES:
+            return HttpResponseBadRequest(f'Unsupported format: {file_format}')
+        try:
+            since = parse_bound(request.GET.get('since'))
+            until = parse_bound(request.GET.get('until'))
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
+        gzip = request.GET.get('gzip') in ('1', 'true')
+
+        filename = f'{dataset}.{file_format}'
+        content_type = CONTENT_TYPES[file_format]
+        if gzip:
+            filename += '.gz'
+            content_type = 'application/gzip'
+
+        response = StreamingHttpResponse(
+            export_stream(dataset, file_format, since, until, gzip),
+            content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    return view
+
+
+export_productions = export_view('productions')
+export_inventory = export_view('inventory')
+
+
+# Material requirements planning
+@login_required(login_url='user-login')
+@require_POST
+def mrp(request):
+    """Explode a planned run into item requirements and shortfalls.
+
+    Expects a JSON body like `{"plan": {"<product slug>": <units>, ...}}`. Pass
+    `"shortfalls_only": true` to leave out the items with enough stock.
+    """
+
+    try:
+        body = json.loads(request.body)
+        plan = {slug: int(units) for slug, units in body['plan'].items()}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return HttpResponseBadRequest('Expected {"plan": {"<product slug>": <units>}}')
+    if any(units <= 0 for units in plan.values()):
+        return HttpResponseBadRequest('Planned units must be positive')
+
+    product_ids = {slug: product.pk for slug, product in get_cached_many('product', plan).items()}
+    unknown = sorted(set(plan) - set(product_ids))
+    if unknown:
+        return HttpResponseBadRequest(f'Unknown products: {", ".join(unknown)}')
+
+    lines = plan_requirements({product_ids[slug]: units for slug, units in plan.items()})
+    if body.get('shortfalls_only'):
+        lines = [line for line in lines if line['shortfall']]
+
+    return JsonResponse({'lines': lines})
+
+
+# Price impact
+@login_required(login_url='user-login')
+@require_POST
+def price_impact_view(request):
+    """Report the products and open productions whose cost moves with new item prices.
+
+    Expects a JSON body like `{"prices": {"<item slug>": "<price>", ...}}`.
+    Prices are not saved.
+    """
+
+    try:
+        body = json.loads(request.body)
+        prices = {slug: Decimal(str(price)) for slug, price in body['prices'].items()}
+    except (ValueError, KeyError, TypeError, AttributeError, InvalidOperation):
+        return HttpResponseBadRequest('Expected {"prices": {"<item slug>": "<price>"}}')
+    if any(not price.is_finite() or price < 0 for price in prices.values()):
+        return HttpResponseBadRequest('Prices must be non-negative numbers')
+
+    prices, unknown = resolve_prices(prices)
+    if unknown:
+        return HttpResponseBadRequest(f'Unknown items: {", ".join(unknown)}')
+
+    return JsonResponse(price_impact(prices))
+
+
+# Stock
+@login_required(login_url='user-login')
+@use_replica()
+def stock_view(request):
+    """Report the stock of items as of a moment, from the snapshots and the stock ledger.
+
+    Accepts `as_of` (an ISO date or datetime, now by default; dates mean
+    midnight) and `items` (comma separated item slugs, every item by default)
+    query parameters.
+    """
+
+    try:
+        as_of = parse_bound(request.GET.get('as_of')) or timezone.now()
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+
+    items = Item.objects.all()
+    if request.GET.get('items'):
+        items = items.filter(slug__in=request.GET['items'].split(','))
+    rows = stock_queryset(as_of, items).values_list('slug', 'stock').order_by('slug')
+    return JsonResponse({
+        'as_of': as_of,
+        'stock': {slug: Decimal(stock).quantize(STOCK_PLACES) for slug, stock in rows},
+    })
+
+
+# Reports
+@login_required(login_url='user-login')
+@use_replica()
+def production_report_view(request):
+    """Report the units produced per product, category or in total, per period.
+
+    Accepts `period` ('day', 'week', 'month' or 'year'), `group` ('product',
+    'category' or 'total') and `since` and `until` (ISO dates, inclusive) query
+    parameters. Only the daily rollup rows are read.
+    """
+
+    period = request.GET.get('period', 'month')
+    group_by = request.GET.get('group', 'product')
+    if period not in PERIODS:
+        return HttpResponseBadRequest(f'Unsupported period: {period}')
+    if group_by not in GROUPS:
+        return HttpResponseBadRequest(f'Unsupported group: {group_by}')
+    try:
+        since = parse_bound(request.GET.get('since'))
+        until = parse_bound(request.GET.get('until'))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+
+    rows = production_report(
+        period, group_by,
+        since=timezone.localdate(since) if since else None,
+        until=timezone.localdate(until) if until else None)
+    return JsonResponse({'period': period, 'group': group_by, 'rows': rows})
+
+
+# Search
+SEARCH_LIMIT = 50
+
+
+@login_required(login_url='user-login')
+@use_replica()
+def catalog_search(request):
+    """Search items, products and categories, best matches first.
+
+    Accepts `q` (each word is matched as a prefix, for typeahead), `kind`
+    (comma separated 'item', 'product' or 'category') and `limit` query
+    parameters.
+    """
+
+    kinds = request.GET.get('kind')
+    try:
+        limit = min(int(request.GET.get('limit', 10)), SEARCH_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest('limit must be an integer')
+    if limit < 1:
+        return HttpResponseBadRequest('limit must be positive')
+
+    results = search(request.GET.get('q', ''), kinds.split(',') if kinds else None, limit)
+    return JsonResponse({'results': [
+        {'kind': document.kind, 'slug': document.slug, 'name': document.name}
+        for document in results
+    ]})
+
+
+# Catalog cache
+@staff_member_required
+def catalog_cache_stats(request):
+    """Report the catalog cache hit and miss counters of the serving process."""
+
+    return JsonResponse(cache_stats())
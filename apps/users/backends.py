@@ -0,0 +1,33 @@
+"""Users app authentication backends"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+USER_CACHE_TIMEOUT = getattr(settings, 'USER_CACHE_TIMEOUT', 60)
+
+
+def user_cache_key(user_id):
+    """Return the cache key of an authenticated user."""
+    return f'auth:user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend reading the user of authenticated requests from the cache.
+
+    `AuthenticationMiddleware` loads the user of the session on every request;
+    the row is cached for USER_CACHE_TIMEOUT seconds and dropped when the user
+    is saved or deleted (see `signals.py`). Other processes only see the change
+    once it expires unless the default cache is shared, so keep the timeout
+    short.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, USER_CACHE_TIMEOUT)
+            return user
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,38 @@
+"""Benchmark the password hasher profiles"""
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import import_string
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Time hashing and verifying a password with the preferred hasher of each '
+            'PASSWORD_HASHER_PROFILES entry. A login verifies one hash, so the verify time '
+            'bounds the logins per second of one CPU core.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeats', type=int, default=5)
+
+    def handle(self, *args, **options):
+        for profile, hashers in settings.PASSWORD_HASHER_PROFILES.items():
+            hasher = import_string(hashers[0])()
+            try:
+                encoded = hasher.encode('correct horse battery staple', hasher.salt())
+            except ValueError as error:
+                # Hashers backed by an optional library raise when it is missing
+                self.stdout.write(self.style.WARNING(f'{profile}: unavailable ({error})'))
+                continue
+
+            timings = []
+            for _ in range(options['repeats']):
+                began = time.perf_counter()
+                hasher.verify('correct horse battery staple', encoded)
+                timings.append(time.perf_counter() - began)
+            verify = statistics.median(timings)
+
+            current = ' (current)' if profile == settings.PASSWORD_HASHER_PROFILE else ''
+            self.stdout.write(
+                f'{profile}{current}: {hasher.algorithm}, {verify * 1000:.1f}ms per verification, '
+                f'{1 / verify:.1f} logins/s per core')
@@ -0,0 +1,14 @@
+"""Users app signals"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import user_cache_key
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def drop_cached_user(sender, instance, **kwargs):
+    """Drop the cached copy of a saved or deleted user, e.g. after a password change."""
+    cache.delete(user_cache_key(instance.pk))
@@ -1,3 +1,77 @@
+import io
+from unittest import mock
+
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+
+from .backends import user_cache_key
+
+
+class LoginTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('worker', password='secret-pass')
+
+    def test_login_verifies_the_password_once(self):
+        with mock.patch('django.contrib.auth.base_user.check_password', wraps=check_password) as checked:
+            response = self.client.post(
+                reverse('user-login'), {'username': 'worker', 'password': 'secret-pass'})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(checked.call_count, 1)
+
+    def test_wrong_password_is_rejected(self):
+        response = self.client.post(
+            reverse('user-login'), {'username': 'worker', 'password': 'wrong-pass'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_new_passwords_use_the_first_hasher_of_the_profile(self):
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+
+
+class CachedUserTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('worker', password='secret-pass')
+        self.client.force_login(self.user)
+
+    def test_authenticated_requests_read_the_user_from_the_cache(self):
+        self.client.get(reverse('dashboard'))
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_saved_users_are_dropped_from_the_cache(self):
+        self.client.get(reverse('dashboard'))
+        self.user.set_password('new-pass')
+        self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        # The session hash no longer matches: the user is logged out
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_inactive_cached_users_are_rejected(self):
+        self.client.get(reverse('dashboard'))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        cached = cache.get(user_cache_key(self.user.pk))
+        cached.is_active = False
+        cache.set(user_cache_key(self.user.pk), cached)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 302)
+
+
+class BenchPasswordHashersTests(TestCase):
 
-# Create your tests here.
+    def test_reports_each_available_profile(self):
+        stdout = io.StringIO()
+        call_command('bench_password_hashers', repeats=1, stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn('scrypt (current): scrypt', output)
+        self.assertIn('pbkdf2: pbkdf2_sha256', output)
@@ -2,7 +2,6 @@
 from django.shortcuts import render, redirect
 
 from django.contrib.auth.models import auth
-from django.contrib.auth import authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 
@@ -46,18 +45,13 @@ def user_login(request):
         
         form = LoginForm(request, data=request.POST)
         
+        # The form already authenticated the user; authenticating again
+        # would hash the password a second time
         if form.is_valid():
             
-            username = request.POST.get('username')
-            password = request.POST.get('password')
-    
-            user = authenticate(request, username=username, password=password)
+            auth.login(request, form.get_user())
             
-            if user is not None:
-                
-                auth.login(request, user)
-                
-                return redirect('dashboard')
+            return redirect('dashboard')
                 
     context = {'form': form}
     
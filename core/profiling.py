@@ -0,0 +1,331 @@
+"""Request profiling
+
+`ProfilingMiddleware`, enabled with the PROFILING setting, measures for every
+request:
+
+- the number and total time of SQL queries, on every connection used by the
+  request, including the worker threads of async views;
+- the time spent rendering templates;
+- duplicate queries, i.e. the same SQL run more than once, as happens when a
+  template walks a relation per row (`product.component_set.all`) without a
+  prefetch.
+
+Measurements are aggregated per view into histograms, served in the Prometheus
+text format by the `metrics` view, and added to each response as a
+`Server-Timing` header. Requests slower than PROFILING_SLOW_REQUEST_MS are
+logged with their duplicate and slowest queries to the `core.profiling.slow`
+logger, which the settings send to a rotating file when PROFILING_SLOW_LOG is
+set.
+
+Metrics are kept per process: each gunicorn worker is scraped separately.
+Metrics endpoints answer staff users, and scrapers sending the METRICS_TOKEN
+setting as a bearer token.
+"""
+import bisect
+import contextlib
+import contextvars
+import functools
+import hmac
+import json
+import logging
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.template.base import Template
+
+
+slow_logger = logging.getLogger('core.profiling.slow')
+
+_profile = contextvars.ContextVar('request_profile', default=None)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Traces of slow requests list this many duplicate and slowest queries
+TRACE_QUERIES = 5
+
+
+class RequestProfile:
+    """
+    The measurements of a request, shared by every thread working on it.
+
+    Attributes:
+    - queries: list, `(sql, seconds)` pairs in execution order.
+    - sql_time: float, total seconds spent executing SQL.
+    - template_time: float, total seconds spent rendering templates.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self._rendering = threading.local()
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, seconds):
+        with self._lock:
+            self.queries.append((sql, seconds))
+            self.sql_time += seconds
+
+    def duplicates(self):
+        """Return the SQL statements run more than once with how many times they ran."""
+        counts = Counter(sql for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+    def duplicate_count(self):
+        """Return the number of queries that repeated an earlier one."""
+        return sum(count - 1 for count in self.duplicates().values())
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing the queries of the profiled request, if any."""
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - began)
+
+
+def instrument_connection(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+_original_render = Template.render
+
+
+def _profiled_render(self, context):
+    profile = _profile.get()
+    # Included templates render inside their parent, only time the outermost one
+    if profile is None or getattr(profile._rendering, 'active', False):
+        return _original_render(self, context)
+    profile._rendering.active = True
+    began = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        profile._rendering.active = False
+        with profile._lock:
+            profile.template_time += time.perf_counter() - began
+
+
+def install():
+    """Instrument database connections and template rendering. Safe to call repeatedly."""
+    connection_created.connect(instrument_connection, dispatch_uid='core.profiling')
+    for connection in connections.all(initialized_only=True):
+        instrument_connection(connection)
+    Template.render = _profiled_render
+
+
+@contextlib.contextmanager
+def profiled():
+    """Profile the code run inside the block, as the middleware profiles a request.
+
+    Yields:
+        RequestProfile: The measurements, complete once the block exits.
+    """
+
+    install()
+    profile = RequestProfile()
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+class Histogram:
+    """A Prometheus histogram with cumulative buckets."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        """Yield `(le, cumulative count)` pairs, ending with '+Inf'."""
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+METRICS = (
+    # name, help, buckets, value read from (duration, profile)
+    ('request_duration_seconds', 'Time to produce the response.', DURATION_BUCKETS,
+     lambda duration, profile: duration),
+    ('sql_queries', 'SQL queries run per request.', QUERY_BUCKETS,
+     lambda duration, profile: len(profile.queries)),
+    ('sql_duration_seconds', 'Time spent in SQL queries per request.', DURATION_BUCKETS,
+     lambda duration, profile: profile.sql_time),
+    ('template_render_seconds', 'Time spent rendering templates per request.', DURATION_BUCKETS,
+     lambda duration, profile: profile.template_time),
+)
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    """Per-view request metrics of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.duplicates = Counter()
+
+    def observe(self, view, duration, profile):
+        with self._lock:
+            for name, _, buckets, value in METRICS:
+                histogram = self.histograms.get((name, view))
+                if histogram is None:
+                    histogram = self.histograms[name, view] = Histogram(buckets)
+                histogram.observe(value(duration, profile))
+            self.duplicates[view] += profile.duplicate_count()
+
+    def render(self, prefix='erp'):
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, description, _, _ in METRICS:
+                lines += [f'# HELP {prefix}_{name} {description}',
+                          f'# TYPE {prefix}_{name} histogram']
+                for (metric, view), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    label = f'view="{escape_label(view)}"'
+                    for bound, count in histogram.samples():
+                        lines.append(f'{prefix}_{name}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f'{prefix}_{name}_sum{{{label}}} {histogram.sum}')
+                    lines.append(f'{prefix}_{name}_count{{{label}}} {sum(histogram.counts)}')
+            lines += [f'# HELP {prefix}_duplicate_queries_total Queries repeating an earlier one '
+                      f'of the same request.',
+                      f'# TYPE {prefix}_duplicate_queries_total counter']
+            for view, count in sorted(self.duplicates.items()):
+                lines.append(f'{prefix}_duplicate_queries_total{{view="{escape_label(view)}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class ProfilingMiddleware:
+    """Profile every request when the PROFILING setting is True.
+
+    Place it first in MIDDLEWARE so the queries of the other middleware
+    (sessions, authentication) are counted too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_seconds = getattr(settings, 'PROFILING_SLOW_REQUEST_MS', 500) / 1000
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        install()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile, token, began = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self.finish(request, response, profile, began)
+
+    async def __acall__(self, request):
+        profile, token, began = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self.finish(request, response, profile, began)
+
+    def start(self):
+        profile = RequestProfile()
+        return profile, _profile.set(profile), time.perf_counter()
+
+    def finish(self, request, response, profile, began):
+        duration = time.perf_counter() - began
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        if view in ('metrics', 'job-metrics'):
+            return response
+
+        registry.observe(view, duration, profile)
+        response['Server-Timing'] = (
+            f'sql;dur={profile.sql_time * 1000:.1f};desc="{len(profile.queries)} queries", '
+            f'template;dur={profile.template_time * 1000:.1f}, '
+            f'total;dur={duration * 1000:.1f}')
+        if duration >= self.slow_seconds:
+            slow_logger.warning(json.dumps(self.trace(request, response, view, duration, profile)))
+        return response
+
+    def trace(self, request, response, view, duration, profile):
+        """Describe a slow request for the slow request log."""
+        duplicates = sorted(profile.duplicates().items(), key=lambda entry: -entry[1])
+        slowest = sorted(profile.queries, key=lambda query: -query[1])
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'sql_queries': len(profile.queries),
+            'sql_ms': round(profile.sql_time * 1000, 1),
+            'template_ms': round(profile.template_time * 1000, 1),
+            'duplicate_queries': [{'sql': sql, 'count': count}
+                                  for sql, count in duplicates[:TRACE_QUERIES]],
+            'slowest_queries': [{'sql': sql, 'ms': round(seconds * 1000, 2)}
+                                for sql, seconds in slowest[:TRACE_QUERIES]],
+        }
+
+
+def metrics_view(view):
+    """Restrict a metrics view to staff users and to scrapers presenting METRICS_TOKEN.
+
+    Scrapers send `Authorization: Bearer <METRICS_TOKEN>`. Client addresses are
+    not trusted: behind a reverse proxy every client has the proxy's address.
+    Other clients get a 404.
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        scraper = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+        if not scraper and not request.user.is_staff:
+            raise Http404
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+@metrics_view
+def metrics(request):
+    """Serve the request metrics of this process in the Prometheus text format."""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,73 @@
+"""Database routers"""
+import contextvars
+import functools
+import inspect
+
+from django.db import connections
+
+
+REPLICA = 'replica'
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    """Returns whether a read replica database is configured."""
+    return REPLICA in connections.databases
+
+
+class use_replica:
+    """
+    Send the reads made inside the block, or the decorated view, to the replica.
+
+    Only reads that can tolerate replication lag (dashboards, reports,
+    exports) should be wrapped. Writes always go to the default database.
+    """
+
+    def __enter__(self):
+        self._token = _use_replica.set(True)
+        return self
+
+    def __exit__(self, *exc_info):
+        _use_replica.reset(self._token)
+
+    def __call__(self, view):
+        # The decorator instance is shared by concurrent requests, so each call
+        # keeps its own token instead of storing it on the instance
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                token = _use_replica.set(True)
+                try:
+                    return await view(*args, **kwargs)
+                finally:
+                    _use_replica.reset(token)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            token = _use_replica.set(True)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return wrapper
+
+
+class ReplicaRouter:
+    """Routes reads marked with `use_replica` to the replica database."""
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and replica_configured():
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the default database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,134 @@
+"""Thumbnail derivatives
+
+Uploaded images are resized into a few smaller derivatives stored next to the
+original, e.g. `item/flour/photo.png` gets `item/flour/photo__small.webp`.
+Derivatives are generated off the request path by the background job workers
+(`apps.jobs`) once the upload is committed, and `generate_thumbnails`
+backfills existing media. The sizes generated are then recorded on the rows
+holding the image (`thumbnail_sizes`), so URLs are built without asking the
+storage whether a derivative exists.
+"""
+import io
+import logging
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# Longest side, in pixels, of each derivative
+THUMBNAIL_SIZES = getattr(settings, 'THUMBNAIL_SIZES', {
+    'small': 96,
+    'medium': 320,
+    'large': 960,
+})
+
+THUMBNAIL_FORMAT = getattr(settings, 'THUMBNAIL_FORMAT', 'WEBP')
+
+THUMBNAIL_QUALITY = getattr(settings, 'THUMBNAIL_QUALITY', 80)
+
+THUMBNAIL_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def derivative_name(name, size):
+    """Return the storage name of a derivative.
+
+    Args:
+        name (str): The storage name of the original image.
+        size (str): The derivative size, a key of THUMBNAIL_SIZES.
+
+    Returns:
+        str: The storage name of the derivative.
+    """
+
+    root, _ = posixpath.splitext(name)
+    return f'{root}__{size}.{THUMBNAIL_EXTENSIONS[THUMBNAIL_FORMAT]}'
+
+
+def thumbnail_url(field, size=None, sizes=()):
+    """Return the URL of an image or one of its derivatives.
+
+    Falls back to the original until the derivative has been generated.
+
+    Args:
+        field: The ImageFieldFile of the model.
+        size (str): The derivative size, or None for the original.
+        sizes (iterable): The derivative sizes generated for the image.
+
+    Returns:
+        str: The URL, or an empty string if there is no image.
+    """
+
+    if not field:
+        return ''
+    if size is None:
+        return field.url
+    if size not in THUMBNAIL_SIZES:
+        raise ValueError(f'Unknown thumbnail size: {size}')
+    if size in sizes:
+        return field.storage.url(derivative_name(field.name, size))
+    return field.url
+
+
+def generate_derivatives(name, overwrite=False):
+    """Create the missing derivatives of an image.
+
+    Args:
+        name (str): The storage name of the original image.
+        overwrite (bool): Regenerate derivatives that already exist.
+
+    Returns:
+        list: The storage names of the derivatives written.
+    """
+
+    pending = {size: derivative_name(name, size) for size in THUMBNAIL_SIZES}
+    if not overwrite:
+        pending = {size: target for size, target in pending.items()
+                   if not default_storage.exists(target)}
+    if not pending:
+        return []
+
+    with default_storage.open(name, 'rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+    if THUMBNAIL_FORMAT == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB' if THUMBNAIL_FORMAT == 'JPEG' else 'RGBA')
+
+    written = []
+    # Resize from the largest down so each step works on a smaller image
+    for size, target in sorted(pending.items(), key=lambda entry: -THUMBNAIL_SIZES[entry[0]]):
+        image.thumbnail((THUMBNAIL_SIZES[size], THUMBNAIL_SIZES[size]), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        written.append(default_storage.save(target, ContentFile(buffer.getvalue())))
+    return written
+
+
+def _generate_safely(name, then):
+    try:
+        generate_derivatives(name)
+        if then is not None:
+            then([name])
+    except Exception:
+        logger.exception('Could not generate the thumbnails of %s', name)
+
+
+def schedule_derivatives(name, then=None):
+    """Generate the derivatives of an image in this process once the transaction commits.
+
+    Used when the THUMBNAIL_BACKGROUND setting is False; otherwise the models
+    queue a job for the background workers instead.
+
+    Args:
+        name (str): The storage name of the original image.
+        then (callable): Called with the list of names generated, e.g. to record their sizes.
+    """
+
+    transaction.on_commit(lambda: _generate_safely(name, then))
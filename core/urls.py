@@ -2,8 +2,14 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from apps.jobs.views import metrics as job_metrics
+from core.profiling import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('apps.production.urls')),
     path('auth/', include('apps.users.urls')),
+    path('api/v1/', include('apps.api.urls')),
+    path('internal/metrics', metrics, name='metrics'),
+    path('internal/jobs/metrics', job_metrics, name='job-metrics'),
 ]
@@ -0,0 +1,20 @@
+"""Gunicorn configuration
+
+Each worker thread keeps its own persistent database connection (see
+CONN_MAX_AGE in core/settings.py), and so does each of the
+DASHBOARD_QUERY_THREADS dashboard query threads of a worker, so the number of
+open connections is workers * (threads + DASHBOARD_QUERY_THREADS). Size the
+database pool or PgBouncer accordingly.
+"""
+import multiprocessing
+import os
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+wsgi_app = 'core.wsgi:application'